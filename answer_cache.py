@@ -0,0 +1,201 @@
+"""
+SQLite-backed answer cache in front of the chat model, with exact and near hits
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_SIMILARITY = 0.92
+
+# Scope for answers that only cite the shared reference library
+SHARED_SCOPE = ""
+
+ANAPHORA = re.compile(r"\b(it|its|that|this|those|these|them|they|he|she|above|previous)\b")
+
+
+def init_answer_cache(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            cache_key TEXT PRIMARY KEY,
+            scope TEXT NOT NULL,
+            params_hash TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            embedding BLOB,
+            created_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Which documents each answer was grounded on, for invalidation
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache_documents (
+            document_id TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            PRIMARY KEY (document_id, cache_key)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            hits INTEGER NOT NULL,
+            near_hits INTEGER NOT NULL,
+            misses INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_scope ON answer_cache(scope, params_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_last_hit ON answer_cache(last_hit_at)")
+    cursor.execute("INSERT OR IGNORE INTO answer_cache_stats (id, hits, near_hits, misses) VALUES (0, 0, 0, 0)")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^\w\s.%$]", " ", question.lower()).split()).strip(" .")
+
+
+def is_standalone_question(question: str, history: List[Dict]) -> bool:
+    """Follow-ups that lean on earlier turns ("what about that?") must not be cached"""
+    has_earlier_question = any(message.get("role") == "user" for message in history)
+    return not (has_earlier_question and ANAPHORA.search(question.lower()))
+
+
+def answer_scope(relevant_content: Sequence[Dict]) -> str:
+    """Answers citing a user's own upload are only reused inside that session"""
+    for content in relevant_content:
+        if content.get('is_user_upload'):
+            return content.get('session_id') or SHARED_SCOPE
+    return SHARED_SCOPE
+
+
+def params_fingerprint(model_params: Dict) -> str:
+    return hashlib.sha256(json.dumps(model_params, sort_keys=True).encode()).hexdigest()
+
+
+def make_cache_key(question: str, chunk_ids: Sequence[str], model_params: Dict) -> str:
+    payload = json.dumps([normalize_question(question), sorted(chunk_ids), params_fingerprint(model_params)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _record(cursor: sqlite3.Cursor, column: str):
+    cursor.execute(f"UPDATE answer_cache_stats SET {column} = {column} + 1 WHERE id = 0")
+
+
+def lookup_answer(cursor: sqlite3.Cursor, question: str, relevant_content: Sequence[Dict], model_params: Dict,
+                  question_embedding: Optional[np.ndarray] = None, similarity: float = DEFAULT_SIMILARITY,
+                  ttl_seconds: float = DEFAULT_TTL_SECONDS) -> Optional[str]:
+    """Return a cached answer for an exact or near-identical question, else None"""
+    now = time.time()
+    cache_key = make_cache_key(question, [c['chunk_id'] for c in relevant_content], model_params)
+    cursor.execute('''
+        SELECT answer FROM answer_cache WHERE cache_key = ? AND created_at > ?
+    ''', (cache_key, now - ttl_seconds))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute('''
+            UPDATE answer_cache SET last_hit_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?
+        ''', (now, cache_key))
+        _record(cursor, "hits")
+        return row[0]
+
+    if question_embedding is not None and similarity > 0:
+        cursor.execute('''
+            SELECT cache_key, answer, embedding FROM answer_cache
+            WHERE scope = ? AND params_hash = ? AND created_at > ? AND embedding IS NOT NULL
+        ''', (answer_scope(relevant_content), params_fingerprint(model_params), now - ttl_seconds))
+        # Ignore vectors written by a different embedding model
+        query_vector = question_embedding.astype(np.float32)
+        rows = [row for row in cursor.fetchall() if len(row[2]) == query_vector.nbytes]
+        if rows:
+            matrix = np.vstack([np.frombuffer(embedding, dtype=np.float32) for _, _, embedding in rows])
+            scores = matrix @ query_vector
+            best = int(np.argmax(scores))
+            if scores[best] >= similarity:
+                cursor.execute('''
+                    UPDATE answer_cache SET last_hit_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?
+                ''', (now, rows[best][0]))
+                _record(cursor, "near_hits")
+                return rows[best][1]
+
+    _record(cursor, "misses")
+    return None
+
+
+def store_answer(cursor: sqlite3.Cursor, question: str, relevant_content: Sequence[Dict], model_params: Dict, answer: str,
+                 question_embedding: Optional[np.ndarray] = None, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+    """Cache an answer and trim expired and least recently used entries"""
+    now = time.time()
+    cache_key = make_cache_key(question, [c['chunk_id'] for c in relevant_content], model_params)
+    embedding = question_embedding.astype(np.float32).tobytes() if question_embedding is not None else None
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO answer_cache
+        (cache_key, scope, params_hash, question, answer, embedding, created_at, last_hit_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (cache_key, answer_scope(relevant_content), params_fingerprint(model_params),
+          normalize_question(question), answer, embedding, now, now))
+    cursor.executemany('''
+        INSERT OR IGNORE INTO answer_cache_documents (document_id, cache_key) VALUES (?, ?)
+    ''', [(document_id, cache_key) for document_id in {c['document_id'] for c in relevant_content}])
+
+    cursor.execute("DELETE FROM answer_cache WHERE created_at <= ?", (now - ttl_seconds,))
+    cursor.execute('''
+        DELETE FROM answer_cache WHERE cache_key IN (
+            SELECT cache_key FROM answer_cache ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?
+        )
+    ''', (max_entries,))
+    cursor.execute('''
+        DELETE FROM answer_cache_documents
+        WHERE cache_key NOT IN (SELECT cache_key FROM answer_cache)
+    ''')
+
+
+def invalidate_documents(cursor: sqlite3.Cursor, document_ids: Sequence[str]):
+    """Drop every cached answer grounded on any of these documents"""
+    for document_id in document_ids:
+        cursor.execute('''
+            DELETE FROM answer_cache WHERE cache_key IN (
+                SELECT cache_key FROM answer_cache_documents WHERE document_id = ?
+            )
+        ''', (document_id,))
+        cursor.execute("DELETE FROM answer_cache_documents WHERE document_id = ?", (document_id,))
+
+
+def invalidate_scope(cursor: sqlite3.Cursor, scope: str):
+    """Drop the answers reused as near hits within a scope, which predate a document just added to it"""
+    cursor.execute("DELETE FROM answer_cache WHERE scope = ?", (scope,))
+    cursor.execute('''
+        DELETE FROM answer_cache_documents
+        WHERE cache_key NOT IN (SELECT cache_key FROM answer_cache)
+    ''')
+
+
+def clear_answer_cache(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM answer_cache")
+    cursor.execute("DELETE FROM answer_cache_documents")
+
+
+def answer_cache_stats(cursor: sqlite3.Cursor) -> Dict[str, float]:
+    """Hit, near-hit and miss counters plus the overall hit rate"""
+    cursor.execute("SELECT hits, near_hits, misses FROM answer_cache_stats WHERE id = 0")
+    hits, near_hits, misses = cursor.fetchone() or (0, 0, 0)
+    cursor.execute("SELECT COUNT(*) FROM answer_cache")
+    entries = cursor.fetchone()[0]
+    lookups = hits + near_hits + misses
+    return {
+        'hits': hits,
+        'near_hits': near_hits,
+        'misses': misses,
+        'entries': entries,
+        'hit_rate': (hits + near_hits) / lookups if lookups else 0.0,
+    }
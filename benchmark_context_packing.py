@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark context packing on the bundled reference guides.
+
+Loads documents/ into a scratch database, retrieves chunks for a set of
+questions and compares the prompt context the app used to send (the top
+three chunks verbatim) with the packed context. Each question lists facts
+the answer needs; a fact counts as kept when it still appears in the context:
+    python benchmark_context_packing.py --budget 800
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from context_packing import pack_context, context_tokens, DEFAULT_CONTEXT_TOKENS, DEFAULT_CONTEXT_CANDIDATES
+from load_reference_documents import load_documents
+from retrieval_pipeline import retrieve, bm25_candidates
+from storage import connect
+
+# (question, facts that should survive in the context)
+QUESTIONS = [
+    ("What credit score counts as bad credit?", ["below 580"]),
+    ("What down payment does an FHA loan need?", ["3.5%", "580+"]),
+    ("What interest rate is considered predatory?", ["36%"]),
+    ("Which fees are a warning sign on a bad credit loan?", ["5%"]),
+    ("How is an SBA 504 loan structured?", ["SBA provides 40%"]),
+    ("What payment does income-based repayment require?", ["10-15% of discretionary income"]),
+    ("What debt-to-income ratio do lenders want for a personal loan?", ["40%"]),
+    ("What APR can I expect with a poor credit score?", ["19-36%"]),
+    ("How much of my credit score is credit utilization?", ["30%"]),
+    ("How does a HELOC work?", ["HELOC"]),
+    ("Does a hard inquiry affect my credit score?", ["Hard Inquiry"]),
+    ("What is the formula for simple interest?", ["Principal × Rate × Time"]),
+]
+
+
+def fact_recall(passages, facts) -> int:
+    text = "\n".join(passage['text'] for passage in passages).lower()
+    return sum(1 for fact in facts if fact.lower() in text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dir", default="documents", help="directory of .txt guides")
+    parser.add_argument("--budget", type=int, default=DEFAULT_CONTEXT_TOKENS, help="context token budget")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CONTEXT_CANDIDATES, help="chunks retrieved for packing")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(scratch, "benchmark.db")
+        load_documents(args.dir, db_path, workers=1)
+        conn = connect(db_path)
+        cursor = conn.cursor()
+
+        totals = {"baseline": 0, "unpacked": 0, "packed": 0}
+        recall = {"baseline": 0, "packed": 0}
+        facts_total = 0
+        packing_ms = 0.0
+        print(f"{'question':<62} {'top-3':>6} {'top-' + str(args.candidates):>6} {'packed':>7}  facts")
+        for question, facts in QUESTIONS:
+            results = retrieve(cursor, question, None, args.candidates, [bm25_candidates])
+            baseline = results[:3]
+            started = time.perf_counter()
+            packed = pack_context(question, results, args.budget)
+            packing_ms += (time.perf_counter() - started) * 1000
+
+            tokens = {"baseline": context_tokens(baseline), "unpacked": context_tokens(results),
+                      "packed": context_tokens(packed)}
+            for key, value in tokens.items():
+                totals[key] += value
+            kept = {"baseline": fact_recall(baseline, facts), "packed": fact_recall(packed, facts)}
+            for key, value in kept.items():
+                recall[key] += value
+            facts_total += len(facts)
+            print(f"{question[:62]:<62} {tokens['baseline']:>6} {tokens['unpacked']:>6} {tokens['packed']:>7}  "
+                  f"{kept['baseline']}/{len(facts)} -> {kept['packed']}/{len(facts)}")
+        conn.close()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    count = len(QUESTIONS)
+    print(f"\ncontext tokens per question: top-3 verbatim {totals['baseline'] / count:.0f}, "
+          f"top-{args.candidates} verbatim {totals['unpacked'] / count:.0f}, packed {totals['packed'] / count:.0f}")
+    print(f"reduction against top-3 verbatim: {1 - totals['packed'] / max(totals['baseline'], 1):.0%}; "
+          f"against top-{args.candidates} verbatim: {1 - totals['packed'] / max(totals['unpacked'], 1):.0%}")
+    print(f"facts kept: top-3 verbatim {recall['baseline']}/{facts_total}, packed {recall['packed']}/{facts_total}")
+    print(f"packing time: {packing_ms / count:.2f} ms per question")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local intent router against a labeled question set.
+
+Reports routing accuracy, a confusion table and local answer latency per route.
+With --chat the locally answered questions are also sent to the Watsonx chat
+model, to measure the latency each route saves:
+    python benchmark_intent_router.py --chat
+"""
+import argparse
+import os
+import statistics
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from intent_router import GlossaryIndex, route_question, ROUTES, GLOSSARY, CALCULATOR, MODEL, DEFAULT_GLOSSARY_PATH
+from watsonx_client import IAMTokenManager, complete_chat
+
+LABELED_QUESTIONS = [
+    ("What is a balloon payment?", GLOSSARY),
+    ("what's APR", GLOSSARY),
+    ("Define collateral", GLOSSARY),
+    ("What does LTV stand for?", GLOSSARY),
+    ("What is escrow?", GLOSSARY),
+    ("What are origination fees?", GLOSSARY),
+    ("What is a lien?", GLOSSARY),
+    ("What is negative amortization?", GLOSSARY),
+    ("Meaning of prepayment penalty", GLOSSARY),
+    ("What is a co-signer?", GLOSSARY),
+    ("What is DTI?", GLOSSARY),
+    ("Explain refinancing", GLOSSARY),
+    ("What is a grace period?", GLOSSARY),
+    ("what is a hard inquiry", GLOSSARY),
+    ("What is the monthly payment on a $25,000 loan at 8.5% for 5 years?", CALCULATOR),
+    ("How much would I pay monthly for 300k at 6.5% over 30 years", CALCULATOR),
+    ("Monthly payment for a $350,000 30-year mortgage at 7%?", CALCULATOR),
+    ("Calculate the payment on $18,500 at 5.9% for 72 months", CALCULATOR),
+    ("How much interest will I pay on a $40k loan at 9% over 4 years?", CALCULATOR),
+    ("If I pay an extra $200 a month on a $200,000 mortgage at 6% for 30 years how much interest do I save?",
+     CALCULATOR),
+    ("What's the interest only payment on $200,000 at 6%?", CALCULATOR),
+    ("How much does a $10,000 loan at 12 percent for 3 years cost per month?", CALCULATOR),
+    ("Paying $150 extra on my $30,000 car loan at 7.5% for 60 months, when is it paid off?", CALCULATOR),
+    ("What is a good credit score for a mortgage?", MODEL),
+    ("How do I apply for a student loan?", MODEL),
+    ("Should I take a $25,000 loan at 8.5% for 5 years?", MODEL),
+    ("Compare 5% and 6% on $300k for 30 years", MODEL),
+    ("What is the APR on a typical car loan?", MODEL),
+    ("Can I get a personal loan with bad credit?", MODEL),
+    ("What documents do I need for a mortgage application?", MODEL),
+    ("Is it better to refinance or consolidate my debt?", MODEL),
+    ("What happens if I miss a payment?", MODEL),
+    ("How does a home equity line of credit work?", MODEL),
+    ("What are the current 30-year fixed rates?", MODEL),
+    ("What is my monthly payment?", MODEL),
+    ("Explain the difference between APR and interest rate", MODEL),
+    ("How can I lower my debt-to-income ratio before applying?", MODEL),
+    ("What is the payment on a $20,000 loan?", MODEL),
+    ("Why did my credit score drop after a hard inquiry?", MODEL),
+    ("What fees should I expect when closing on a house?", MODEL),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def chat_latency_ms(question: str, token_manager: IAMTokenManager) -> float:
+    """Wall time of one plain Watsonx completion for the question"""
+    body = {
+        "model_id": os.getenv("WATSONX_MODEL_ID", "meta-llama/llama-3-3-70b-instruct"),
+        "project_id": os.getenv("WATSONX_PROJECT_ID", "6344e97c-4a5a-4585-af06-e379c55b855b"),
+        "messages": [{"role": "user", "content": question}],
+        "temperature": 0.7,
+        "max_tokens": 1000,
+    }
+    url = os.getenv("WATSONX_API_URL", "https://us-south.ml.cloud.ibm.com/ml/v1/text/chat?version=2023-03-29")
+    started = time.perf_counter()
+    complete_chat(url, {"Content-Type": "application/json", "Accept": "application/json"}, body, token_manager)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--glossary", default=DEFAULT_GLOSSARY_PATH)
+    parser.add_argument("--repeat", type=int, default=200, help="routing passes over the question set for timing")
+    parser.add_argument("--chat", action="store_true", help="also time Watsonx answers for the locally routed questions")
+    args = parser.parse_args()
+
+    glossary = GlossaryIndex.from_file(args.glossary)
+    print(f"{len(glossary)} glossary keys from {args.glossary}\n")
+
+    confusion = Counter()
+    timings = {route: [] for route in ROUTES}
+    local_questions = []
+    for question, expected in LABELED_QUESTIONS:
+        route = route_question(question, glossary)
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            route_question(question, glossary)
+            timings[route.kind].append((time.perf_counter() - started) * 1000)
+        confusion[expected, route.kind] += 1
+        if route.kind != expected:
+            print(f"misrouted ({expected} -> {route.kind}): {question}")
+        if route.kind != MODEL:
+            local_questions.append((question, route.kind))
+
+    correct = sum(count for (expected, actual), count in confusion.items() if expected == actual)
+    print(f"\naccuracy: {correct}/{len(LABELED_QUESTIONS)} ({correct / len(LABELED_QUESTIONS):.0%})")
+    print(f"{'expected/routed':<18}" + "".join(f"{route:>12}" for route in ROUTES))
+    for expected in ROUTES:
+        print(f"{expected:<18}" + "".join(f"{confusion[expected, actual]:>12}" for actual in ROUTES))
+
+    print("\nrouting latency per question:")
+    for route in ROUTES:
+        if timings[route]:
+            print(f"  {route:<11} p50 {percentile(timings[route], 0.5):.3f} ms, p95 {percentile(timings[route], 0.95):.3f} ms")
+
+    if args.chat:
+        load_dotenv()
+        token_manager = IAMTokenManager(
+            os.getenv("WATSONX_IAM_URL", "https://iam.cloud.ibm.com/identity/token"), os.environ["WATSONX_API_KEY"]
+        )
+        saved = {GLOSSARY: [], CALCULATOR: []}
+        for question, route in local_questions:
+            saved[route].append(chat_latency_ms(question, token_manager) - statistics.median(timings[route]))
+        print("\nlatency saved against a Watsonx completion (retrieval not included):")
+        for route, values in saved.items():
+            if values:
+                print(f"  {route:<11} {len(values)} questions, {statistics.mean(values):.0f} ms each, "
+                      f"{sum(values) / 1000:.1f} s in total")
+
+
+if __name__ == "__main__":
+    main()
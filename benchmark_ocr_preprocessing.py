@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark vision OCR payloads before and after image preprocessing.
+
+Compares the old pipeline (2x PNG render, sent as-is) with the pixel-budget
+render plus re-encoding, page by page. With --ocr both versions are sent to
+the vision model and the transcripts are compared:
+    python benchmark_ocr_preprocessing.py documents/statement.pdf --ocr
+"""
+import argparse
+import base64
+import difflib
+import os
+import time
+
+import fitz
+from dotenv import load_dotenv
+
+from image_preprocessing import DEFAULT_IMAGE_FORMAT, DEFAULT_MAX_PIXELS, PreparedImage, mime_type_of, prepare_image
+from pdf_extraction import pdf_to_images
+from watsonx_client import IAMTokenManager, post
+
+PROMPT = "Extract and summarize all text content from this image. If it's a document page, provide a structured summary."
+
+
+def baseline_images(data: bytes, is_pdf: bool):
+    """What the app sent before: 2x PNG renders, or the upload bytes as they came"""
+    if not is_pdf:
+        yield PreparedImage(data, mime_type_of(data), 0, 0, len(data))
+        return
+    with fitz.open(stream=data, filetype="pdf") as pdf_document:
+        for page in pdf_document:
+            png = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0)).tobytes("png")
+            yield PreparedImage(png, "image/png", 0, 0, len(png))
+
+
+def preprocessed_images(data: bytes, is_pdf: bool, max_pixels: int, image_format: str):
+    pages = pdf_to_images(data, max_pixels=max_pixels) if is_pdf else [data]
+    for page in pages:
+        yield prepare_image(page, max_pixels, image_format)
+
+
+def ocr(image: PreparedImage, token_manager: IAMTokenManager) -> str:
+    body = {
+        "model_id": os.getenv("WATSONX_VISION_MODEL_ID", "meta-llama/llama-3-2-90b-vision-instruct"),
+        "project_id": os.getenv("WATSONX_PROJECT_ID", "6344e97c-4a5a-4585-af06-e379c55b855b"),
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": PROMPT},
+            {"type": "image_url", "image_url": {
+                "url": f"data:{image.mime_type};base64,{base64.b64encode(image.data).decode()}"}},
+        ]}],
+        "temperature": 0.1,
+        "max_tokens": 1000,
+    }
+    url = os.getenv("WATSONX_VISION_API_URL", "https://us-south.ml.cloud.ibm.com/ml/v1/text/chat?version=2023-03-29")
+    resp = post(url, headers={"Content-Type": "application/json", "Accept": "application/json"},
+                json=body, token_manager=token_manager)
+    if resp.status_code != 200:
+        raise Exception(f"Error {resp.status_code}: {resp.text}")
+    return resp.json()["choices"][0]["message"]["content"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="PDF or image file")
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS)
+    parser.add_argument("--format", default=DEFAULT_IMAGE_FORMAT, choices=["jpeg", "webp"])
+    parser.add_argument("--ocr", action="store_true", help="also send both versions to the vision model")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+    is_pdf = args.path.lower().endswith(".pdf")
+
+    token_manager = None
+    if args.ocr:
+        load_dotenv()
+        token_manager = IAMTokenManager(
+            os.getenv("WATSONX_IAM_URL", "https://iam.cloud.ibm.com/identity/token"), os.environ["WATSONX_API_KEY"]
+        )
+
+    totals = {"before": 0, "after": 0, "before_ms": 0.0, "after_ms": 0.0}
+    started = time.perf_counter()
+    pairs = zip(baseline_images(data, is_pdf), preprocessed_images(data, is_pdf, args.max_pixels, args.format))
+    for page_number, (before, after) in enumerate(pairs, start=1):
+        # Payload size is what goes over the wire: base64 inflates by 4/3
+        before_kb = len(before.data) * 4 / 3 / 1024
+        after_kb = len(after.data) * 4 / 3 / 1024
+        totals["before"] += before_kb
+        totals["after"] += after_kb
+        line = (f"page {page_number:>3}: {before_kb:8.1f} KB {before.mime_type:<10} -> "
+                f"{after_kb:8.1f} KB {after.mime_type:<10} {after.width}x{after.height}")
+
+        if token_manager is not None:
+            t0 = time.perf_counter()
+            before_text = ocr(before, token_manager)
+            t1 = time.perf_counter()
+            after_text = ocr(after, token_manager)
+            t2 = time.perf_counter()
+            totals["before_ms"] += (t1 - t0) * 1000
+            totals["after_ms"] += (t2 - t1) * 1000
+            similarity = difflib.SequenceMatcher(None, before_text, after_text).ratio()
+            line += f" | {(t1 - t0) * 1000:6.0f} ms -> {(t2 - t1) * 1000:6.0f} ms, transcript similarity {similarity:.2f}"
+        print(line)
+
+    pages = max(page_number, 1)
+    print(f"\n{pages} pages in {time.perf_counter() - started:.1f}s")
+    print(f"payload per page: {totals['before'] / pages:.1f} KB -> {totals['after'] / pages:.1f} KB "
+          f"({1 - totals['after'] / max(totals['before'], 1e-9):.0%} smaller)")
+    if token_manager is not None:
+        print(f"vision latency per page: {totals['before_ms'] / pages:.0f} ms -> {totals['after_ms'] / pages:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Persistent BM25 inverted index over the chunks table
+"""
+import heapq
+import math
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Chunk ids per IN (...) lookup
+PROBE_BATCH_SIZE = 500
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+me my of on or our so than that the their them then there these they this to was we
+what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def init_bm25_index(cursor: sqlite3.Cursor):
+    """Create the inverted index tables if they do not exist yet.
+
+    Each term keeps its highest term frequency and the shortest chunk it
+    occurs in, which bound its score contribution. Removing chunks leaves
+    them as they are: the bound only gets looser until the next rebuild.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bm25_terms (
+            term TEXT PRIMARY KEY,
+            doc_freq INTEGER NOT NULL,
+            max_term_freq INTEGER NOT NULL DEFAULT 0,
+            min_length INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("SELECT name FROM pragma_table_info('bm25_terms')")
+    if "max_term_freq" not in {name for (name,) in cursor.fetchall()}:
+        # Indexes built before the score bounds were kept
+        cursor.execute("ALTER TABLE bm25_terms ADD COLUMN max_term_freq INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE bm25_terms ADD COLUMN min_length INTEGER NOT NULL DEFAULT 0")
+        cursor.execute('''
+            UPDATE bm25_terms SET
+                max_term_freq = (SELECT MAX(p.term_freq) FROM bm25_postings p WHERE p.term = bm25_terms.term),
+                min_length = (
+                    SELECT MIN(l.length) FROM bm25_postings p
+                    JOIN bm25_chunk_lengths l ON l.chunk_id = p.chunk_id
+                    WHERE p.term = bm25_terms.term
+                )
+        ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bm25_postings (
+            term TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            term_freq INTEGER NOT NULL,
+            PRIMARY KEY (term, chunk_id)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bm25_chunk_lengths (
+            chunk_id TEXT PRIMARY KEY,
+            length INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    # Single row holding corpus totals so queries never have to COUNT(*) the corpus
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bm25_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            chunk_count INTEGER NOT NULL,
+            total_length INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bm25_postings_chunk ON bm25_postings(chunk_id)")
+    cursor.execute("INSERT OR IGNORE INTO bm25_stats (id, chunk_count, total_length) VALUES (0, 0, 0)")
+
+
+def needs_backfill(cursor: sqlite3.Cursor) -> bool:
+    """True when chunks exist but the index has never been built for them"""
+    cursor.execute("SELECT chunk_count FROM bm25_stats WHERE id = 0")
+    row = cursor.fetchone()
+    if row and row[0] > 0:
+        return False
+    cursor.execute("SELECT 1 FROM chunks LIMIT 1")
+    return cursor.fetchone() is not None
+
+
+def remove_chunks(cursor: sqlite3.Cursor, chunk_ids: Iterable[str]):
+    """Drop chunks from the index, keeping document frequencies consistent"""
+    for chunk_id in chunk_ids:
+        cursor.execute("SELECT length FROM bm25_chunk_lengths WHERE chunk_id = ?", (chunk_id,))
+        row = cursor.fetchone()
+        if row is None:
+            continue
+
+        cursor.execute("SELECT term FROM bm25_postings WHERE chunk_id = ?", (chunk_id,))
+        terms = [(term,) for (term,) in cursor.fetchall()]
+        cursor.executemany("UPDATE bm25_terms SET doc_freq = doc_freq - 1 WHERE term = ?", terms)
+        cursor.execute("DELETE FROM bm25_postings WHERE chunk_id = ?", (chunk_id,))
+        cursor.execute("DELETE FROM bm25_chunk_lengths WHERE chunk_id = ?", (chunk_id,))
+        cursor.execute('''
+            UPDATE bm25_stats
+            SET chunk_count = chunk_count - 1, total_length = total_length - ?
+            WHERE id = 0
+        ''', (row[0],))
+
+    cursor.execute("DELETE FROM bm25_terms WHERE doc_freq <= 0")
+
+
+def remove_document(cursor: sqlite3.Cursor, document_id: str):
+    """Drop every indexed chunk belonging to a document"""
+    cursor.execute("SELECT id FROM chunks WHERE document_id = ?", (document_id,))
+    remove_chunks(cursor, [chunk_id for (chunk_id,) in cursor.fetchall()])
+
+
+def index_chunks(cursor: sqlite3.Cursor, chunks: Iterable[Tuple[str, str]]):
+    """Add (chunk_id, chunk_text) pairs to the index, replacing earlier versions"""
+    chunks = dict(chunks)
+    remove_chunks(cursor, list(chunks))
+    add_tokenized_chunks(cursor, [(chunk_id, Counter(tokenize(chunk_text or ""))) for chunk_id, chunk_text in chunks.items()])
+
+
+def add_tokenized_chunks(cursor: sqlite3.Cursor, chunks: Iterable[Tuple[str, Dict[str, int]]]):
+    """Add (chunk_id, term_counts) pairs not yet in the index, batching every table write"""
+    postings = []
+    lengths = []
+    doc_freqs = Counter()
+    max_term_freqs: Dict[str, int] = {}
+    min_lengths: Dict[str, int] = {}
+    for chunk_id, term_counts in chunks:
+        length = sum(term_counts.values())
+        postings.extend((term, chunk_id, tf) for term, tf in term_counts.items())
+        lengths.append((chunk_id, length))
+        doc_freqs.update(term_counts.keys())
+        for term, tf in term_counts.items():
+            max_term_freqs[term] = max(max_term_freqs.get(term, 0), tf)
+            min_lengths[term] = min(min_lengths.get(term, length), length)
+    if not lengths:
+        return
+
+    cursor.executemany("INSERT INTO bm25_postings (term, chunk_id, term_freq) VALUES (?, ?, ?)", postings)
+    cursor.executemany('''
+        INSERT INTO bm25_terms (term, doc_freq, max_term_freq, min_length) VALUES (?, ?, ?, ?)
+        ON CONFLICT(term) DO UPDATE SET
+            doc_freq = doc_freq + excluded.doc_freq,
+            max_term_freq = MAX(max_term_freq, excluded.max_term_freq),
+            min_length = MIN(min_length, excluded.min_length)
+    ''', [(term, doc_freq, max_term_freqs[term], min_lengths[term]) for term, doc_freq in doc_freqs.items()])
+    cursor.executemany("INSERT INTO bm25_chunk_lengths (chunk_id, length) VALUES (?, ?)", lengths)
+    cursor.execute('''
+        UPDATE bm25_stats
+        SET chunk_count = chunk_count + ?, total_length = total_length + ?
+        WHERE id = 0
+    ''', (len(lengths), sum(length for _, length in lengths)))
+
+
+def clear_bm25_index(cursor: sqlite3.Cursor):
+    """Empty the index without dropping its tables"""
+    cursor.execute("DELETE FROM bm25_postings")
+    cursor.execute("DELETE FROM bm25_terms")
+    cursor.execute("DELETE FROM bm25_chunk_lengths")
+    cursor.execute("UPDATE bm25_stats SET chunk_count = 0, total_length = 0 WHERE id = 0")
+
+
+def rebuild_bm25_index(cursor: sqlite3.Cursor):
+    """Rebuild the whole index from the chunks table"""
+    clear_bm25_index(cursor)
+    cursor.execute("SELECT id, chunk_text FROM chunks")
+    rows = cursor.fetchall()
+    index_chunks(cursor, rows)
+    return len(rows)
+
+
+def term_score(idf: float, term_freq: int, length: int, avg_length: float) -> float:
+    """One term's BM25 contribution; grows with term_freq and shrinks with length"""
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) if avg_length else BM25_K1
+    return idf * term_freq * (BM25_K1 + 1) / (term_freq + norm)
+
+
+def bm25_search(cursor: sqlite3.Cursor, query: str, session_id: Optional[str],
+                limit: int = 200) -> List[Tuple[int, float]]:
+    """Top chunks visible to the session, as (chunk rowid, score), best first.
+
+    Terms are read in order of their highest possible contribution
+    (MaxScore). Once the terms left could not lift a chunk that matched none
+    so far past the current k-th score, their postings are only looked up
+    for chunks still able to reach the top k, so common terms are not read
+    in full.
+    """
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+
+    cursor.execute("SELECT chunk_count, total_length FROM bm25_stats WHERE id = 0")
+    row = cursor.fetchone()
+    if not row or row[0] == 0:
+        return []
+    chunk_count, total_length = row
+    avg_length = total_length / chunk_count if chunk_count else 0.0
+
+    placeholders = ",".join("?" * len(terms))
+    cursor.execute(f"SELECT term, doc_freq, max_term_freq, min_length FROM bm25_terms WHERE term IN ({placeholders})",
+                   terms)
+    weighted = []
+    for term, doc_freq, max_term_freq, min_length in cursor.fetchall():
+        idf = math.log(1 + (chunk_count - doc_freq + 0.5) / (doc_freq + 0.5))
+        weighted.append((term, idf, term_score(idf, max_term_freq, min_length, avg_length)))
+    weighted.sort(key=lambda item: item[2], reverse=True)
+    remaining = sum(bound for _, _, bound in weighted)
+
+    scores: Dict[str, float] = {}
+    rowids: Dict[str, int] = {}
+    for term, idf, bound in weighted:
+        threshold = heapq.nlargest(limit, scores.values())[-1] if len(scores) >= limit else 0.0
+        if len(scores) >= limit and remaining <= threshold:
+            # Only chunks already matched can still make the top k; drop those that cannot
+            scores = {chunk_id: score for chunk_id, score in scores.items() if score + remaining >= threshold}
+            postings = []
+            alive = list(scores)
+            for start in range(0, len(alive), PROBE_BATCH_SIZE):
+                batch = alive[start:start + PROBE_BATCH_SIZE]
+                cursor.execute(f'''
+                    SELECT p.chunk_id, p.term_freq, l.length
+                    FROM bm25_postings p
+                    JOIN bm25_chunk_lengths l ON l.chunk_id = p.chunk_id
+                    WHERE p.term = ? AND p.chunk_id IN ({",".join("?" * len(batch))})
+                ''', [term] + batch)
+                postings.extend(cursor.fetchall())
+        else:
+            # Reference chunks have no session; other sessions' uploads never reach the scoring loop
+            cursor.execute('''
+                SELECT p.chunk_id, c.rowid, p.term_freq, l.length
+                FROM bm25_postings p
+                JOIN bm25_chunk_lengths l ON l.chunk_id = p.chunk_id
+                JOIN chunks c ON c.id = p.chunk_id
+                WHERE p.term = ? AND (c.session_id IS NULL OR c.session_id = ?)
+            ''', (term, session_id))
+            postings = []
+            for chunk_id, rowid, term_freq, length in cursor.fetchall():
+                rowids[chunk_id] = rowid
+                postings.append((chunk_id, term_freq, length))
+        for chunk_id, term_freq, length in postings:
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + term_score(idf, term_freq, length, avg_length)
+        remaining -= bound
+
+    ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    return [(rowids[chunk_id], score) for chunk_id, score in ranked]
@@ -0,0 +1,156 @@
+"""
+Token-budgeted chat history: recent turns verbatim, older turns folded into a rolling
+summary, and uploaded-document dumps reduced to short references
+"""
+import functools
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chunking import estimate_tokens
+
+DEFAULT_PROMPT_BUDGET = 6000
+# Share of the history budget kept as verbatim turns; the rest holds the rolling summary
+DEFAULT_RECENT_SHARE = 0.7
+DEFAULT_SUMMARY_TOKENS = 400
+# Per-message overhead of the chat template (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Upload results posted to the chat: "✅ Successfully processed PDF: name.pdf ...\n\nExtracted Content:\n..."
+DOCUMENT_DUMP = re.compile(
+    r"^✅ Successfully processed (?P<kind>PDF|image|text file|Word document|spreadsheet|CSV file): (?P<filename>.+?)(?: \(.*)?\n\n"
+    r"(?:Extracted Content|Content Preview):\n", re.DOTALL
+)
+
+TokenCounter = Callable[[str], int]
+# summarize(previous summary, messages to fold in, max tokens) -> new summary
+Summarizer = Callable[[str, List[Dict], int], str]
+
+_tokenizer_lock = threading.Lock()
+_counters: Dict[Tuple[str, Optional[str]], TokenCounter] = {}
+
+
+@dataclass
+class HistoryState:
+    """Rolling summary of history[:summarized], kept between requests so each turn is folded in only once"""
+    summary: str = ""
+    summarized: int = 0
+
+
+def load_token_counter(tokenizer_name: str = "", cache_dir: Optional[str] = None) -> TokenCounter:
+    """Token counter from a locally cached Hugging Face tokenizer, or the character estimate without one"""
+    if not tokenizer_name:
+        return estimate_tokens
+    key = (tokenizer_name, cache_dir)
+    with _tokenizer_lock:
+        if key not in _counters:
+            try:
+                # Never reach out to the Hugging Face hub at runtime
+                os.environ.setdefault("HF_HUB_OFFLINE", "1")
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, cache_dir=cache_dir, local_files_only=True)
+                _counters[key] = functools.lru_cache(maxsize=4096)(
+                    lambda text: len(tokenizer.encode(text, add_special_tokens=False)))
+            except Exception:
+                _counters[key] = estimate_tokens
+        return _counters[key]
+
+
+def message_tokens(message: Dict, count_tokens: TokenCounter) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def compact_message(message: Dict) -> Dict:
+    """Replace an uploaded document's full text with a reference; retrieval brings back the parts a question needs"""
+    match = DOCUMENT_DUMP.match(message.get("content") or "")
+    if not match:
+        return message
+    return dict(message, content=f"[Processed {match.group('kind')} {match.group('filename')}: its content is indexed "
+                                 f"and relevant passages are retrieved for each question.]")
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: TokenCounter) -> str:
+    """Longest prefix of text within max_tokens, cut at a word boundary"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    return (cut.rsplit(" ", 1)[0] if " " in cut else cut) + " …"
+
+
+def extractive_summary(previous: str, messages: List[Dict], max_tokens: int,
+                       count_tokens: TokenCounter = estimate_tokens) -> str:
+    """Summary without a model: the previous summary plus the opening of each folded message"""
+    lines = [previous] if previous else []
+    for message in messages:
+        first_line = (message.get("content") or "").strip().split("\n", 1)[0]
+        lines.append(f"{message.get('role', 'user')}: {truncate_to_tokens(first_line, 40, count_tokens)}")
+    # Keep the most recent lines when over budget
+    text = "\n".join(lines)
+    while len(lines) > 1 and count_tokens(text) > max_tokens:
+        lines.pop(0)
+        text = "\n".join(lines)
+    return truncate_to_tokens(text, max_tokens, count_tokens)
+
+
+def compact_history(history: List[Dict], budget: int, state: HistoryState, summarize: Optional[Summarizer] = None,
+                    count_tokens: TokenCounter = estimate_tokens, recent_share: float = DEFAULT_RECENT_SHARE,
+                    summary_tokens: int = DEFAULT_SUMMARY_TOKENS) -> List[Dict]:
+    """Messages to send for history within budget tokens.
+
+    The newest turns are kept verbatim in up to recent_share of the budget.
+    Turns that no longer fit are folded into state.summary by summarize
+    (falling back to an extractive summary), which is sent as a system
+    message ahead of them. When the window overflows it is cut to half its
+    size, so the summarizer runs every few turns rather than on every one.
+    """
+    if budget <= 0:
+        return []
+    if len(history) < state.summarized:
+        # The conversation was cleared
+        state.summary, state.summarized = "", 0
+
+    messages = [compact_message(message) for message in history]
+    recent_budget = int(budget * recent_share)
+    summary_budget = min(summary_tokens, budget - recent_budget - MESSAGE_OVERHEAD_TOKENS)
+
+    # Turns not yet summarized, newest first, while they fit the recent budget
+    start = len(messages)
+    used = 0
+    while start > state.summarized and used + message_tokens(messages[start - 1], count_tokens) <= recent_budget:
+        start -= 1
+        used += message_tokens(messages[start], count_tokens)
+
+    if start > state.summarized:
+        # Overflow: keep only the newest half of the window so the next few turns fit without another summary
+        while start < len(messages) and used > recent_budget // 2:
+            used -= message_tokens(messages[start], count_tokens)
+            start += 1
+        folded = messages[state.summarized:start]
+        summary = None
+        if summarize is not None and summary_budget > 0:
+            try:
+                summary = summarize(state.summary, folded, summary_budget)
+            except Exception:
+                summary = None
+        if not summary:
+            summary = extractive_summary(state.summary, folded, max(summary_budget, 0), count_tokens)
+        state.summary = truncate_to_tokens(summary, max(summary_budget, 0), count_tokens)
+        state.summarized = start
+
+    compacted = []
+    if state.summary and summary_budget > 0:
+        compacted.append({"role": "system", "content": f"Summary of the earlier conversation:\n{state.summary}"})
+    return compacted + messages[start:]
+
+
+def history_tokens(messages: List[Dict], count_tokens: TokenCounter = estimate_tokens) -> int:
+    return sum(message_tokens(message, count_tokens) for message in messages)
@@ -0,0 +1,162 @@
+"""
+Token-budgeted, markdown-section-aware chunking with stable IDs and character spans
+"""
+import re
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# Rough for English and Llama tokenizers; only used to size chunks and groups, never to cut text exactly
+CHARS_PER_TOKEN = 4
+
+DEFAULT_MAX_TOKENS = 400
+DEFAULT_OVERLAP_TOKENS = 50
+# Changes whenever chunk boundaries would, so stored chunks can be recognised as stale
+CHUNKER_VERSION = f"2:{DEFAULT_MAX_TOKENS}:{DEFAULT_OVERLAP_TOKENS}"
+
+WORD_PATTERN = re.compile(r"\S+")
+# The reference guides use "#", "##" and "###" headings
+HEADING_PATTERN = re.compile(r"^#{1,6}\s", re.MULTILINE)
+PAGE_CHUNK_ID = re.compile(r"_page_(\d+)_chunk_\d+$")
+
+
+class Chunk(NamedTuple):
+    index: int
+    text: str
+    # Character span of text in the string it was cut from: text == source[start:end]
+    start: int
+    end: int
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_id(document_id: str, index: int, page_number: Optional[int] = None) -> str:
+    """Deterministic ID from the document and the chunk's position, so reloading replaces rather than duplicates"""
+    if page_number is None:
+        return f"{document_id}_chunk_{index}"
+    return f"{document_id}_page_{page_number}_chunk_{index}"
+
+
+def chunk_page(chunk_key: str) -> Optional[int]:
+    """Page number encoded in a page chunk's ID, None for chunks of the document content"""
+    match = PAGE_CHUNK_ID.search(chunk_key)
+    return int(match.group(1)) if match else None
+
+
+def word_tokens(text: str, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int, int]]:
+    """(start, end, estimated tokens) of each whitespace-separated word in text[start:end]"""
+    end = len(text) if end is None else end
+    return [(m.start(), m.end(), estimate_tokens(m.group())) for m in WORD_PATTERN.finditer(text, start, end)]
+
+
+def split_by_tokens(words: List[Tuple[int, int, int]], max_tokens: int,
+                    overlap_tokens: int) -> List[Tuple[int, int]]:
+    """Character spans of word windows of at most max_tokens, each repeating about overlap_tokens of the last"""
+    spans = []
+    i = 0
+    while i < len(words):
+        j = i
+        used = 0
+        # A single word longer than the budget still gets a window of its own
+        while j < len(words) and (j == i or used + words[j][2] <= max_tokens):
+            used += words[j][2]
+            j += 1
+        spans.append((words[i][0], words[j - 1][1]))
+        if j == len(words):
+            break
+        k = j
+        repeated = 0
+        while k - 1 > i and repeated + words[k - 1][2] <= overlap_tokens:
+            k -= 1
+            repeated += words[k][2]
+        i = k
+    return spans
+
+
+def markdown_sections(text: str) -> List[Tuple[int, int]]:
+    """Spans of the text before the first heading and of each heading with its body"""
+    starts = [0] + [m.start() for m in HEADING_PATTERN.finditer(text) if m.start() > 0]
+    return list(zip(starts, starts[1:] + [len(text)]))
+
+
+def split_markdown(text: str, max_tokens: int, overlap_tokens: int) -> List[Tuple[int, int]]:
+    """Pack whole consecutive sections into chunks; only a section over the budget is cut into windows"""
+    spans = []
+    pending = []
+    used = 0
+    for start, end in markdown_sections(text):
+        words = word_tokens(text, start, end)
+        tokens = sum(cost for _, _, cost in words)
+        if used + tokens <= max_tokens:
+            pending.extend(words)
+            used += tokens
+            continue
+        if pending and (tokens <= max_tokens or used > overlap_tokens):
+            spans.append((pending[0][0], pending[-1][1]))
+            pending, used = [], 0
+        if tokens <= max_tokens:
+            pending, used = words, tokens
+            continue
+        # Short headings left pending stay with the first window of the long section they introduce
+        spans.extend(split_by_tokens(pending + words, max_tokens, overlap_tokens))
+        pending, used = [], 0
+    if pending:
+        spans.append((pending[0][0], pending[-1][1]))
+    return spans
+
+
+def chunk_document(text: str, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                   markdown: Optional[bool] = None) -> List[Chunk]:
+    """Split text into chunks of at most max_tokens estimated tokens.
+
+    Markdown text (detected from its headings unless markdown is given) is
+    split at section boundaries; plain text, and sections too long for one
+    chunk, are cut into overlapping word windows.
+    """
+    if markdown is None:
+        markdown = HEADING_PATTERN.search(text) is not None
+    if markdown:
+        spans = split_markdown(text, max_tokens, overlap_tokens)
+    else:
+        spans = split_by_tokens(word_tokens(text), max_tokens, overlap_tokens)
+    return [Chunk(index, text[start:end], start, end) for index, (start, end) in enumerate(spans)]
+
+
+def chunk_blocks(blocks: Iterable[str], max_tokens: int = DEFAULT_MAX_TOKENS,
+                 overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> Tuple[str, List[Chunk]]:
+    """Join blocks (paragraphs, table rows) with newlines and chunk them without cutting any block.
+
+    Consecutive blocks are packed up to max_tokens, a markdown heading always
+    starts a new chunk, and only a single block over the budget is cut into
+    overlapping word windows. Blocks are consumed one at a time, so extractors
+    can stream them. Returns the joined text and its chunks.
+    """
+    parts: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    offset = 0
+    pending: Optional[Tuple[int, int]] = None
+    used = 0
+    for block in blocks:
+        block = block.strip()
+        if not block:
+            continue
+        if parts:
+            parts.append("\n")
+            offset += 1
+        start, end = offset, offset + len(block)
+        parts.append(block)
+        offset = end
+        words = word_tokens(block)
+        tokens = sum(cost for _, _, cost in words)
+        if pending and (used + tokens > max_tokens or HEADING_PATTERN.match(block)):
+            spans.append(pending)
+            pending, used = None, 0
+        if tokens > max_tokens:
+            spans.extend((start + s, start + e) for s, e in split_by_tokens(words, max_tokens, overlap_tokens))
+            continue
+        pending = (pending[0] if pending else start, end)
+        used += tokens
+    if pending:
+        spans.append(pending)
+    text = "".join(parts)
+    return text, [Chunk(index, text[start:end], start, end) for index, (start, end) in enumerate(spans)]
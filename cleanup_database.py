@@ -2,24 +2,56 @@
 """
 Clean up test data from the RAG database
 """
-import sqlite3
 import os
+from storage import connect
+from vector_store import open_vector_store
+from bm25_index import init_bm25_index, clear_bm25_index
+from retrieval_cache import init_corpus_versions, bump_all_corpus_versions
+from answer_cache import init_answer_cache, clear_answer_cache
+from ocr_cache import init_ocr_cache, clear_ocr_cache
 
 DB_PATH = "document_index/documents.db"
 
-def cleanup_test_data():
+def cleanup_test_data(db_path: str = DB_PATH):
     """Remove all test data from the database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     try:
         # Delete all chunks first (foreign key constraint)
         cursor.execute("DELETE FROM chunks")
         
+        # Delete per-page text of OCRed documents
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_pages'")
+        if cursor.fetchone():
+            cursor.execute("DELETE FROM document_pages")
+        
         # Delete all documents
         cursor.execute("DELETE FROM documents")
         
+        # Empty the BM25 inverted index
+        init_bm25_index(cursor)
+        clear_bm25_index(cursor)
+        
+        # Invalidate retrieval caches held by running app processes
+        init_corpus_versions(cursor)
+        bump_all_corpus_versions(cursor)
+        
+        # Cached answers cite documents that no longer exist
+        init_answer_cache(cursor)
+        clear_answer_cache(cursor)
+        
+        # Cached OCR of the uploads being removed
+        init_ocr_cache(cursor)
+        clear_ocr_cache(cursor)
+        
         conn.commit()
+        
+        # Vectors of the deleted chunks
+        vector_store = open_vector_store(os.path.dirname(db_path))
+        if vector_store is not None:
+            vector_store.clear()
+        
         print("Test data cleaned up successfully")
         
         # Verify cleanup
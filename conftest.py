@@ -0,0 +1,32 @@
+"""
+Shared pytest fixtures: throwaway SQLite databases under tmp_path
+"""
+import pytest
+
+import storage
+from answer_cache import init_answer_cache
+from bm25_index import init_bm25_index
+from fts_index import init_fts_index
+from ocr_cache import init_ocr_cache
+from retrieval_cache import init_corpus_versions
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of a database that does not exist yet; it and its -wal/-shm files live in tmp_path"""
+    yield str(tmp_path / "documents.db")
+    # Let go of pooled connections so pytest can remove the files
+    storage.close_connections()
+
+
+@pytest.fixture
+def document_db(db_path):
+    """Database with the document tables and every index and cache built on them"""
+    with storage.transaction(db_path, immediate=True) as cursor:
+        storage.init_document_tables(cursor)
+        init_bm25_index(cursor)
+        init_fts_index(cursor)
+        init_corpus_versions(cursor)
+        init_answer_cache(cursor)
+        init_ocr_cache(cursor)
+    return db_path
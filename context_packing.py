@@ -0,0 +1,151 @@
+"""
+Context packing for the chat prompt: merge overlapping chunks, drop near-duplicate
+sentences and keep the sentences most relevant to the question within a token budget
+"""
+import math
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from bm25_index import tokenize
+from chunking import chunk_page, estimate_tokens
+
+DEFAULT_CONTEXT_TOKENS = 1500
+# Chunks retrieved for packing; more than are shown, since packing keeps only their best sentences
+DEFAULT_CONTEXT_CANDIDATES = 8
+# Token-set overlap above which a sentence repeats one already kept
+NEAR_DUPLICATE_JACCARD = 0.8
+# Weight of a sentence's chunk rank against its term overlap with the question
+RANK_PRIOR = 0.5
+# Chunks closer than this many characters are merged even without overlapping
+MAX_MERGE_GAP = 2
+
+# Sentence ends, and line breaks so markdown headings and bullets stand alone
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[*#\-•]?[A-Z0-9$])|\s*\n\s*")
+GAP_MARKER = "…"
+
+
+def merge_chunks(results: Sequence[Dict]) -> List[Dict]:
+    """Join chunks of the same document (and page) whose character spans overlap or touch.
+
+    Passages keep the rank of their best chunk; text the chunks share is kept once.
+    """
+    groups: Dict[tuple, List[Dict]] = {}
+    for rank, result in enumerate(results):
+        key = (result['document_id'], chunk_page(result['chunk_id']))
+        groups.setdefault(key, []).append(dict(result, rank=rank))
+
+    passages = []
+    for chunks in groups.values():
+        spans = [chunk for chunk in chunks if chunk.get('char_start') is not None]
+        passages.extend(dict(chunk, chunk_ids=[chunk['chunk_id']]) for chunk in chunks if chunk.get('char_start') is None)
+        spans.sort(key=lambda chunk: chunk['char_start'])
+        current = None
+        for chunk in spans:
+            if current is not None and chunk['char_start'] <= current['char_end'] + MAX_MERGE_GAP:
+                overlap = current['char_end'] - chunk['char_start']
+                # Chunks break at whitespace, usually between sections or paragraphs
+                tail = chunk['text'][overlap:] if overlap >= 0 else "\n" + chunk['text']
+                if chunk['char_end'] > current['char_end']:
+                    current['text'] += tail
+                    current['char_end'] = chunk['char_end']
+                current['chunk_ids'].append(chunk['chunk_id'])
+                current['rank'] = min(current['rank'], chunk['rank'])
+                continue
+            current = dict(chunk, chunk_ids=[chunk['chunk_id']])
+            passages.append(current)
+    passages.sort(key=lambda passage: passage['rank'])
+    return passages
+
+
+def split_sentences(text: str) -> List[Tuple[str, str]]:
+    """Sentences and lines of text, each with the separator before it ("\n" when it starts a line)"""
+    pieces = []
+    start = 0
+    separator = ""
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        piece = text[start:boundary.start()].strip()
+        if piece:
+            pieces.append((piece, separator))
+        separator = "\n" if "\n" in boundary.group() else " "
+        start = boundary.end()
+    piece = text[start:].strip()
+    if piece:
+        pieces.append((piece, separator))
+    return pieces
+
+
+def is_near_duplicate(terms: frozenset, seen: List[frozenset], threshold: float = NEAR_DUPLICATE_JACCARD) -> bool:
+    for other in seen:
+        union = len(terms | other)
+        if union and len(terms & other) / union >= threshold:
+            return True
+    return False
+
+
+def pack_context(query: str, results: Sequence[Dict], budget: int = DEFAULT_CONTEXT_TOKENS,
+                 count_tokens: Callable[[str], int] = estimate_tokens) -> List[Dict]:
+    """Passages to show the model for query, within budget tokens in total.
+
+    Overlapping chunks are merged and repeated sentences dropped. If the rest
+    still exceeds the budget, sentences are chosen by the IDF-weighted question
+    terms they contain, with a bonus for higher-ranked passages, and shown in
+    document order with gaps marked. Each passage keeps the fields of its best
+    chunk plus 'chunk_ids'.
+    """
+    if budget <= 0 or not results:
+        return []
+    passages = merge_chunks(results)
+
+    # (passage index, position, sentence, separator, terms) with repeated sentences removed
+    sentences = []
+    seen: List[frozenset] = []
+    exact = set()
+    for index, passage in enumerate(passages):
+        for position, (sentence, separator) in enumerate(split_sentences(passage['text'])):
+            normalized = " ".join(sentence.lower().split())
+            terms = frozenset(tokenize(sentence))
+            if normalized in exact or (len(terms) >= 3 and is_near_duplicate(terms, seen)):
+                continue
+            exact.add(normalized)
+            if len(terms) >= 3:
+                seen.append(terms)
+            sentences.append((index, position, sentence, separator, terms))
+
+    costs = [count_tokens(sentence) + 1 for _, _, sentence, _, _ in sentences]
+    if sum(costs) > budget:
+        # Rarer question terms count for more; IDF over the candidate sentences themselves
+        query_terms = set(tokenize(query))
+        document_freq = {term: sum(1 for *_, terms in sentences if term in terms) for term in query_terms}
+        idf = {term: math.log(1 + len(sentences) / (1 + freq)) for term, freq in document_freq.items()}
+        scores = []
+        for index, _, _, _, terms in sentences:
+            relevance = sum(idf[term] for term in query_terms & terms)
+            scores.append(relevance + (RANK_PRIOR / (1 + passages[index]['rank']) if relevance else 0.0))
+        chosen = set()
+        used = 0
+        for i in sorted(range(len(sentences)), key=lambda i: (-scores[i], sentences[i][0], sentences[i][1])):
+            if scores[i] <= 0:
+                break
+            if used + costs[i] <= budget:
+                chosen.add(i)
+                used += costs[i]
+        sentences = [sentence for i, sentence in enumerate(sentences) if i in chosen]
+
+    packed = []
+    for index, passage in enumerate(passages):
+        kept = [(position, sentence, separator) for i, position, sentence, separator, _ in sentences if i == index]
+        if not kept:
+            continue
+        text = kept[0][1]
+        for (previous, _, _), (position, sentence, separator) in zip(kept, kept[1:]):
+            if position != previous + 1:
+                # Mark skipped sentences so the model does not read two distant ones as consecutive
+                separator = f"\n{GAP_MARKER}\n" if separator == "\n" else f" {GAP_MARKER} "
+            text += separator + sentence
+        packed.append(dict(passage, text=text))
+    return packed
+
+
+def context_tokens(passages: Sequence[Dict], count_tokens: Optional[Callable[[str], int]] = None) -> int:
+    count_tokens = count_tokens or estimate_tokens
+    return sum(count_tokens(passage['text']) for passage in passages)
@@ -0,0 +1,66 @@
+"""
+Tree-structured map-reduce merge of per-page text, sized by estimated tokens
+"""
+import concurrent.futures
+from typing import Callable, List, Tuple
+
+from chunking import estimate_tokens, CHARS_PER_TOKEN
+
+DEFAULT_GROUP_TOKENS = 12000
+DEFAULT_MAX_WORKERS = 4
+
+# (section label, text), e.g. ("Page 3", ...) or ("Pages 1-8", ...)
+Section = Tuple[str, str]
+
+
+def group_by_token_budget(sections: List[Section], budget: int) -> List[List[Section]]:
+    """Split consecutive sections into groups of at most budget tokens; an oversized section is truncated"""
+    groups = []
+    current = []
+    used = 0
+    for label, text in sections:
+        tokens = estimate_tokens(text)
+        if tokens > budget:
+            text = text[:budget * CHARS_PER_TOKEN]
+            tokens = budget
+        if current and used + tokens > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append((label, text))
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def span_label(group: List[Section]) -> str:
+    """'Pages 1-8' from the first and last labels of a group"""
+    first = group[0][0].split(" ", 1)[-1].split("-")[0]
+    last = group[-1][0].split(" ", 1)[-1].split("-")[-1]
+    return f"Pages {first}" if first == last else f"Pages {first}-{last}"
+
+
+def hierarchical_merge(sections: List[Section], summarize: Callable[[List[Section], bool], str],
+                       group_tokens: int = DEFAULT_GROUP_TOKENS, max_workers: int = DEFAULT_MAX_WORKERS) -> str:
+    """Summarize groups of sections in parallel, then the summaries, until one group remains.
+
+    summarize(group, final) gets consecutive (label, text) sections and whether
+    this is the last call, whose output is the document summary. Each level
+    shrinks the number of sections by the group size, so the number of
+    sequential rounds grows with log(pages).
+    """
+    if not sections:
+        return ""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        groups = group_by_token_budget(sections, group_tokens)
+        while len(groups) > 1:
+            summaries = list(executor.map(lambda group: summarize(group, False), groups))
+            sections = [(span_label(group), summary) for group, summary in zip(groups, summaries)]
+            next_groups = group_by_token_budget(sections, group_tokens)
+            if len(next_groups) >= len(groups):
+                # Summaries as long as their inputs: pair them up, halved, so the tree still terminates
+                half = group_tokens // 2 * CHARS_PER_TOKEN
+                next_groups = [[(label, text[:half]) for label, text in sections[i:i + 2]]
+                               for i in range(0, len(sections), 2)]
+            groups = next_groups
+        return summarize(groups[0], True)
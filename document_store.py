@@ -0,0 +1,92 @@
+"""
+Writing and removing uploaded documents together with their chunks, pages and search indexes
+"""
+import hashlib
+import json
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from answer_cache import invalidate_documents, invalidate_scope
+from bm25_index import index_chunks, remove_document
+from chunking import Chunk, chunk_document, chunk_id
+from retrieval_cache import bump_corpus_version
+from storage import SOURCE_UPLOAD
+
+# Content types whose text is chunked and indexed
+CHUNKED_CONTENT_TYPES = ('text', 'pdf', 'image', 'docx', 'xlsx', 'csv')
+
+
+def compute_content_hash(content: str) -> str:
+    """Compute hash of content for duplicate detection"""
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def delete_documents(cursor: sqlite3.Cursor, document_ids: Sequence[str]) -> List[int]:
+    """Remove documents with their chunks, pages and index entries; returns the removed chunk rowids.
+
+    Cached answers grounded on them are dropped too. The caller removes the
+    returned rowids from the vector store once the transaction has committed.
+    """
+    rowids = []
+    for document_id in document_ids:
+        remove_document(cursor, document_id)
+        cursor.execute("SELECT rowid FROM chunks WHERE document_id = ?", (document_id,))
+        rowids.extend(rowid for (rowid,) in cursor.fetchall())
+        cursor.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        cursor.execute("DELETE FROM document_pages WHERE document_id = ?", (document_id,))
+        cursor.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+    invalidate_documents(cursor, document_ids)
+    return rowids
+
+
+def insert_document(cursor: sqlite3.Cursor, document_id: str, filename: str, content: str, content_type: str,
+                    metadata: Optional[Dict] = None, session_id: Optional[str] = None,
+                    pages: Optional[List[str]] = None,
+                    chunks: Optional[List[Chunk]] = None) -> Tuple[List[int], List[Tuple[int, str]]]:
+    """Store an upload with the raw text of each page when given, and index its chunks.
+
+    Uploading the same file (name and content) again in a session replaces
+    the earlier copy; other sessions keep their own. The session's cached
+    answers are dropped, since a near hit could ignore the new document.
+    Extractors that already split content (table rows, say) pass their own
+    chunks. Returns the chunk rowids removed and the (rowid, text) of the
+    chunks added, for the vector store.
+    """
+    file_hash = compute_content_hash(content)
+    cursor.execute("SELECT id FROM documents WHERE file_hash = ? AND session_id IS ? AND filename = ? AND source = ?",
+                   (file_hash, session_id, filename, SOURCE_UPLOAD))
+    removed_rowids = delete_documents(cursor, [existing for (existing,) in cursor.fetchall()])
+
+    cursor.execute('''
+        INSERT INTO documents
+        (id, filename, content, content_type, file_hash, metadata, session_id, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (document_id, filename, content, content_type, file_hash, json.dumps(metadata or {}), session_id,
+          SOURCE_UPLOAD))
+    invalidate_scope(cursor, session_id)
+
+    if content_type not in CHUNKED_CONTENT_TYPES:
+        if removed_rowids:
+            bump_corpus_version(cursor, session_id)
+        return removed_rowids, []
+
+    keyed = [(chunk_id(document_id, chunk.index), chunk) for chunk in chunks or chunk_document(content)]
+    # Page chunks follow the summary chunks, so the whole document is searchable; their spans index the page text
+    next_index = len(keyed)
+    for page_number, page_text in enumerate(pages or [], start=1):
+        for chunk in chunk_document(page_text):
+            keyed.append((chunk_id(document_id, chunk.index, page_number), chunk._replace(index=next_index)))
+            next_index += 1
+    cursor.executemany('''
+        INSERT INTO document_pages (document_id, page_number, page_text) VALUES (?, ?, ?)
+    ''', [(document_id, page_number, page_text) for page_number, page_text in enumerate(pages or [], start=1)])
+    cursor.executemany('''
+        INSERT INTO chunks (id, document_id, chunk_text, chunk_index, char_start, char_end, session_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(key, document_id, chunk.text, chunk.index, chunk.start, chunk.end, session_id) for key, chunk in keyed])
+    # Keep the inverted index in step with the chunks table
+    index_chunks(cursor, [(key, chunk.text) for key, chunk in keyed])
+    cursor.execute("SELECT rowid, chunk_text FROM chunks WHERE document_id = ?", (document_id,))
+    added = cursor.fetchall()
+    bump_corpus_version(cursor, session_id)
+    return removed_rowids, added
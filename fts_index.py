@@ -0,0 +1,67 @@
+"""
+SQLite FTS5 index mirroring chunks.chunk_text, kept in sync by triggers
+"""
+import sqlite3
+
+from bm25_index import tokenize
+
+
+def init_fts_index(cursor: sqlite3.Cursor) -> bool:
+    """Create the external-content FTS5 table and its sync triggers.
+
+    Returns True when the table was just created, i.e. existing chunks still
+    have to be backfilled with rebuild_fts_index.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'")
+    created = cursor.fetchone() is None
+
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            chunk_text,
+            content='chunks',
+            content_rowid='rowid',
+            tokenize='porter unicode61'
+        )
+    ''')
+
+    # INSERT OR REPLACE on chunks removes the old row without firing delete
+    # triggers (recursive_triggers is off), so drop the old entry up front.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_before_insert BEFORE INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, chunk_text)
+            SELECT 'delete', rowid, chunk_text FROM chunks WHERE id = new.id;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_after_insert AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts (rowid, chunk_text) VALUES (new.rowid, new.chunk_text);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_after_delete AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, chunk_text) VALUES ('delete', old.rowid, old.chunk_text);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_after_update AFTER UPDATE ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, chunk_text) VALUES ('delete', old.rowid, old.chunk_text);
+            INSERT INTO chunks_fts (rowid, chunk_text) VALUES (new.rowid, new.chunk_text);
+        END
+    ''')
+
+    return created
+
+
+def rebuild_fts_index(cursor: sqlite3.Cursor):
+    """Re-read every row of the chunks table into the FTS index"""
+    cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 OR-query of quoted terms"""
+    terms = sorted(set(tokenize(query)))
+    return " OR ".join(f'"{term}"' for term in terms)
+
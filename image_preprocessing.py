@@ -0,0 +1,86 @@
+"""
+Downscale and re-encode page images before vision OCR, keeping the real MIME type
+"""
+import io
+import math
+from typing import NamedTuple
+
+from PIL import Image, ImageOps
+
+# About 1265 x 1265; enough for body text on a letter page, far below a 2x render
+DEFAULT_MAX_PIXELS = 1_600_000
+DEFAULT_IMAGE_FORMAT = "jpeg"
+
+# Mean per-pixel channel spread below which a page counts as grayscale
+GRAYSCALE_SPREAD = 6
+# Gray levels kept for text pages; anti-aliased glyphs stay legible and PNG shrinks several-fold
+TEXT_GRAY_LEVELS = 16
+
+# Lossy quality: grayscale scans keep more detail, colour photos of documents less
+QUALITY = {"text": 85, "photo": 75}
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif", "BMP": "image/bmp"}
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+
+
+def mime_type_of(image_bytes: bytes) -> str:
+    """MIME type from the image's own header, not its filename"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return MIME_TYPES.get(image.format, "application/octet-stream")
+
+
+def fit_zoom(width: float, height: float, max_pixels: int, max_zoom: float = 2.0) -> float:
+    """Largest zoom up to max_zoom that keeps a width x height page within max_pixels"""
+    if width <= 0 or height <= 0:
+        return max_zoom
+    return min(max_zoom, math.sqrt(max_pixels / (width * height)))
+
+
+def is_grayscale(image: Image.Image) -> bool:
+    sample = image.convert("RGB")
+    sample.thumbnail((128, 128))
+    pixels = list(sample.getdata())
+    spread = sum(max(p) - min(p) for p in pixels) / max(len(pixels), 1)
+    return spread < GRAYSCALE_SPREAD
+
+
+def prepare_image(image_bytes: bytes, max_pixels: int = DEFAULT_MAX_PIXELS,
+                  image_format: str = DEFAULT_IMAGE_FORMAT) -> PreparedImage:
+    """Downscale to the pixel budget, drop colour from text-only pages and pick the encoding by content"""
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white; OCR models read black on white best
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+
+        if image.width * image.height > max_pixels:
+            scale = math.sqrt(max_pixels / (image.width * image.height))
+            image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                                 Image.Resampling.LANCZOS)
+
+        grayscale = is_grayscale(image)
+        image = image.convert("L" if grayscale else "RGB")
+
+        lossy_format = "WEBP" if image_format.lower() == "webp" else "JPEG"
+        lossy = io.BytesIO()
+        image.save(lossy, format=lossy_format, quality=QUALITY["text" if grayscale else "photo"], optimize=True)
+        data, pil_format = lossy.getvalue(), lossy_format
+        if grayscale:
+            # Rendered text compresses far better as a few gray levels than as JPEG; noisy scans the other way round
+            lossless = io.BytesIO()
+            image.quantize(TEXT_GRAY_LEVELS).save(lossless, format="PNG", optimize=True)
+            if len(lossless.getvalue()) < len(data):
+                data, pil_format = lossless.getvalue(), "PNG"
+
+        if len(data) >= len(image_bytes) and source.format in MIME_TYPES and image.size == source.size:
+            # Already small and within budget: keep the original bytes
+            return PreparedImage(image_bytes, MIME_TYPES[source.format], source.width, source.height, len(image_bytes))
+        return PreparedImage(data, MIME_TYPES[pil_format], image.width, image.height, len(image_bytes))
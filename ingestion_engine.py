@@ -0,0 +1,214 @@
+"""
+Asyncio ingestion engine for vision OCR: HTTP/2 client, global and per-tenant
+concurrency limits, AIMD backpressure on 429s and page-ordered results
+"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import httpx
+
+from watsonx_client import BACKOFF_CAP, MAX_RETRIES, RETRY_STATUSES, IAMTokenManager, backoff_delay, retry_after_seconds
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TENANT_CONCURRENCY = 4
+# Seconds: vision OCR of a dense page can take a while to come back
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 120
+
+
+class AdaptiveLimit:
+    """Concurrency limit that halves on 429 and grows back by one per window of successes (AIMD)"""
+
+    # A burst of 429s from requests sent under the old limit counts as one signal
+    DECREASE_COOLDOWN = 1.0
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._decreased_at = 0.0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self.limit < self.maximum and self._successes >= self.limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttled(self):
+        now = time.monotonic()
+        if now - self._decreased_at < self.DECREASE_COOLDOWN:
+            return
+        self._decreased_at = now
+        self.limit = max(self.minimum, self.limit // 2)
+        self._successes = 0
+
+
+class IngestionJob:
+    """Handle for one document's OCR; result() returns page texts in page order"""
+
+    def __init__(self, future: concurrent.futures.Future, total: Optional[int]):
+        self.future = future
+        self.total = total
+        self.completed = 0
+        # Per page, in page order once done: request size and vision latency
+        self.page_stats: Dict[int, Dict[str, float]] = {}
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> List[str]:
+        return self.future.result(timeout)
+
+
+class IngestionEngine:
+    """Runs OCR requests on a private event loop thread.
+
+    Each job pulls request bodies lazily from an iterator, so only as many
+    rendered pages are held in memory as the tenant may have in flight. The
+    global limit adapts to 429s from Watsonx; the per-tenant limit keeps one
+    large upload from starving other sessions.
+    """
+
+    def __init__(self, url: str, token_manager: IAMTokenManager,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 tenant_concurrency: int = DEFAULT_TENANT_CONCURRENCY,
+                 http2: bool = True, max_retries: int = MAX_RETRIES):
+        self.url = url
+        self.token_manager = token_manager
+        self.max_concurrency = max_concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.max_retries = max_retries
+        self._tenants: Dict[str, List] = {}  # tenant -> [semaphore, active job count]
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ingestion-engine", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(http2), self._loop).result()
+
+    async def _setup(self, http2: bool):
+        self.limit = AdaptiveLimit(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+        )
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def submit(self, tenant_id: str, bodies: Iterable[Dict], total: Optional[int] = None) -> IngestionJob:
+        """Queue one document's page requests without blocking the caller"""
+        future = concurrent.futures.Future()
+        job = IngestionJob(future, total)
+
+        def start():
+            task = self._loop.create_task(self._run(tenant_id, iter(bodies), job))
+            task.add_done_callback(lambda t: future.set_exception(t.exception()) if t.exception()
+                                   else future.set_result(t.result()))
+
+        self._loop.call_soon_threadsafe(start)
+        return job
+
+    def ocr_pages(self, tenant_id: str, bodies: Iterable[Dict]) -> List[str]:
+        return self.submit(tenant_id, bodies).result()
+
+    async def _run(self, tenant_id: str, bodies: Iterator[Dict], job: IngestionJob) -> List[str]:
+        tenant = self._tenants.setdefault(tenant_id, [asyncio.Semaphore(self.tenant_concurrency), 0])
+        tenant[1] += 1
+        results: Dict[int, str] = {}
+        next_page = [0]
+        loop = asyncio.get_running_loop()
+        pull_lock = asyncio.Lock()
+
+        async def pull():
+            # Building a body renders and encodes a page; keep that off the loop thread
+            async with pull_lock:
+                body = await self._loop.run_in_executor(None, next, bodies, None)
+                index = next_page[0]
+                next_page[0] += 1
+                return index, body
+
+        async def worker():
+            while True:
+                async with tenant[0]:
+                    index, body = await pull()
+                    if body is None:
+                        return
+                    started = loop.time()
+                    try:
+                        results[index] = await self._send(body)
+                    except Exception as e:
+                        results[index] = f"Error processing image: {str(e)}"
+                    job.page_stats[index] = {
+                        'request_bytes': len(json.dumps(body)),
+                        'latency_ms': (loop.time() - started) * 1000,
+                    }
+                    job.completed += 1
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.tenant_concurrency)))
+        finally:
+            tenant[1] -= 1
+            if not tenant[1]:
+                del self._tenants[tenant_id]
+        return [results[i] for i in range(len(results))]
+
+    async def _send(self, body: Dict) -> str:
+        refreshed_after_401 = False
+        token = None
+        resp = None
+        for attempt in range(self.max_retries + 1):
+            if token is None:
+                token = await self._loop.run_in_executor(None, self.token_manager.get_token)
+            headers = {"Content-Type": "application/json", "Accept": "application/json",
+                       "Authorization": f"Bearer {token}"}
+            await self.limit.acquire()
+            try:
+                resp = await self._client.post(self.url, headers=headers, json=body)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                resp = None
+            finally:
+                await self.limit.release()
+
+            if resp is None:
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if resp.status_code == 401 and not refreshed_after_401:
+                refreshed_after_401 = True
+                token = await self._loop.run_in_executor(None, self.token_manager.force_refresh, token)
+                continue
+
+            if resp.status_code == 429:
+                self.limit.on_throttled()
+            elif resp.status_code < 500:
+                self.limit.on_success()
+
+            if resp.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            delay = retry_after_seconds(resp)
+            await asyncio.sleep(min(delay, BACKOFF_CAP) if delay is not None else backoff_delay(attempt))
+
+        if resp.status_code != 200:
+            raise Exception(f"{resp.status_code} - {resp.text}")
+        return resp.json()["choices"][0]["message"]["content"]
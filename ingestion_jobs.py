@@ -0,0 +1,235 @@
+"""
+Persistent upload ingestion jobs: SQLite jobs table plus a local worker thread pool
+"""
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from storage import transaction, add_missing_columns
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_WORKERS = 4
+# Seconds between checks for jobs queued by another process (or missed wake-ups)
+POLL_INTERVAL = 2.0
+# Seconds between heartbeats of running jobs, and the silence after which a running job counts as abandoned
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = 60.0
+
+JOB_COLUMNS = ("id", "session_id", "filename", "status", "pages_done", "pages_total",
+               "result", "error", "document_id", "created_at", "updated_at")
+
+
+def init_jobs(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id TEXT PRIMARY KEY,
+            session_id TEXT,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            payload BLOB,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            pages_total INTEGER,
+            result TEXT,
+            error TEXT,
+            document_id TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            heartbeat_at REAL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    add_missing_columns(cursor, "ingestion_jobs", {"heartbeat_at": "REAL"})
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_session ON ingestion_jobs(session_id, created_at)")
+
+
+def enqueue_job(cursor: sqlite3.Cursor, session_id: Optional[str], filename: str, payload: bytes) -> str:
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    cursor.execute('''
+        INSERT INTO ingestion_jobs (id, session_id, filename, status, payload, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (job_id, session_id, filename, QUEUED, payload, now, now))
+    return job_id
+
+
+def claim_next_job(cursor: sqlite3.Cursor) -> Optional[Dict]:
+    """Atomically move the oldest queued job to running and return it with its payload"""
+    now = time.time()
+    cursor.execute('''
+        UPDATE ingestion_jobs SET status = ?, attempts = attempts + 1, heartbeat_at = ?, updated_at = ?
+        WHERE id = (SELECT id FROM ingestion_jobs WHERE status = ? ORDER BY created_at LIMIT 1)
+        RETURNING id, session_id, filename, payload
+    ''', (RUNNING, now, now, QUEUED))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return {'id': row[0], 'session_id': row[1], 'filename': row[2], 'payload': row[3]}
+
+
+def update_progress(cursor: sqlite3.Cursor, job_id: str, pages_done: int, pages_total: Optional[int]):
+    cursor.execute('''
+        UPDATE ingestion_jobs SET pages_done = ?, pages_total = ?, updated_at = ? WHERE id = ?
+    ''', (pages_done, pages_total, time.time(), job_id))
+
+
+def touch_jobs(cursor: sqlite3.Cursor, job_ids: List[str]):
+    """Record that these running jobs are still being worked on"""
+    cursor.executemany("UPDATE ingestion_jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+                       [(time.time(), job_id, RUNNING) for job_id in job_ids])
+
+
+def finish_job(cursor: sqlite3.Cursor, job_id: str, result: str, document_id: Optional[str]):
+    # The upload bytes are no longer needed once the document is stored
+    cursor.execute('''
+        UPDATE ingestion_jobs SET status = ?, result = ?, document_id = ?, payload = NULL, updated_at = ?
+        WHERE id = ?
+    ''', (DONE, result, document_id, time.time(), job_id))
+
+
+def fail_job(cursor: sqlite3.Cursor, job_id: str, error: str):
+    cursor.execute('''
+        UPDATE ingestion_jobs SET status = ?, error = ?, payload = NULL, updated_at = ? WHERE id = ?
+    ''', (FAILED, error, time.time(), job_id))
+
+
+def cancel_job(cursor: sqlite3.Cursor, job_id: str) -> bool:
+    """Drop a job that has not started yet"""
+    cursor.execute("DELETE FROM ingestion_jobs WHERE id = ? AND status = ?", (job_id, QUEUED))
+    return cursor.rowcount > 0
+
+
+def requeue_interrupted_jobs(cursor: sqlite3.Cursor, max_attempts: int = 3, stale_after: float = STALE_AFTER) -> int:
+    """Put running jobs without a heartbeat for stale_after seconds back in the queue; give up after max_attempts.
+
+    Jobs a live worker still beats for are left alone, whichever process runs them.
+    """
+    now = time.time()
+    # Rows from before heartbeats were recorded fall back to their last update
+    stale = "status = ? AND COALESCE(heartbeat_at, updated_at) < ?"
+    cursor.execute(f'''
+        UPDATE ingestion_jobs SET status = ?, error = 'Interrupted too many times', payload = NULL, updated_at = ?
+        WHERE {stale} AND attempts >= ?
+    ''', (FAILED, now, RUNNING, now - stale_after, max_attempts))
+    cursor.execute(f'''
+        UPDATE ingestion_jobs SET status = ?, pages_done = 0, heartbeat_at = NULL, updated_at = ? WHERE {stale}
+    ''', (QUEUED, now, RUNNING, now - stale_after))
+    return cursor.rowcount
+
+
+def list_jobs(cursor: sqlite3.Cursor, session_id: Optional[str], limit: int = 50) -> List[Dict]:
+    """Most recent jobs of a session, newest first, without payloads"""
+    cursor.execute(f'''
+        SELECT {", ".join(JOB_COLUMNS)} FROM ingestion_jobs
+        WHERE session_id IS ? ORDER BY created_at DESC LIMIT ?
+    ''', (session_id, limit))
+    return [dict(zip(JOB_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+class JobWorkerPool:
+    """Worker threads that claim queued jobs and run handler(job, report_progress) on them.
+
+    The handler returns (result_text, document_id); an exception fails the job.
+    A heartbeat thread marks the pool's running jobs as alive and requeues
+    running jobs whose heartbeat stopped, i.e. those of a crashed or restarted process.
+    """
+
+    def __init__(self, db_path: str, handler: Callable, workers: int = DEFAULT_WORKERS,
+                 poll_interval: float = POLL_INTERVAL, heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 stale_after: float = STALE_AFTER):
+        self.db_path = db_path
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running = set()
+        self._running_lock = threading.Lock()
+
+        with transaction(db_path) as cursor:
+            init_jobs(cursor)
+            requeue_interrupted_jobs(cursor, stale_after=stale_after)
+
+        self._threads = [
+            threading.Thread(target=self._work, name=f"ingestion-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="ingestion-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, session_id: Optional[str], filename: str, payload: bytes) -> str:
+        """Queue an upload and wake a worker; returns the job id"""
+        with transaction(self.db_path) as cursor:
+            job_id = enqueue_job(cursor, session_id, filename, payload)
+        self._wake.set()
+        return job_id
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _claim(self) -> Optional[Dict]:
+        try:
+            with transaction(self.db_path) as cursor:
+                return claim_next_job(cursor)
+        except sqlite3.OperationalError:
+            # Database busy beyond the timeout: try again on the next poll rather than losing the worker
+            logger.exception("Could not claim an ingestion job")
+            return None
+
+    def _record(self, update: Callable, *args):
+        with transaction(self.db_path) as cursor:
+            update(cursor, *args)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._running_lock:
+                running = list(self._running)
+            try:
+                with transaction(self.db_path) as cursor:
+                    touch_jobs(cursor, running)
+                    requeued = requeue_interrupted_jobs(cursor, stale_after=self.stale_after)
+            except sqlite3.OperationalError:
+                # A missed beat is made up by the next one, well within stale_after
+                logger.exception("Could not record the ingestion job heartbeat")
+                continue
+            if requeued:
+                self._wake.set()
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            # Another worker may be idle while more jobs wait
+            self._wake.set()
+            with self._running_lock:
+                self._running.add(job['id'])
+
+            def report_progress(pages_done: int, pages_total: Optional[int], job_id=job['id']):
+                self._record(update_progress, job_id, pages_done, pages_total)
+
+            try:
+                result, document_id = self.handler(job, report_progress)
+            except Exception as e:
+                logger.exception("Ingestion job %s (%s) failed", job['id'], job['filename'])
+                self._record(fail_job, job['id'], str(e))
+            else:
+                self._record(finish_job, job['id'], result, document_id)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job['id'])
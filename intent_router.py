@@ -0,0 +1,200 @@
+"""
+Local intent routing in front of the chat model: glossary lookups and loan arithmetic are
+answered in-process, everything else goes to retrieval and Watsonx
+"""
+import re
+import sqlite3
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from loan_calculator import run_tool, MAX_TERM_MONTHS
+
+GLOSSARY = "glossary"
+CALCULATOR = "calculator"
+MODEL = "model"
+ROUTES = (GLOSSARY, CALCULATOR, MODEL)
+
+DEFAULT_GLOSSARY_PATH = "documents/loan-glossary-terms.txt"
+
+# "**Term (ABBR)**: definition" entries in the glossary guide
+GLOSSARY_ENTRY = re.compile(r"^\*\*\s*(?P<term>[^*]+?)\s*\*\*:\s*(?P<definition>.+)$", re.MULTILINE)
+# A bare definition question; anything after the term ("...for a mortgage") means it is not a pure lookup
+DEFINITION_QUESTION = re.compile(
+    r"^(?:(?:what|who)(?: is| are| does)|define|definition of|meaning of|explain|what do you mean by)\s+"
+    r"(?:an?\s+|the\s+)?(?P<term>[\w\s'/-]+?)(?:\s+mean|\s+stand for)?$"
+)
+
+AMOUNT = re.compile(r"\$\s*(?P<number>\d[\d,]*(?:\.\d+)?)\s*(?P<scale>k|thousand|m|million)?\b"
+                    r"|\b(?P<bare>\d[\d,]*(?:\.\d+)?)\s*(?P<bare_scale>k|thousand|million)\b", re.IGNORECASE)
+RATE = re.compile(r"(?P<number>\d+(?:\.\d+)?)\s*(?:%|percent\b)", re.IGNORECASE)
+TERM = re.compile(r"(?P<number>\d+)[\s-]*(?P<unit>years?|yrs?|months?|mos?)\b", re.IGNORECASE)
+EXTRA = re.compile(r"(?:extra|additional)\s+(?P<before>\$\s*\d[\d,]*(?:\.\d+)?)"
+                   r"|(?P<after>\$\s*\d[\d,]*(?:\.\d+)?)\s+(?:extra|additional|more)", re.IGNORECASE)
+PAYMENT_WORDS = re.compile(r"\b(payments?|pay|paying|paid off|monthly|cost|interest|how much|calculate|afford|payoff)\b",
+                           re.IGNORECASE)
+INTEREST_ONLY = re.compile(r"\binterest[\s-]only\b", re.IGNORECASE)
+# Questions asking for judgement rather than arithmetic stay with the model
+ADVICE_WORDS = re.compile(r"\b(should|recommend|worth|better|best|why|advice|advise|good idea|qualify|approved?)\b",
+                          re.IGNORECASE)
+
+# Questions about part of the term ("in the first year", "after 12 payments", "how much is left") need an
+# amortization schedule or the payments already made; the full-term figures below would answer the wrong question
+PARTIAL_TERM = re.compile(
+    r"\b(?:first|second|third|fourth|fifth|last|final|next|\d+(?:st|nd|rd|th))\s+(?:\d+\s+)?(?:years?|months?|payments?)\b"
+    r"|\b(?:in|during|by|through|until)\s+(?:year|month)\s+\d+"
+    r"|\b(?:after|made|paid)\s+\d+\s*(?:years?|months?|payments?)?"
+    r"|\b(?:already|so far|remain\w*|left|still owe|outstanding|halfway)\b",
+    re.IGNORECASE,
+)
+
+SCALES = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6}
+
+
+class Route(NamedTuple):
+    kind: str
+    # Finished answer for local routes, None for MODEL
+    answer: Optional[str] = None
+    # Glossary term or calculator tool that produced the answer
+    detail: str = ""
+
+
+def normalize_term(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s/-]", " ", text.lower()).split())
+
+
+class GlossaryIndex:
+    """Glossary terms, their abbreviations and singular/plural forms mapped to definitions"""
+
+    def __init__(self, text: str, source: str = ""):
+        self.source = source
+        self.entries: Dict[str, Tuple[str, str]] = {}
+        for match in GLOSSARY_ENTRY.finditer(text):
+            term, definition = match.group("term"), match.group("definition").strip()
+            # "Annual Percentage Rate (APR)" is found by the full name, by "APR" and by both together
+            names = [term]
+            abbreviation = re.search(r"\(([^)]+)\)", term)
+            if abbreviation:
+                names += [term[:abbreviation.start()], abbreviation.group(1)]
+            for name in names:
+                key = normalize_term(name)
+                if key:
+                    self.entries.setdefault(key, (term, definition))
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_GLOSSARY_PATH) -> "GlossaryIndex":
+        """Index the glossary guide, or an empty index when it is missing"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(f.read(), source=path.replace("\\", "/").rsplit("/", 1)[-1])
+        except OSError:
+            return cls("")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, term: str) -> Optional[Tuple[str, str]]:
+        key = normalize_term(term)
+        for candidate in (key, key[:-1] if key.endswith("s") else None, key[:-2] if key.endswith("es") else None):
+            if candidate and candidate in self.entries:
+                return self.entries[candidate]
+        return None
+
+
+def glossary_route(question: str, glossary: GlossaryIndex) -> Optional[Route]:
+    question = re.sub(r"\b(what|who)['’]s\b", r"\1 is", question, flags=re.IGNORECASE)
+    match = DEFINITION_QUESTION.match(normalize_term(question))
+    if not match:
+        return None
+    entry = glossary.lookup(match.group("term"))
+    if entry is None:
+        return None
+    term, definition = entry
+    answer = f"**{term}**: {definition}"
+    if glossary.source:
+        answer += f"\n\n_Source: {glossary.source}_"
+    return Route(GLOSSARY, answer, term)
+
+
+def parse_amount(match: re.Match) -> float:
+    number = match.group("number") or match.group("bare")
+    scale = (match.group("scale") or match.group("bare_scale") or "").lower()
+    return float(number.replace(",", "")) * SCALES.get(scale, 1.0)
+
+
+def money(value: float) -> str:
+    return f"${value:,.2f}"
+
+
+def calculator_route(question: str) -> Optional[Route]:
+    """Answer a payment, total-interest or extra-payment question whose numbers are all in the question"""
+    if ADVICE_WORDS.search(question) or PARTIAL_TERM.search(question) or not PAYMENT_WORDS.search(question):
+        return None
+    text = question
+    extra = EXTRA.search(text)
+    extra_payment = None
+    if extra:
+        extra_payment = float(re.sub(r"[$,\s]", "", extra.group("before") or extra.group("after")))
+        text = text[:extra.start()] + " " + text[extra.end():]
+    amounts = [parse_amount(m) for m in AMOUNT.finditer(text)]
+    rates = [float(m.group("number")) for m in RATE.finditer(text)]
+    terms = [int(m.group("number")) * (12 if m.group("unit").lower().startswith("y") else 1) for m in TERM.finditer(text)]
+    # Exactly one of each, so "compare 5% and 6%" or a missing term goes to the model
+    if len(amounts) != 1 or len(rates) != 1 or len(terms) > 1 or not 0 <= rates[0] < 100:
+        return None
+    principal, rate = amounts[0], rates[0]
+    loan = f"{money(principal)} at {rate:g}%"
+
+    if INTEREST_ONLY.search(question) and not terms:
+        result = run_tool("interest_only_payment", {"principal": principal, "annual_rate": rate})
+        return Route(CALCULATOR, f"The interest-only payment on {loan} is **{money(result['monthly_payment'])}** per month.",
+                     "interest_only_payment")
+    if len(terms) != 1 or not 0 < terms[0] <= MAX_TERM_MONTHS:
+        return None
+    months = terms[0]
+    loan += f" over {months} months"
+    if extra_payment is not None:
+        result = run_tool("payoff_with_extra_payments", {"principal": principal, "annual_rate": rate, "months": months,
+                                                          "extra_payment": extra_payment})
+        answer = (f"Paying {money(extra_payment)} extra each month on {loan} ({money(result['payment'])} in total) "
+                  f"pays it off in **{int(result['payoff_months'])} months**, {int(result['months_saved'])} months early, "
+                  f"and saves **{money(result['interest_saved'])}** in interest.")
+        return Route(CALCULATOR, answer, "payoff_with_extra_payments")
+    result = run_tool("loan_payment", {"principal": principal, "annual_rate": rate, "months": months})
+    answer = (f"The monthly payment on {loan} is **{money(result['monthly_payment'])}**. "
+              f"Over the full term you would pay {money(result['total_paid'])}, "
+              f"of which **{money(result['total_interest'])}** is interest.")
+    return Route(CALCULATOR, answer, "loan_payment")
+
+
+def route_question(question: str, glossary: GlossaryIndex) -> Route:
+    """Pick the cheapest route that can answer the question exactly"""
+    question = question.strip()
+    return glossary_route(question, glossary) or calculator_route(question) or Route(MODEL)
+
+
+def init_route_stats(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS route_stats (
+            route TEXT PRIMARY KEY,
+            requests INTEGER NOT NULL,
+            total_ms REAL NOT NULL
+        )
+    ''')
+    cursor.executemany("INSERT OR IGNORE INTO route_stats (route, requests, total_ms) VALUES (?, 0, 0)",
+                       [(route,) for route in ROUTES])
+
+
+def record_route(cursor: sqlite3.Cursor, route: str, elapsed_ms: float):
+    cursor.execute("UPDATE route_stats SET requests = requests + 1, total_ms = total_ms + ? WHERE route = ?",
+                   (elapsed_ms, route))
+
+
+def route_stats(cursor: sqlite3.Cursor) -> Dict[str, Dict[str, float]]:
+    """Requests and mean latency per route; local routes also report time saved against the mean model answer"""
+    cursor.execute("SELECT route, requests, total_ms FROM route_stats")
+    stats = {route: {'requests': requests, 'mean_ms': total_ms / requests if requests else 0.0}
+             for route, requests, total_ms in cursor.fetchall()}
+    model_ms = stats.get(MODEL, {}).get('mean_ms', 0.0)
+    for route, entry in stats.items():
+        if route != MODEL:
+            entry['saved_ms'] = entry['requests'] * max(0.0, model_ms - entry['mean_ms'])
+    return stats
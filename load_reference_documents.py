@@ -2,97 +2,236 @@
 """
 Load all loan documents from the /documents directory into the RAG database
 """
+import argparse
 import os
 import sqlite3
 import json
-import uuid
 import hashlib
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from storage import connect, transaction, init_document_tables, SOURCE_REFERENCE
+from chunking import CHUNKER_VERSION, chunk_document, chunk_id
+from bm25_index import init_bm25_index, remove_document, add_tokenized_chunks, tokenize
+from fts_index import init_fts_index, rebuild_fts_index
+from vector_store import open_vector_store, backfill_vectors
+from retrieval_cache import init_corpus_versions, bump_corpus_version
+from answer_cache import init_answer_cache, invalidate_documents, invalidate_scope, SHARED_SCOPE
 
 # Database configuration
 DB_PATH = "document_index/documents.db"
 DOCUMENTS_DIR = "documents"
 
-def chunk_text_content(text: str, chunk_size: int = 500, overlap: int = 50):
-    """Simple text chunking with overlap"""
-    chunks = []
-    words = text.split()
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk_words = words[i:i + chunk_size]
-        chunk_text = " ".join(chunk_words)
-        chunks.append((chunk_text, i // chunk_size))
-    
-    return chunks
+# On top of the storage pragmas: a bigger page cache for one large write transaction
+BULK_PRAGMAS = (
+    "PRAGMA cache_size = -64000",
+)
+# Chunks whose BM25 postings are written together, so shared terms get one doc_freq update per batch
+INDEX_BATCH_CHUNKS = 5000
 
 def compute_content_hash(content: str) -> str:
     """Compute hash of content for duplicate detection"""
     return hashlib.md5(content.encode()).hexdigest()
 
-def load_documents():
-    """Load all documents from the /documents directory"""
-    conn = sqlite3.connect(DB_PATH)
+def init_reference_manifest(cursor: sqlite3.Cursor):
+    # Last loaded state of each file, so unchanged files are skipped without being read
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reference_files (
+            filename TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            file_hash TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            chunker TEXT
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(reference_files)")
+    if "chunker" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE reference_files ADD COLUMN chunker TEXT")
+
+def remember_file(cursor: sqlite3.Cursor, stat: os.stat_result, document: Dict):
+    cursor.execute('''
+        INSERT OR REPLACE INTO reference_files (filename, mtime_ns, size, file_hash, document_id, chunker)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (document['filename'], stat.st_mtime_ns, stat.st_size, document['file_hash'], document['doc_id'],
+          CHUNKER_VERSION))
+
+def prepare_document(file_path: str) -> Optional[Dict]:
+    """Read, hash, chunk and tokenize one guide; runs in a worker process"""
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        content = f.read()
+    if not content.strip():
+        return None
+
+    filename = os.path.basename(file_path)
+    doc_id = f"ref_{filename.replace('.txt', '')}"
+    chunks = [(chunk_id(doc_id, chunk.index), chunk) for chunk in chunk_document(content)]
+    return {
+        'filename': filename,
+        'doc_id': doc_id,
+        'content': content,
+        'file_hash': compute_content_hash(content),
+        'chunks': chunks,
+        'term_counts': [(chunk_key, Counter(tokenize(chunk.text))) for chunk_key, chunk in chunks],
+    }
+
+def scan_documents(cursor: sqlite3.Cursor, documents_dir: str, force: bool) -> Tuple[List[Tuple[str, os.stat_result]], int]:
+    """(path, stat) of files whose size or mtime changed since the last load, plus the number skipped"""
+    # Files chunked by another chunker version are reloaded even when untouched
+    cursor.execute("SELECT filename, mtime_ns, size FROM reference_files WHERE chunker = ?", (CHUNKER_VERSION,))
+    known = {filename: (mtime_ns, size) for filename, mtime_ns, size in cursor.fetchall()}
+    changed = []
+    skipped = 0
+    for filename in sorted(os.listdir(documents_dir)):
+        if not filename.endswith('.txt'):
+            continue
+        file_path = os.path.join(documents_dir, filename)
+        stat = os.stat(file_path)
+        if not force and known.get(filename) == (stat.st_mtime_ns, stat.st_size):
+            skipped += 1
+            continue
+        changed.append((file_path, stat))
+    return changed, skipped
+
+def sync_vectors(cursor: sqlite3.Cursor, index_dir: str):
+    """Bring the dense vector store, if the app has built one, in step with the chunks table"""
+    store = open_vector_store(index_dir)
+    if store is None:
+        return
+    try:
+        embedded = backfill_vectors(cursor, store)
+        print(f"OK Embedded {embedded} chunks into the vector store")
+    except Exception as e:
+        # Vectors of removed chunks are dropped before embedding starts; the app embeds the rest on its next start
+        print(f"WARNING Vector store not fully updated: {str(e)}")
+
+def load_documents(documents_dir: str = DOCUMENTS_DIR, db_path: str = DB_PATH,
+                   workers: Optional[int] = None, force: bool = False):
+    """Load new and changed documents from the /documents directory in one transaction"""
+    start = time.perf_counter()
+    # Tables and migrations in one transaction, so a crash midway leaves the old schema intact
+    with transaction(db_path, immediate=True) as cursor:
+        init_document_tables(cursor)
+        init_bm25_index(cursor)
+        # The triggers keep FTS in step with the chunks written below
+        if init_fts_index(cursor):
+            rebuild_fts_index(cursor)
+        init_corpus_versions(cursor)
+        init_answer_cache(cursor)
+        init_reference_manifest(cursor)
+
+    conn = connect(db_path)
+    conn.isolation_level = None
     cursor = conn.cursor()
-    
-    loaded_count = 0
+    for pragma in BULK_PRAGMAS:
+        cursor.execute(pragma)
+
+    present = {name for name in os.listdir(documents_dir) if name.endswith('.txt')}
+    changed, skipped = scan_documents(cursor, documents_dir, force)
+    cursor.execute("SELECT filename, file_hash FROM reference_files WHERE chunker = ?", (CHUNKER_VERSION,))
+    known_hashes = dict(cursor.fetchall())
+
     processed_files = []
-    
-    # Get list of .txt files in documents directory
-    for filename in os.listdir(DOCUMENTS_DIR):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(DOCUMENTS_DIR, filename)
-            
-            try:
-                # Read file content
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                
-                if not content.strip():
+    changed_doc_ids = []
+    total_chunks = 0
+    total_bytes = 0
+    pending_terms = []
+
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(prepare_document, file_path) for file_path, _ in changed]
+            for (file_path, stat), future in zip(changed, futures):
+                filename = os.path.basename(file_path)
+                try:
+                    document = future.result()
+                except Exception as e:
+                    print(f"ERROR Error loading {filename}: {str(e)}")
                     continue
-                
-                # Generate document ID
-                doc_id = f"ref_{filename.replace('.txt', '')}"
-                
-                # Read metadata if available
-                metadata = {"source": "reference_library", "file_type": "loan_guide"}
-                
-                # Store document
-                file_hash = compute_content_hash(content)
-                metadata_json = json.dumps(metadata)
-                
+                if document is None:
+                    continue
+                total_bytes += stat.st_size
+
+                if not force and known_hashes.get(filename) == document['file_hash']:
+                    # Touched but identical: only remember the new mtime
+                    remember_file(cursor, stat, document)
+                    skipped += 1
+                    continue
+
+                doc_id = document['doc_id']
+                metadata_json = json.dumps({"source": "reference_library", "file_type": "loan_guide"})
+                remove_document(cursor, doc_id)
+                cursor.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
                 cursor.execute('''
-                    INSERT OR REPLACE INTO documents 
-                    (id, filename, content, content_type, file_hash, metadata, session_id)
+                    INSERT OR REPLACE INTO documents
+                    (id, filename, content, content_type, file_hash, metadata, session_id, source)
+                    VALUES (?, ?, ?, ?, ?, ?, NULL, ?)
+                ''', (doc_id, filename, document['content'], 'text', document['file_hash'], metadata_json,
+                      SOURCE_REFERENCE))
+                cursor.executemany('''
+                    INSERT INTO chunks (id, document_id, chunk_text, chunk_index, char_start, char_end, session_id)
                     VALUES (?, ?, ?, ?, ?, ?, NULL)
-                ''', (doc_id, filename, content, 'text', file_hash, metadata_json))
-                
-                # Chunk and store content
-                chunks = chunk_text_content(content)
-                for chunk_text, chunk_index in chunks:
-                    chunk_id = f"{doc_id}_chunk_{chunk_index}"
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO chunks 
-                        (id, document_id, chunk_text, chunk_index)
-                        VALUES (?, ?, ?, ?)
-                    ''', (chunk_id, doc_id, chunk_text, chunk_index))
-                
+                ''', [(chunk_key, doc_id, chunk.text, chunk.index, chunk.start, chunk.end)
+                      for chunk_key, chunk in document['chunks']])
+                pending_terms.extend(document['term_counts'])
+                if len(pending_terms) >= INDEX_BATCH_CHUNKS:
+                    add_tokenized_chunks(cursor, pending_terms)
+                    pending_terms = []
+                remember_file(cursor, stat, document)
+
+                changed_doc_ids.append(doc_id)
                 processed_files.append(filename)
-                loaded_count += 1
-                
-                print(f"OK Loaded: {filename} ({len(content)} characters, {len(chunks)} chunks)")
-                
-            except Exception as e:
-                print(f"ERROR Error loading {filename}: {str(e)}")
-                continue
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"\n[SUCCESS] Successfully loaded {loaded_count} documents into the reference library")
+                total_chunks += len(document['chunks'])
+                print(f"OK Loaded: {filename} ({len(document['content'])} characters, {len(document['chunks'])} chunks)")
+        add_tokenized_chunks(cursor, pending_terms)
+
+        # Guides deleted from the directory leave the library too
+        removed = [(filename, doc_id) for filename, doc_id in
+                   cursor.execute("SELECT filename, document_id FROM reference_files").fetchall()
+                   if filename not in present]
+        for filename, doc_id in removed:
+            remove_document(cursor, doc_id)
+            cursor.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+            cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            cursor.execute("DELETE FROM reference_files WHERE filename = ?", (filename,))
+            changed_doc_ids.append(doc_id)
+            print(f"OK Removed: {filename}")
+
+        if changed_doc_ids:
+            invalidate_documents(cursor, changed_doc_ids)
+            # Shared answers reused as near hits may miss a guide that was just added
+            invalidate_scope(cursor, SHARED_SCOPE)
+            # Reference chunks changed, so running apps must reload the shared cache
+            bump_corpus_version(cursor, None)
+        cursor.execute("COMMIT")
+        if changed_doc_ids:
+            sync_vectors(cursor, os.path.dirname(db_path))
+    except BaseException:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    megabytes = total_bytes / (1024 * 1024)
+    print(f"\n[SUCCESS] Loaded {len(processed_files)} documents into the reference library "
+          f"({skipped} unchanged, {len(removed)} removed)")
+    print(f"Scanned {len(present)} files, {total_chunks} chunks, {megabytes:.1f} MB in {elapsed:.2f}s: "
+          f"{len(changed) / elapsed:.0f} files/s, {total_chunks / elapsed:.0f} chunks/s, {megabytes / elapsed:.2f} MB/s")
     return processed_files
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load loan reference guides into the RAG database")
+    parser.add_argument("--dir", default=DOCUMENTS_DIR, help="directory of .txt guides")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database to load into")
+    parser.add_argument("--workers", type=int, default=None, help="parsing processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="reload every file even if unchanged")
+    args = parser.parse_args()
+
     print("Loading loan reference documents...")
-    files = load_documents()
+    files = load_documents(args.dir, args.db, args.workers, args.force)
     print(f"\nTotal files processed: {len(files)}")
     for file in files:
-        print(f"  - {file}")
\ No newline at end of file
+        print(f"  - {file}")
@@ -0,0 +1,281 @@
+"""
+Vectorized loan calculations (formulas from documents/loan-calculators-formulas.txt) and their chat tool definitions.
+
+Every function broadcasts over NumPy arrays, so one call can evaluate a grid of
+principal / rate / term scenarios. Rates are annual percentages (6.5 means 6.5%),
+terms are in months and payments are monthly.
+"""
+import json
+from typing import Dict, List
+
+import numpy as np
+
+# Bisection steps for APR; halves a 0-100% bracket to far below a hundredth of a basis point
+APR_ITERATIONS = 60
+# Largest scenario grid a single tool call may evaluate
+MAX_SCENARIOS = 10000
+# Scenarios returned to the model in full; larger grids are summarized
+MAX_RETURNED_SCENARIOS = 50
+# Longest loan term accepted, in months (100 years); an amortization schedule has one row per month
+MAX_TERM_MONTHS = 1200
+TERM_ARGUMENTS = ("months", "remaining_months", "new_months")
+
+
+def monthly_rate(annual_rate) -> np.ndarray:
+    return np.asarray(annual_rate, dtype=np.float64) / 1200.0
+
+
+def monthly_payment(principal, annual_rate, months) -> np.ndarray:
+    """Standard amortization: M = P r (1+r)^n / ((1+r)^n - 1), or P / n at 0%"""
+    principal = np.asarray(principal, dtype=np.float64)
+    months = np.asarray(months, dtype=np.float64)
+    r = monthly_rate(annual_rate)
+    growth = np.power(1.0 + r, months)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = principal * r * growth / (growth - 1.0)
+    return np.where(r == 0, principal / months, amortized)
+
+
+def interest_only_payment(principal, annual_rate) -> np.ndarray:
+    return np.asarray(principal, dtype=np.float64) * monthly_rate(annual_rate)
+
+
+def remaining_balance(principal, annual_rate, months, payments_made, payment=None) -> np.ndarray:
+    """Balance after payments_made payments: B = P(1+r)^k - M((1+r)^k - 1)/r, floored at zero"""
+    principal = np.asarray(principal, dtype=np.float64)
+    k = np.asarray(payments_made, dtype=np.float64)
+    r = monthly_rate(annual_rate)
+    if payment is None:
+        payment = monthly_payment(principal, annual_rate, months)
+    growth = np.power(1.0 + r, k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        balance = principal * growth - payment * (growth - 1.0) / r
+    balance = np.where(r == 0, principal - payment * k, balance)
+    return np.maximum(balance, 0.0)
+
+
+def total_interest(principal, annual_rate, months) -> np.ndarray:
+    """(M x n) - P"""
+    return monthly_payment(principal, annual_rate, months) * np.asarray(months, dtype=np.float64) - principal
+
+
+def payoff_with_extra(principal, annual_rate, months, extra_payment) -> Dict[str, np.ndarray]:
+    """Months to payoff, total interest and interest saved when paying extra_payment on top of the scheduled payment"""
+    principal = np.asarray(principal, dtype=np.float64)
+    r = monthly_rate(annual_rate)
+    scheduled = monthly_payment(principal, annual_rate, months)
+    payment = scheduled + np.asarray(extra_payment, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exact = -np.log1p(-r * principal / payment) / np.log1p(r)
+    exact = np.where(r == 0, principal / payment, exact)
+    # Round before ceil so float noise on an exact payoff month does not add a month
+    payoff_months = np.ceil(np.round(exact, 9))
+    # The last payment only clears what is left after the full ones
+    balance_before_last = remaining_balance(principal, annual_rate, months, payoff_months - 1, payment)
+    total_paid = payment * (payoff_months - 1) + balance_before_last * (1.0 + r)
+    interest = total_paid - principal
+    return {
+        'payment': payment,
+        'payoff_months': payoff_months,
+        'total_interest': interest,
+        'interest_saved': total_interest(principal, annual_rate, months) - interest,
+        'months_saved': np.asarray(months, dtype=np.float64) - payoff_months,
+    }
+
+
+def apr_with_fees(principal, annual_rate, months, fees) -> np.ndarray:
+    """APR: the annual rate at which the scheduled payments repay only the amount received (principal - fees)"""
+    principal = np.asarray(principal, dtype=np.float64)
+    months = np.asarray(months, dtype=np.float64)
+    payment = monthly_payment(principal, annual_rate, months)
+    received = principal - np.asarray(fees, dtype=np.float64)
+    shape = np.broadcast(payment, received, months).shape
+    low = np.zeros(shape)
+    high = np.full(shape, 1.0)  # 1200% APR
+    for _ in range(APR_ITERATIONS):
+        mid = (low + high) / 2.0
+        # Present value of the payments falls as the rate rises
+        present_value = payment * (1.0 - np.power(1.0 + mid, -months)) / mid
+        too_low = present_value > received
+        low = np.where(too_low, mid, low)
+        high = np.where(too_low, high, mid)
+    return (low + high) / 2.0 * 1200.0
+
+
+def refinance_break_even(balance, current_rate, remaining_months, new_rate, new_months,
+                         closing_costs) -> Dict[str, np.ndarray]:
+    """Monthly savings, months until they repay closing costs, and the change in remaining interest"""
+    balance = np.asarray(balance, dtype=np.float64)
+    current_payment = monthly_payment(balance, current_rate, remaining_months)
+    new_payment = monthly_payment(balance, new_rate, new_months)
+    savings = current_payment - new_payment
+    with np.errstate(divide="ignore", invalid="ignore"):
+        break_even = np.where(savings > 0, np.ceil(np.asarray(closing_costs, dtype=np.float64) / savings), np.inf)
+    return {
+        'current_payment': current_payment,
+        'new_payment': new_payment,
+        'monthly_savings': savings,
+        'break_even_months': break_even,
+        'interest_change': (total_interest(balance, new_rate, new_months)
+                            - total_interest(balance, current_rate, remaining_months) + closing_costs),
+    }
+
+
+def amortization_schedule(principal: float, annual_rate: float, months: int, extra_payment: float = 0.0) -> Dict[str, np.ndarray]:
+    """Per-payment interest, principal and balance for one loan, computed in closed form rather than a loop"""
+    payment = float(monthly_payment(principal, annual_rate, months)) + extra_payment
+    r = float(monthly_rate(annual_rate))
+    payoff_months = int(payoff_with_extra(principal, annual_rate, months, extra_payment)['payoff_months'])
+    number = np.arange(1, payoff_months + 1)
+    opening = remaining_balance(principal, annual_rate, months, number - 1, payment)
+    interest = opening * r
+    principal_paid = np.minimum(payment - interest, opening)
+    return {
+        'payment_number': number,
+        'payment': principal_paid + interest,
+        'interest': interest,
+        'principal': principal_paid,
+        'balance': opening - principal_paid,
+    }
+
+
+def yearly_summary(schedule: Dict[str, np.ndarray]) -> List[Dict]:
+    """Interest and principal paid per loan year, with the balance at year end"""
+    years = (schedule['payment_number'] - 1) // 12
+    interest = np.bincount(years, weights=schedule['interest'])
+    principal = np.bincount(years, weights=schedule['principal'])
+    ends = np.minimum(np.arange(1, len(interest) + 1) * 12, len(years)) - 1
+    return [{'year': year + 1, 'interest': round(float(interest[year]), 2),
+             'principal': round(float(principal[year]), 2), 'balance': round(float(schedule['balance'][end]), 2)}
+            for year, end in enumerate(ends)]
+
+
+NUMBER_OR_LIST = {"anyOf": [{"type": "number"}, {"type": "array", "items": {"type": "number"}}]}
+
+
+def _tool(name: str, description: str, properties: Dict[str, str], required: List[str], vectorized: bool = True) -> Dict:
+    schema = NUMBER_OR_LIST if vectorized else {"type": "number"}
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": {key: dict(schema, description=text) for key, text in properties.items()},
+                "required": required,
+            },
+        },
+    }
+
+
+LOAN = {
+    "principal": "Loan amount in dollars",
+    "annual_rate": "Annual interest rate in percent, e.g. 6.5",
+    "months": "Loan term in months",
+}
+
+CALCULATOR_TOOLS = [
+    _tool("loan_payment",
+          "Monthly payment, total paid and total interest of an amortizing loan. "
+          "Pass lists to compare several amounts, rates or terms at once.",
+          LOAN, ["principal", "annual_rate", "months"]),
+    _tool("interest_only_payment", "Monthly payment of an interest-only loan.",
+          {"principal": LOAN["principal"], "annual_rate": LOAN["annual_rate"]}, ["principal", "annual_rate"]),
+    _tool("amortization_schedule",
+          "Year-by-year interest, principal and remaining balance of one loan, optionally with an extra monthly payment.",
+          dict(LOAN, extra_payment="Extra principal paid every month in dollars"),
+          ["principal", "annual_rate", "months"], vectorized=False),
+    _tool("remaining_balance", "Balance left after a number of monthly payments.",
+          dict(LOAN, payments_made="Number of payments already made"),
+          ["principal", "annual_rate", "months", "payments_made"]),
+    _tool("apr_with_fees", "APR of a loan once upfront fees (origination, closing) are counted.",
+          dict(LOAN, fees="Total upfront fees in dollars"), ["principal", "annual_rate", "months", "fees"]),
+    _tool("payoff_with_extra_payments",
+          "How much sooner a loan is paid off, and the interest saved, with an extra monthly payment.",
+          dict(LOAN, extra_payment="Extra principal paid every month in dollars"),
+          ["principal", "annual_rate", "months", "extra_payment"]),
+    _tool("refinance_break_even",
+          "Monthly savings of refinancing and how many months until they cover the closing costs.",
+          {"balance": "Current loan balance in dollars",
+           "current_rate": "Current annual rate in percent",
+           "remaining_months": "Months left on the current loan",
+           "new_rate": "New annual rate in percent",
+           "new_months": "Term of the new loan in months",
+           "closing_costs": "Refinance closing costs in dollars"},
+          ["balance", "current_rate", "remaining_months", "new_rate", "new_months", "closing_costs"]),
+]
+
+
+def _results(inputs: Dict[str, np.ndarray], outputs: Dict[str, np.ndarray]) -> Dict:
+    """Round to cents and lay out one row per scenario"""
+    arrays = np.broadcast_arrays(*inputs.values(), *outputs.values())
+    names = list(inputs) + list(outputs)
+    flat = {name: array.ravel() for name, array in zip(names, arrays)}
+    count = arrays[0].size
+    rows = [{name: (None if not np.isfinite(flat[name][i]) else round(float(flat[name][i]), 2)) for name in names}
+            for i in range(min(count, MAX_RETURNED_SCENARIOS))]
+    if count == 1:
+        return rows[0]
+    result = {'scenarios': count, 'results': rows}
+    if count > MAX_RETURNED_SCENARIOS:
+        result['summary'] = {name: {'min': round(float(np.nanmin(flat[name])), 2),
+                                    'max': round(float(np.nanmax(flat[name])), 2)} for name in outputs}
+    return result
+
+
+def run_tool(name: str, arguments: Dict) -> Dict:
+    """Evaluate one calculator tool call; bad arguments come back as an error for the model to read"""
+    try:
+        args = {key: np.asarray(value, dtype=np.float64) for key, value in arguments.items()}
+        # loan_payment crosses its inputs into a grid; the other tools broadcast them element-wise
+        if name == "loan_payment":
+            scenarios = int(np.prod([value.size for value in args.values()]))
+        else:
+            scenarios = np.broadcast(*args.values()).size if len(args) > 1 else 1
+        if scenarios > MAX_SCENARIOS:
+            return {'error': f"At most {MAX_SCENARIOS} scenarios per call"}
+        for key in TERM_ARGUMENTS:
+            if key in args and not np.all((args[key] >= 1) & (args[key] <= MAX_TERM_MONTHS)):
+                return {'error': f"{key} must be between 1 and {MAX_TERM_MONTHS}"}
+        if name == "loan_payment":
+            grid = np.meshgrid(args['principal'], args['annual_rate'], args['months'], indexing='ij')
+            inputs = dict(zip(("principal", "annual_rate", "months"), grid))
+            payment = monthly_payment(*grid)
+            return _results(inputs, {'monthly_payment': payment, 'total_paid': payment * grid[2],
+                                     'total_interest': payment * grid[2] - grid[0]})
+        if name == "interest_only_payment":
+            return _results(args, {'monthly_payment': interest_only_payment(args['principal'], args['annual_rate'])})
+        if name == "amortization_schedule":
+            schedule = amortization_schedule(float(args['principal']), float(args['annual_rate']), int(args['months']),
+                                             float(args.get('extra_payment', 0.0)))
+            return {
+                'monthly_payment': round(float(schedule['payment'][0]), 2),
+                'payments': int(len(schedule['payment_number'])),
+                'total_interest': round(float(schedule['interest'].sum()), 2),
+                'years': yearly_summary(schedule),
+            }
+        if name == "remaining_balance":
+            return _results(args, {'balance': remaining_balance(args['principal'], args['annual_rate'], args['months'],
+                                                                 args['payments_made'])})
+        if name == "apr_with_fees":
+            return _results(args, {'apr': apr_with_fees(args['principal'], args['annual_rate'], args['months'],
+                                                        args['fees'])})
+        if name == "payoff_with_extra_payments":
+            return _results(args, payoff_with_extra(args['principal'], args['annual_rate'], args['months'],
+                                                    args['extra_payment']))
+        if name == "refinance_break_even":
+            return _results(args, refinance_break_even(**args))
+        return {'error': f"Unknown tool {name}"}
+    except (KeyError, TypeError, ValueError, OverflowError) as e:
+        return {'error': f"Invalid arguments for {name}: {str(e)}"}
+
+
+def run_tool_call(tool_call: Dict) -> str:
+    """JSON result for one tool call in the OpenAI-style format Watsonx returns"""
+    function = tool_call.get("function") or {}
+    try:
+        arguments = json.loads(function.get("arguments") or "{}")
+    except ValueError:
+        return json.dumps({'error': "Arguments are not valid JSON"})
+    return json.dumps(run_tool(function.get("name", ""), arguments))
@@ -0,0 +1,113 @@
+"""
+Content-addressed cache of vision OCR results, per uploaded file and per rendered page
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+FILE = "file"
+PAGE = "page"
+
+
+def init_ocr_cache(cursor: sqlite3.Cursor):
+    # kind is "file" (merged text of a whole upload) or "page" (OCR of one page image)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            cache_key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            metadata TEXT,
+            nbytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_cache_stats (
+            kind TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL,
+            misses INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_hit ON ocr_cache(last_hit_at)")
+    cursor.executemany(
+        "INSERT OR IGNORE INTO ocr_cache_stats (kind, hits, misses) VALUES (?, 0, 0)", [(FILE,), (PAGE,)]
+    )
+
+
+def make_ocr_key(content: bytes, *context: str) -> str:
+    """Hash of the raw bytes plus whatever else shapes the output (model IDs, prompt version, settings)"""
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps(context).encode())
+    return digest.hexdigest()
+
+
+def lookup_ocr(cursor: sqlite3.Cursor, cache_key: str, kind: str) -> Optional[Tuple[str, Dict]]:
+    """Cached (text, metadata) for a file or page, else None"""
+    cursor.execute("SELECT text, metadata FROM ocr_cache WHERE cache_key = ? AND kind = ?", (cache_key, kind))
+    row = cursor.fetchone()
+    column = "hits" if row else "misses"
+    cursor.execute(f"UPDATE ocr_cache_stats SET {column} = {column} + 1 WHERE kind = ?", (kind,))
+    if not row:
+        return None
+    cursor.execute('''
+        UPDATE ocr_cache SET last_hit_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?
+    ''', (time.time(), cache_key))
+    return row[0], json.loads(row[1] or "{}")
+
+
+def store_ocr(cursor: sqlite3.Cursor, cache_key: str, kind: str, text: str, metadata: Optional[Dict] = None,
+              max_bytes: int = DEFAULT_MAX_BYTES):
+    """Cache an OCR result and evict least recently used entries beyond max_bytes"""
+    now = time.time()
+    metadata_json = json.dumps(metadata or {})
+    nbytes = len(text.encode()) + len(metadata_json) + len(cache_key)
+    cursor.execute('''
+        INSERT OR REPLACE INTO ocr_cache
+        (cache_key, kind, text, metadata, nbytes, created_at, last_hit_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (cache_key, kind, text, metadata_json, nbytes, now, now))
+
+    cursor.execute("SELECT COALESCE(SUM(nbytes), 0) FROM ocr_cache")
+    excess = cursor.fetchone()[0] - max_bytes
+    if excess <= 0:
+        return
+    cursor.execute("SELECT cache_key, nbytes FROM ocr_cache ORDER BY last_hit_at")
+    evicted = []
+    for key, size in cursor.fetchall():
+        if excess <= 0:
+            break
+        evicted.append((key,))
+        excess -= size
+    cursor.executemany("DELETE FROM ocr_cache WHERE cache_key = ?", evicted)
+
+
+def clear_ocr_cache(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM ocr_cache")
+
+
+def ocr_cache_stats(cursor: sqlite3.Cursor) -> Dict[str, float]:
+    """Hit and miss counters per kind, size on disk and the page hit rate"""
+    cursor.execute("SELECT kind, hits, misses FROM ocr_cache_stats")
+    counters = {kind: (hits, misses) for kind, hits, misses in cursor.fetchall()}
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM ocr_cache")
+    entries, nbytes = cursor.fetchone()
+    file_hits, file_misses = counters.get(FILE, (0, 0))
+    page_hits, page_misses = counters.get(PAGE, (0, 0))
+    page_lookups = page_hits + page_misses
+    return {
+        'file_hits': file_hits,
+        'file_misses': file_misses,
+        'page_hits': page_hits,
+        'page_misses': page_misses,
+        'entries': entries,
+        'bytes': nbytes,
+        'page_hit_rate': page_hits / page_lookups if page_lookups else 0.0,
+    }
@@ -0,0 +1,217 @@
+"""
+Word, Excel and CSV uploads read natively: paragraphs in document order and tables
+flattened to one "column: value" line per row, streamed straight into chunks
+"""
+import csv
+import datetime
+import io
+import re
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from chunking import Chunk, chunk_blocks
+
+DOCX_EXTENSIONS = ('.docx',)
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+CSV_EXTENSIONS = ('.csv',)
+OFFICE_EXTENSIONS = DOCX_EXTENSIONS + XLSX_EXTENSIONS + CSV_EXTENSIONS
+CSV_DELIMITERS = ",;\t|"
+CSV_SNIFF_BYTES = 4096
+# Leading title rows ("Loan Report 2024") looked past while searching for the header row
+MAX_TITLE_ROWS = 3
+# Currency signs, separators, signs and brackets around a number ("$1,200.50", "(500)", "1.200,50 €", "6.5%")
+NUMBER_DECORATION = re.compile(r"[\s$€£¥%,.'()+\-]")
+
+
+def format_cell(value) -> str:
+    """Spreadsheet value as text: whole floats without ".0", midnight datetimes as dates"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=" ")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return " ".join(str(value).split())
+
+
+def column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def is_number(text: str) -> bool:
+    return NUMBER_DECORATION.sub("", text).isdigit()
+
+
+def is_sparse(values: Sequence) -> bool:
+    """One filled cell, or gaps in most of the row: a sheet title rather than a table row, if a wider row follows"""
+    filled = [position for position, value in enumerate(values) if value not in (None, "")]
+    return len(filled) < 2 or len(filled) * 2 < filled[-1] + 1
+
+
+def is_header(values: Sequence) -> bool:
+    """A first row of labels rather than data: text, not numbers, in every filled cell"""
+    filled = [value for value in values if value not in (None, "")]
+    return bool(filled) and all(isinstance(value, str) and not is_number(value) for value in filled)
+
+
+def row_text(label: str, headers: Sequence[str], values: Sequence[str]) -> str:
+    """One row as "label: header: value; ..." so each line stands alone in whatever chunk it lands in"""
+    fields = []
+    for position, value in enumerate(values):
+        if not value:
+            continue
+        header = headers[position] if position < len(headers) and headers[position] else None
+        fields.append(f"{header}: {value}" if header else value)
+    return f"{label}: {'; '.join(fields)}" if fields else ""
+
+
+def table_rows(rows: Iterator[Sequence], label: str, stats: Dict, column_name=column_letter) -> Iterator[str]:
+    """Flatten a table into row lines, naming each value after the header row (or its column without one).
+
+    Sparse rows above a wider table, such as a title, are kept as plain lines
+    and the header row is looked for below them.
+    """
+    headers: Optional[List[str]] = None
+    held = []
+
+    def data_line(number: int, values: Sequence) -> str:
+        nonlocal headers
+        if headers is None:
+            if is_header(values):
+                headers = [format_cell(value) for value in values]
+                return ""
+            headers = []
+        cells = [format_cell(value) for value in values]
+        names = [headers[i] if i < len(headers) and headers[i] else f"Column {column_name(i)}"
+                 for i in range(len(cells))]
+        stats['rows'] = stats.get('rows', 0) + 1
+        return row_text(f"{label}Row {number}", names, cells)
+
+    for number, values in enumerate(rows, start=1):
+        if not any(value not in (None, "") for value in values):
+            continue
+        if headers is None and len(held) < MAX_TITLE_ROWS and is_sparse(values):
+            held.append((number, values))
+            continue
+        for held_number, held_values in held:
+            if is_sparse(values):
+                # Sparse all the way down: a one-column table whose first row may be its header
+                line = data_line(held_number, held_values)
+            else:
+                line = row_text(f"{label}Row {held_number}", [], [format_cell(value) for value in held_values])
+            if line:
+                yield line
+        held = []
+        line = data_line(number, values)
+        if line:
+            yield line
+    for held_number, held_values in held:
+        line = data_line(held_number, held_values)
+        if line:
+            yield line
+
+
+def docx_blocks(data: bytes, stats: Dict) -> Iterator[str]:
+    """Paragraphs and tables of a .docx in document order; headings become markdown headings"""
+    import docx
+    from docx.table import Table
+
+    document = docx.Document(io.BytesIO(data))
+    tables = 0
+    for item in document.iter_inner_content():
+        if isinstance(item, Table):
+            tables += 1
+            stats['tables'] = tables
+            yield from table_rows(docx_table_cells(item), f"Table {tables}, ", stats, column_name=lambda i: i + 1)
+            continue
+        text = item.text.strip()
+        if not text:
+            continue
+        style = item.style.name if item.style is not None else ""
+        if style == "Title":
+            yield f"# {text}"
+        elif style.startswith("Heading") and style[len("Heading"):].strip().isdigit():
+            yield f"{'#' * min(int(style[len('Heading'):]), 6)} {text}"
+        else:
+            stats['paragraphs'] = stats.get('paragraphs', 0) + 1
+            yield text
+
+
+def docx_table_cells(table) -> Iterator[List[str]]:
+    """Cell texts of each table row, with horizontally merged cells counted once"""
+    for row in table.rows:
+        cells = []
+        previous = None
+        for cell in row.cells:
+            if cell._tc is not previous:
+                cells.append(cell.text)
+            previous = cell._tc
+        yield cells
+
+
+def xlsx_blocks(data: bytes, stats: Dict) -> Iterator[str]:
+    """Rows of every worksheet, read in read-only mode so large workbooks are never loaded whole"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        stats['sheets'] = len(workbook.worksheets)
+        for sheet in workbook.worksheets:
+            yield from table_rows(sheet.iter_rows(values_only=True), f"{sheet.title}, ", stats)
+    finally:
+        workbook.close()
+
+
+def decode_text(data: bytes) -> str:
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Excel's CSV export on Windows
+        return data.decode('cp1252', errors='replace')
+
+
+def csv_blocks(data: bytes, stats: Dict) -> Iterator[str]:
+    """Rows of a CSV file, with the delimiter detected from its opening lines"""
+    text = decode_text(data)
+    try:
+        dialect = csv.Sniffer().sniff(text[:CSV_SNIFF_BYTES], delimiters=CSV_DELIMITERS)
+    except csv.Error:
+        dialect = csv.excel
+    yield from table_rows(csv.reader(io.StringIO(text, newline=""), dialect), "", stats,
+                          column_name=lambda i: i + 1)
+
+
+def extract_office_document(filename: str, data: bytes) -> Tuple[str, List[Chunk], Dict]:
+    """Text, chunks and metadata of a .docx, .xlsx/.xlsm or .csv upload"""
+    name = filename.lower()
+    stats: Dict = {}
+    if name.endswith(DOCX_EXTENSIONS):
+        blocks = docx_blocks(data, stats)
+    elif name.endswith(XLSX_EXTENSIONS):
+        blocks = xlsx_blocks(data, stats)
+    elif name.endswith(CSV_EXTENSIONS):
+        blocks = csv_blocks(data, stats)
+    else:
+        raise ValueError(f"Unsupported document type: {filename}")
+    content, chunks = chunk_blocks(blocks)
+    return content, chunks, stats
+
+
+def document_kind(filename: str) -> str:
+    """Label used in upload messages"""
+    name = filename.lower()
+    if name.endswith(DOCX_EXTENSIONS):
+        return "Word document"
+    if name.endswith(XLSX_EXTENSIONS):
+        return "spreadsheet"
+    return "CSV file"
+
+
+def office_content_type(filename: str) -> str:
+    return filename.lower().rsplit('.', 1)[-1].replace('xlsm', 'xlsx')
@@ -0,0 +1,73 @@
+"""
+Per-page PDF handling: take the text layer where it is usable, rasterize the rest for vision OCR
+"""
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from image_preprocessing import DEFAULT_MAX_PIXELS, fit_zoom
+
+DEFAULT_MIN_TEXT_CHARS = 100
+DEFAULT_MAX_IMAGE_COVERAGE = 0.5
+# Text layers full of unmapped glyphs come out as U+FFFD; treat those pages as scans
+MAX_GARBLED_RATIO = 0.05
+
+
+def image_coverage(page: fitz.Page) -> float:
+    """Fraction of the page area covered by embedded images"""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page_rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(1.0, covered / page_area)
+
+
+def usable_page_text(page: fitz.Page, min_chars: int = DEFAULT_MIN_TEXT_CHARS,
+                     max_image_coverage: float = DEFAULT_MAX_IMAGE_COVERAGE) -> Optional[str]:
+    """The page's text layer if it can stand in for OCR, else None"""
+    text = page.get_text("text", sort=True).strip()
+    visible = sum(1 for ch in text if not ch.isspace())
+    if visible < min_chars:
+        return None
+    if text.count("�") / visible > MAX_GARBLED_RATIO:
+        return None
+    if image_coverage(page) > max_image_coverage:
+        return None
+    return text
+
+
+def classify_pages(pdf_bytes: bytes, min_chars: int = DEFAULT_MIN_TEXT_CHARS,
+                   max_image_coverage: float = DEFAULT_MAX_IMAGE_COVERAGE) -> Tuple[Dict[int, str], List[int]]:
+    """Split pages into {page_number: text} taken from the text layer and page numbers that need OCR"""
+    text_pages = {}
+    vision_pages = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        for page in pdf_document:
+            text = usable_page_text(page, min_chars, max_image_coverage)
+            if text is None:
+                vision_pages.append(page.number)
+            else:
+                text_pages[page.number] = text
+    return text_pages, vision_pages
+
+
+def pdf_page_count(pdf_bytes: bytes) -> int:
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        return len(pdf_document)
+
+
+def pdf_to_images(pdf_bytes: bytes, page_numbers: Optional[Sequence[int]] = None,
+                  max_pixels: int = DEFAULT_MAX_PIXELS) -> Iterator[bytes]:
+    """Render PDF pages (all, or the given ones) to PNG bytes in memory, one page at a time"""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        for page_number in (range(len(pdf_document)) if page_numbers is None else page_numbers):
+            page = pdf_document.load_page(page_number)
+            # Render straight at the pixel budget (at most 2x) instead of downscaling a 2x render
+            zoom = fit_zoom(page.rect.width, page.rect.height, max_pixels)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            yield pix.tobytes("png")
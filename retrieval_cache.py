@@ -0,0 +1,190 @@
+"""
+Process-wide cache of the tokenized chunk corpus, keyed by corpus version
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bm25_index import BM25_B, BM25_K1, tokenize
+
+# Scope of the shared reference library in corpus_versions; sessions use their id
+SHARED_SCOPE = ""
+
+
+def init_corpus_versions(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS corpus_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def bump_corpus_version(cursor: sqlite3.Cursor, session_id: Optional[str] = None):
+    """Mark the chunks of one session (or the shared library) as changed"""
+    cursor.execute('''
+        INSERT INTO corpus_versions (scope, version) VALUES (?, 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1
+    ''', (session_id or SHARED_SCOPE,))
+
+
+def bump_all_corpus_versions(cursor: sqlite3.Cursor):
+    """Invalidate every cached segment, e.g. after bulk deletes"""
+    cursor.execute("UPDATE corpus_versions SET version = version + 1")
+    bump_corpus_version(cursor, None)
+
+
+class CorpusSegment:
+    """Tokenized chunks of one scope as CSR postings in NumPy arrays"""
+
+    def __init__(self, rowids: List[int], token_lists: List[List[str]]):
+        vocabulary: Dict[str, int] = {}
+        term_ids = []
+        doc_ids = []
+        term_freqs = []
+        for doc_index, tokens in enumerate(token_lists):
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_index)
+                term_freqs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        self.vocabulary = vocabulary
+        self.rowids = np.asarray(rowids, dtype=np.int64)
+        self.lengths = np.asarray([len(tokens) for tokens in token_lists], dtype=np.int32)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.term_freqs = np.asarray(term_freqs, dtype=np.int32)[order]
+        self.indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=self.indptr[1:])
+
+    @classmethod
+    def load(cls, cursor: sqlite3.Cursor, session_id: Optional[str]) -> "CorpusSegment":
+        if session_id is None:
+            cursor.execute('''
+                SELECT rowid, chunk_text FROM chunks WHERE session_id IS NULL
+            ''')
+        else:
+            cursor.execute('''
+                SELECT rowid, chunk_text FROM chunks WHERE session_id = ?
+            ''', (session_id,))
+        rows = cursor.fetchall()
+        return cls([rowid for rowid, _ in rows], [tokenize(text or "") for _, text in rows])
+
+    @property
+    def nbytes(self) -> int:
+        # Rough vocabulary cost: key string plus dict slot per term
+        vocabulary_bytes = sum(len(term) + 80 for term in self.vocabulary)
+        arrays = (self.rowids, self.lengths, self.doc_ids, self.term_freqs, self.indptr)
+        return vocabulary_bytes + sum(array.nbytes for array in arrays)
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return self.doc_ids[:0], self.term_freqs[:0]
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.doc_ids[start:end], self.term_freqs[start:end]
+
+
+def bm25_scores(segments: List[CorpusSegment], query: str) -> Tuple[np.ndarray, np.ndarray]:
+    """BM25 over several segments as one corpus; returns (rowids, scores)"""
+    segments = [segment for segment in segments if len(segment.rowids)]
+    if not segments:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    chunk_count = sum(len(segment.rowids) for segment in segments)
+    avg_length = sum(int(segment.lengths.sum()) for segment in segments) / chunk_count or 1.0
+    scores = [np.zeros(len(segment.rowids)) for segment in segments]
+
+    for term in set(tokenize(query)):
+        postings = [segment.postings(term) for segment in segments]
+        doc_freq = sum(len(doc_ids) for doc_ids, _ in postings)
+        if not doc_freq:
+            continue
+        idf = math.log(1 + (chunk_count - doc_freq + 0.5) / (doc_freq + 0.5))
+        for segment, segment_scores, (doc_ids, term_freqs) in zip(segments, scores, postings):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.lengths[doc_ids] / avg_length)
+            segment_scores[doc_ids] += idf * term_freqs * (BM25_K1 + 1) / (term_freqs + norm)
+
+    return np.concatenate([segment.rowids for segment in segments]), np.concatenate(scores)
+
+
+class RetrievalCache:
+    """Shared reference segment plus LRU per-session segments under a memory cap"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, idle_seconds: float = 1800):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._shared: Optional[Tuple[int, CorpusSegment]] = None
+        self._sessions: "OrderedDict[str, Tuple[int, CorpusSegment, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        shared = self._shared[1].nbytes if self._shared else 0
+        return shared + sum(segment.nbytes for _, segment, _ in self._sessions.values())
+
+    def _evict(self, keep: Optional[str]):
+        now = time.monotonic()
+        for session_id, (_, _, last_used) in list(self._sessions.items()):
+            if session_id != keep and now - last_used > self.idle_seconds:
+                del self._sessions[session_id]
+        while self.nbytes > self.max_bytes and self._sessions:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            del self._sessions[oldest]
+
+    def segments(self, cursor: sqlite3.Cursor, session_id: Optional[str]) -> List[CorpusSegment]:
+        """Current segments visible to a session, reloading only stale scopes"""
+        cursor.execute(
+            "SELECT scope, version FROM corpus_versions WHERE scope IN (?, ?)",
+            (SHARED_SCOPE, session_id or SHARED_SCOPE),
+        )
+        versions = dict(cursor.fetchall())
+
+        with self._lock:
+            shared_version = versions.get(SHARED_SCOPE, 0)
+            if self._shared is None or self._shared[0] != shared_version:
+                self.misses += 1
+                self._shared = (shared_version, CorpusSegment.load(cursor, None))
+            else:
+                self.hits += 1
+            segments = [self._shared[1]]
+
+            if session_id:
+                session_version = versions.get(session_id, 0)
+                cached = self._sessions.get(session_id)
+                if cached is None or cached[0] != session_version:
+                    self.misses += 1
+                    segment = CorpusSegment.load(cursor, session_id)
+                else:
+                    self.hits += 1
+                    segment = cached[1]
+                self._sessions[session_id] = (session_version, segment, time.monotonic())
+                self._sessions.move_to_end(session_id)
+                segments.append(segment)
+
+            self._evict(keep=session_id)
+            return segments
+
+
+def make_cached_candidates(cache: RetrievalCache):
+    """Wrap a RetrievalCache as a retrieval_pipeline candidate generator"""
+    def cached_candidates(cursor: sqlite3.Cursor, query: str, session_id: Optional[str], limit: int) -> List[Tuple[int, float]]:
+        rowids, scores = bm25_scores(cache.segments(cursor, session_id), query)
+        matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return []
+        k = min(limit, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rowids[i]), float(scores[i])) for i in top]
+    return cached_candidates
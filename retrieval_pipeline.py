@@ -0,0 +1,160 @@
+"""
+Staged retrieval: candidate generation, reciprocal-rank fusion, optional reranking
+"""
+import json
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from bm25_index import bm25_search
+from fts_index import build_match_query
+from storage import SOURCE_REFERENCE
+
+# Candidate generators take (cursor, query, session_id, limit) and return
+# (chunk rowid, score) pairs, best first, restricted to chunks the session may see.
+CandidateGenerator = Callable[[sqlite3.Cursor, str, Optional[str], int], List[Tuple[int, float]]]
+
+CANDIDATE_LIMIT = 100
+RRF_K = 60
+# Worth one extra first place vote in the fused ranking
+USER_UPLOAD_BOOST = 1.0 / (RRF_K + 1)
+RERANK_BATCH_SIZE = 16
+
+# Reference chunks have no session; both branches are range scans of idx_chunks_scope
+VISIBLE_CHUNKS_FILTER = "(c.session_id IS NULL OR c.session_id = ?)"
+
+
+def fts_candidates(cursor: sqlite3.Cursor, query: str, session_id: Optional[str], limit: int) -> List[Tuple[int, float]]:
+    """Top chunks by FTS5 bm25() rank"""
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+    cursor.execute(f'''
+        SELECT c.rowid, -bm25(chunks_fts) as score
+        FROM chunks_fts
+        JOIN chunks c ON c.rowid = chunks_fts.rowid
+        WHERE chunks_fts MATCH ? AND {VISIBLE_CHUNKS_FILTER}
+        ORDER BY bm25(chunks_fts)
+        LIMIT ?
+    ''', (match_query, session_id, limit))
+    return cursor.fetchall()
+
+
+def bm25_candidates(cursor: sqlite3.Cursor, query: str, session_id: Optional[str], limit: int) -> List[Tuple[int, float]]:
+    """Top chunks from the BM25 inverted index tables"""
+    return bm25_search(cursor, query, session_id, limit)
+
+
+def make_dense_candidates(vector_store) -> CandidateGenerator:
+    """Wrap a VectorStore as a candidate generator"""
+    def dense_candidates(cursor: sqlite3.Cursor, query: str, session_id: Optional[str], limit: int) -> List[Tuple[int, float]]:
+        # Over-fetch so that other sessions' uploads do not crowd out visible chunks
+        ranked = vector_store.search(query, top_k=limit * 4)
+        if not ranked:
+            return []
+        placeholders = ",".join("?" * len(ranked))
+        cursor.execute(f'''
+            SELECT c.rowid
+            FROM chunks c
+            WHERE c.rowid IN ({placeholders}) AND {VISIBLE_CHUNKS_FILTER}
+        ''', [rowid for rowid, _ in ranked] + [session_id])
+        visible = {rowid for (rowid,) in cursor.fetchall()}
+        return [(rowid, score) for rowid, score in ranked if rowid in visible][:limit]
+    return dense_candidates
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[int, float]]], k: int = RRF_K) -> Dict[int, float]:
+    """Sum of 1 / (k + rank) over every ranking a chunk appears in"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (rowid, _) in enumerate(ranking, start=1):
+            fused[rowid] = fused.get(rowid, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+class CrossEncoderReranker:
+    """CPU cross-encoder scoring (query, chunk) pairs, loaded from the local model cache"""
+
+    def __init__(self, model_name: str, cache_dir: Optional[str] = None):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu", cache_folder=cache_dir or None, local_files_only=True)
+
+    def __call__(self, query: str, texts: Sequence[str]) -> List[float]:
+        scores = self.model.predict([(query, text) for text in texts], show_progress_bar=False)
+        return [float(score) for score in scores]
+
+
+def rerank_within_budget(reranker: Callable[[str, Sequence[str]], List[float]], query: str,
+                         candidates: List[Dict], budget_ms: float) -> List[Dict]:
+    """Rerank candidates in batches until the latency budget runs out.
+
+    Candidates must arrive in fused order. Scored candidates are re-sorted by
+    reranker score (plus the user upload boost); anything the budget did not
+    reach keeps its fused position after them.
+    """
+    start = time.perf_counter()
+    scored = 0
+    batch_ms = 0.0
+    while scored < len(candidates):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if scored and elapsed_ms + batch_ms > budget_ms:
+            break
+        batch = candidates[scored:scored + RERANK_BATCH_SIZE]
+        batch_start = time.perf_counter()
+        for candidate, score in zip(batch, reranker(query, [c['text'] for c in batch])):
+            candidate['rerank_score'] = score + (1.0 if candidate['is_user_upload'] else 0.0)
+        batch_ms = (time.perf_counter() - batch_start) * 1000
+        scored += len(batch)
+
+    head = sorted(candidates[:scored], key=lambda c: c['rerank_score'], reverse=True)
+    return head + candidates[scored:]
+
+
+def fetch_candidates(cursor: sqlite3.Cursor, rowids: Sequence[int]) -> Dict[int, Tuple]:
+    """Load result rows for the fused candidate set in one query"""
+    if not rowids:
+        return {}
+    placeholders = ",".join("?" * len(rowids))
+    cursor.execute(f'''
+        SELECT c.rowid, c.id, c.document_id, c.chunk_text, d.filename, d.content_type, d.metadata, d.session_id,
+               d.source = ? as is_reference, c.char_start, c.char_end
+        FROM chunks c
+        JOIN documents d ON c.document_id = d.id
+        WHERE c.rowid IN ({placeholders})
+    ''', [SOURCE_REFERENCE] + list(rowids))
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def retrieve(cursor: sqlite3.Cursor, query: str, session_id: Optional[str], top_k: int,
+             generators: Sequence[CandidateGenerator], reranker=None, rerank_budget_ms: float = 250,
+             candidate_limit: int = CANDIDATE_LIMIT, user_upload_boost: float = USER_UPLOAD_BOOST) -> List[Dict]:
+    """Run every generator, fuse with RRF, boost user uploads and optionally rerank"""
+    rankings = [generator(cursor, query, session_id, candidate_limit) for generator in generators]
+    fused = reciprocal_rank_fusion(rankings)
+    rows = fetch_candidates(cursor, list(fused))
+
+    candidates = []
+    for rowid, row in rows.items():
+        is_user_upload = row[7] == 0
+        candidates.append({
+            'chunk_id': row[0],
+            'document_id': row[1],
+            'text': row[2],
+            'filename': row[3],
+            'content_type': row[4],
+            'metadata': row[5],
+            'session_id': row[6],
+            'is_user_upload': is_user_upload,  # True for user uploads, False for reference documents
+            'char_start': row[8],
+            'char_end': row[9],
+            'score': fused[rowid] + (user_upload_boost if is_user_upload else 0.0)
+        })
+    candidates.sort(key=lambda c: c['score'], reverse=True)
+
+    if reranker is not None and candidates:
+        candidates = rerank_within_budget(reranker, query, candidates, rerank_budget_ms)
+
+    results = candidates[:top_k]
+    for result in results:
+        result['metadata'] = json.loads(result['metadata']) if result['metadata'] else {}
+    return results
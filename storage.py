@@ -0,0 +1,279 @@
+"""
+SQLite connections from a small per-database pool, one-time schema setup and the core document tables
+"""
+import contextlib
+import queue
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterator
+
+# Seconds a writer waits for another writer before "database is locked"
+BUSY_TIMEOUT = 10.0
+# Statements kept compiled per connection; every repeated query in the app fits
+CACHED_STATEMENTS = 256
+# Idle connections kept per database. Busy moments may open more; those are closed when returned to a full pool.
+POOL_SIZE = 8
+
+# journal_mode is stored in the database file; the rest apply per connection.
+# WAL lets readers run while one session writes; NORMAL sync is durable across app crashes in WAL mode.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Connections borrowed by this thread's open transactions, by database
+_local = threading.local()
+_pools: Dict[str, queue.LifoQueue] = {}
+_pools_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def connect(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """New connection with the storage pragmas applied"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS,
+                           check_same_thread=check_same_thread)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _pool(db_path: str) -> queue.LifoQueue:
+    with _pools_lock:
+        if db_path not in _pools:
+            _pools[db_path] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return _pools[db_path]
+
+
+@contextlib.contextmanager
+def get_connection(db_path: str) -> Iterator[sqlite3.Connection]:
+    """Connection to db_path for the duration of the block.
+
+    Threads come and go with every Streamlit rerun, so connections are
+    borrowed from the pool rather than held per thread; the most recently
+    returned one is handed out first, with its statement cache warm. A
+    nested block on the same thread gets the connection its outer block holds.
+    """
+    borrowed: Dict[str, sqlite3.Connection] = getattr(_local, "borrowed", None)
+    if borrowed is None:
+        borrowed = _local.borrowed = {}
+    if db_path in borrowed:
+        yield borrowed[db_path]
+        return
+
+    pool = _pool(db_path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        # Handed between threads, but only ever used by the one that borrowed it
+        conn = connect(db_path, check_same_thread=False)
+    borrowed[db_path] = conn
+    try:
+        yield conn
+    finally:
+        del borrowed[db_path]
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+@contextlib.contextmanager
+def transaction(db_path: str, immediate: bool = False) -> Iterator[sqlite3.Cursor]:
+    """Cursor on a pooled connection; commits on success and rolls back on error.
+
+    Nested blocks on the same thread join the outermost transaction. Without
+    immediate, sqlite3 only opens the transaction at the first data change, so
+    schema statements before it run on their own; immediate takes the write
+    lock up front and makes everything in the block, DDL included, one unit.
+    """
+    outermost = db_path not in getattr(_local, "borrowed", {})
+    with get_connection(db_path) as conn:
+        try:
+            if outermost and immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn.cursor()
+            if outermost:
+                conn.commit()
+        except BaseException:
+            if outermost:
+                conn.rollback()
+            raise
+
+
+def close_connections():
+    """Close the idle pooled connections"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def ensure_schema(db_path: str, migrate: Callable[[sqlite3.Cursor], None]) -> bool:
+    """Run migrate(cursor) against db_path once per process; returns whether it ran now"""
+    key = (db_path, migrate.__module__, migrate.__qualname__)
+    if key in _schema_ready:
+        return False
+    with _schema_lock:
+        if key in _schema_ready:
+            return False
+        with transaction(db_path, immediate=True) as cursor:
+            migrate(cursor)
+        _schema_ready.add(key)
+    return True
+
+
+SOURCE_UPLOAD = "upload"
+SOURCE_REFERENCE = "reference"
+
+# Owner of uploads stored before sessions were tracked
+LEGACY_SESSION = "default"
+
+# Guides written by load_reference_documents: marked in their metadata, or
+# stored as ref_<name> for documents/<name>.txt by older loaders
+REFERENCE_GUIDE_FILTER = '''(
+    metadata LIKE '%"source": "reference_library"%'
+    OR (filename LIKE '%.txt' AND id = 'ref_' || substr(filename, 1, length(filename) - 4))
+)'''
+
+# PRAGMA user_version after the migrations below
+SCHEMA_VERSION = 4
+
+# {name} lets migrations create a copy of the table to rebuild it.
+# file_hash is not unique: the same file may be uploaded in several sessions.
+# Uploads belong to a session and shared documents to none, so an upload stored without one is an error.
+DOCUMENTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        content TEXT NOT NULL,
+        content_type TEXT NOT NULL,
+        upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        file_hash TEXT,
+        metadata TEXT,
+        session_id TEXT,
+        source TEXT NOT NULL DEFAULT 'upload',
+        CHECK ((source = 'upload') = (session_id IS NOT NULL))
+    )
+'''
+
+# session_id is copied from the document so visibility checks never join documents.
+# char_start/char_end locate chunk_text in the document content, or in the page text for page chunks.
+# seq is the rowid; AUTOINCREMENT keeps deleted rowids from being reused, so FTS entries
+# and vectors keyed on a rowid can never attach to a later chunk.
+CHUNKS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        document_id TEXT,
+        chunk_text TEXT,
+        chunk_index INTEGER,
+        char_start INTEGER,
+        char_end INTEGER,
+        session_id TEXT,
+        FOREIGN KEY (document_id) REFERENCES documents (id)
+    )
+'''
+
+
+def add_missing_columns(cursor: sqlite3.Cursor, table: str, columns: Dict[str, str]):
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def rebuild_table(cursor: sqlite3.Cursor, table: str, create_sql: str):
+    """Recreate table from create_sql (a CREATE TABLE with a {name} placeholder), keeping its rows and rowids.
+
+    SQLite cannot drop a constraint in place. Indexes and triggers on the old
+    table go with it and have to be created again afterwards.
+    """
+    rebuilt = f"{table}_rebuild"
+    cursor.execute(f"DROP TABLE IF EXISTS {rebuilt}")
+    cursor.execute(create_sql.format(name=rebuilt))
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA table_info({rebuilt})")
+    columns = ", ".join(row[1] for row in cursor.fetchall() if row[1] in existing)
+    cursor.execute(f"INSERT INTO {rebuilt} (rowid, {columns}) SELECT rowid, {columns} FROM {table}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+
+
+def init_document_tables(cursor: sqlite3.Cursor):
+    """Create the documents, chunks and document_pages tables and bring older databases up to date.
+
+    Call inside transaction(db_path, immediate=True): the table rebuilds drop
+    and rename tables, and user_version is bumped with them, so a crash midway
+    has to roll all of it back.
+    """
+    cursor.execute(DOCUMENTS_TABLE.format(name="documents"))
+
+    cursor.execute(CHUNKS_TABLE.format(name="chunks"))
+
+    # Raw text of each page of an OCRed document, so retrieval is not limited to the merged summary
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_pages (
+            document_id TEXT NOT NULL,
+            page_number INTEGER NOT NULL,
+            page_text TEXT NOT NULL,
+            PRIMARY KEY (document_id, page_number),
+            FOREIGN KEY (document_id) REFERENCES documents (id)
+        )
+    ''')
+
+    add_missing_columns(cursor, "documents", {"session_id": "TEXT", "source": "TEXT NOT NULL DEFAULT 'upload'"})
+    add_missing_columns(cursor, "chunks", {"char_start": "INTEGER", "char_end": "INTEGER", "session_id": "TEXT"})
+
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    if version < 1:
+        # Reference guides were only marked by their metadata or id, and older databases
+        # stored them under the 'default' session instead of NULL
+        cursor.execute(f"UPDATE documents SET source = ?, session_id = NULL WHERE {REFERENCE_GUIDE_FILTER}",
+                       (SOURCE_REFERENCE,))
+        cursor.execute('''
+            UPDATE chunks SET session_id = (SELECT d.session_id FROM documents d WHERE d.id = chunks.document_id)
+            WHERE document_id IN (SELECT id FROM documents)
+        ''')
+        # Superseded by the composite indexes below
+        cursor.execute("DROP INDEX IF EXISTS idx_chunks_session")
+        cursor.execute("DROP INDEX IF EXISTS idx_documents_session")
+    if version < 3:
+        # Plain rowids were reused after deletes, attaching old vectors to new chunks.
+        # Rowids are kept, so the FTS index stays valid; its triggers are recreated by init_fts_index.
+        rebuild_table(cursor, "chunks", CHUNKS_TABLE)
+    if version < 4:
+        # Only the guides are shared. Everything else from before session scoping is a customer upload,
+        # filed under the 'default' session or under none; it stays an upload of LEGACY_SESSION, which
+        # no visitor is ever given, rather than being served to every session.
+        cursor.execute(f"UPDATE documents SET source = ?, session_id = NULL WHERE {REFERENCE_GUIDE_FILTER}",
+                       (SOURCE_REFERENCE,))
+        cursor.execute(f"UPDATE documents SET session_id = ? WHERE session_id IS NULL AND NOT {REFERENCE_GUIDE_FILTER}",
+                       (LEGACY_SESSION,))
+        cursor.execute("UPDATE documents SET source = ? WHERE session_id IS NOT NULL", (SOURCE_UPLOAD,))
+        cursor.execute('''
+            UPDATE chunks SET session_id = (SELECT d.session_id FROM documents d WHERE d.id = chunks.document_id)
+            WHERE document_id IN (SELECT id FROM documents)
+        ''')
+        # file_hash was UNIQUE, so storing a file already uploaded in another session replaced that
+        # session's document and orphaned its chunks; the session_id default and the scope check change too
+        rebuild_table(cursor, "documents", DOCUMENTS_TABLE)
+    if version < SCHEMA_VERSION:
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_scope ON chunks(session_id, document_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_scope ON documents(session_id, source)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(file_hash)")
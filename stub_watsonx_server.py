@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the IAM and Watsonx chat endpoints, including chat_stream SSE.
+
+Run it and point the app at it to exercise streaming without the real service:
+    python stub_watsonx_server.py --port 8765
+    WATSONX_IAM_URL=http://127.0.0.1:8765/identity/token
+    WATSONX_API_URL=http://127.0.0.1:8765/ml/v1/text/chat?version=2023-03-29
+
+The last user message controls failure modes:
+    "STREAM_FAIL"       chat_stream answers 500 before sending anything
+    "STREAM_BREAK"      chat_stream sends a few tokens, then an error event
+    "RATE_LIMIT"        chat answers 429 with Retry-After twice before succeeding
+    "ECHO <text>"       chat answers <text> after a random short delay
+    "TOOL <name> <json>" when tools are offered, calls tool <name> with the JSON
+                        arguments, then answers "Tool result: <result>"
+
+Tokens issued by /identity/token are numbered; any token added to
+StubWatsonxHandler.revoked_tokens is answered with 401.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = "This is a stubbed answer from the local Watsonx server."
+TOOL_PATTERN = re.compile(r"TOOL (\w+) (\{.*?\})(?=\s|$)")
+
+
+class StubWatsonxHandler(BaseHTTPRequestHandler):
+    token_delay = 0.01
+    rate_limited_attempts = 2
+    # Requests seen per prompt, for the RATE_LIMIT mode
+    attempts = {}
+    attempts_lock = threading.Lock()
+    token_lifetime = 3600
+    issued_tokens = 0
+    iam_delay = 0.0
+    revoked_tokens = set()
+    # Concurrent chat requests, to check client-side concurrency limits
+    in_flight = 0
+    max_in_flight = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, event, payload):
+        data = json.dumps(payload) if not isinstance(payload, str) else payload
+        self.wfile.write(f"id: {int(time.time() * 1000)}\nevent: {event}\ndata: {data}\n\n".encode())
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path.startswith("/identity/token"):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(self.iam_delay)
+            with self.attempts_lock:
+                StubWatsonxHandler.issued_tokens += 1
+                token = f"stub-token-{StubWatsonxHandler.issued_tokens}"
+            self._send_json(200, {
+                "access_token": token,
+                "expires_in": self.token_lifetime,
+                "expiration": int(time.time()) + self.token_lifetime,
+            })
+            return
+
+        token = self.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        if token in self.revoked_tokens:
+            self._send_json(401, {"errors": [{"message": "token expired"}]})
+            return
+
+        body = self._read_json()
+        messages = body.get("messages") or [{}]
+        last = messages[-1].get("content", "")
+        if isinstance(last, list):
+            last = " ".join(part.get("text", "") for part in last if part.get("type") == "text")
+        prompt = last
+
+        # Once tool results come back, the answer just repeats the last one
+        tool_call = None
+        if messages[-1].get("role") == "tool":
+            prompt = "ECHO Tool result: " + last
+        elif body.get("tools") and body.get("tool_choice_option") != "none":
+            match = TOOL_PATTERN.search(prompt)
+            if match:
+                tool_call = {"id": f"call_{len(messages)}", "type": "function",
+                             "function": {"name": match.group(1), "arguments": match.group(2)}}
+
+        if "RATE_LIMIT" in prompt:
+            with self.attempts_lock:
+                seen = self.attempts.get(prompt, 0)
+                self.attempts[prompt] = seen + 1
+            if seen < self.rate_limited_attempts:
+                data = b'{"errors": [{"message": "rate limited"}]}'
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+
+        if "/text/chat_stream" in self.path:
+            self._stream(prompt, tool_call)
+        elif "/text/chat" in self.path and tool_call:
+            self._send_json(200, {
+                "model_id": body.get("model_id"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "tool_calls": [tool_call]},
+                             "finish_reason": "tool_calls"}],
+            })
+        elif "/text/chat" in self.path:
+            answer = STUB_ANSWER
+            if prompt.startswith("ECHO "):
+                with self.attempts_lock:
+                    StubWatsonxHandler.in_flight += 1
+                    StubWatsonxHandler.max_in_flight = max(self.max_in_flight, self.in_flight)
+                time.sleep(random.uniform(0, 0.05))
+                with self.attempts_lock:
+                    StubWatsonxHandler.in_flight -= 1
+                answer = prompt[len("ECHO "):]
+            self._send_json(200, {
+                "model_id": body.get("model_id"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            })
+        else:
+            self._send_json(404, {"errors": [{"message": f"Unknown path {self.path}"}]})
+
+    def _stream(self, prompt, tool_call=None):
+        if "STREAM_FAIL" in prompt:
+            self._send_json(500, {"errors": [{"message": "stream unavailable"}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        if tool_call:
+            # Arguments arrive in two fragments, as the real endpoint splits them across events
+            arguments = tool_call["function"]["arguments"]
+            half = len(arguments) // 2
+            fragments = [
+                {"index": 0, "id": tool_call["id"], "type": "function",
+                 "function": {"name": tool_call["function"]["name"], "arguments": arguments[:half]}},
+                {"index": 0, "function": {"arguments": arguments[half:]}},
+            ]
+            for fragment in fragments:
+                self._send_event("message", {"choices": [{"index": 0, "delta": {"tool_calls": [fragment]}}]})
+            self._send_event("message", {"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]})
+            return
+
+        tokens = prompt[len("ECHO "):].split(" ") if prompt.startswith("ECHO ") else STUB_ANSWER.split(" ")
+        try:
+            for i, token in enumerate(tokens):
+                if "STREAM_BREAK" in prompt and i == 3:
+                    self._send_event("error", {"errors": [{"message": "upstream reset"}]})
+                    return
+                delta = token if i == 0 else " " + token
+                self._send_event("message", {
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": delta}, "finish_reason": None}],
+                })
+                time.sleep(self.token_delay)
+            self._send_event("message", {
+                "choices": [{"index": 0, "delta": {"content": ""}, "finish_reason": "stop"}],
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled
+
+
+def start_stub_server(port: int = 0) -> ThreadingHTTPServer:
+    """Start the stub on a background thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubWatsonxHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubWatsonxHandler)
+    print(f"Stub Watsonx server listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
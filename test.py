@@ -1,6 +1,7 @@
 import streamlit as st
-import requests, base64, io
+import base64, io
 from PIL import Image  # pillow is already a dependency for pdf2image
+from watsonx_client import IAMTokenManager, post as watsonx_post
 
 # Data extracted from the IBM Watsonx.ai service
 # Make sure to replace these with your actual credentials
@@ -121,16 +122,9 @@ Your output must be professional, structured, and compatible with Markdown viewe
 """
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
-@st.cache_data(ttl=3000)
-def get_iam_token(apikey: str) -> str:
-    r = requests.post(
-        IAM_URL,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        data={"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": apikey},
-    )
-    if r.status_code != 200:
-        raise Exception("IAM token error: " + r.text)
-    return r.json()["access_token"]
+@st.cache_resource
+def get_token_manager() -> IAMTokenManager:
+    return IAMTokenManager(IAM_URL, API_KEY)
 
 
 def pdf_first_page_to_png(pdf_bytes: bytes, dpi: int = 300) -> bytes:
@@ -166,13 +160,12 @@ def pdf_first_page_to_png(pdf_bytes: bytes, dpi: int = 300) -> bytes:
         )
 
 
-def extract_text(image_bytes: bytes, token: str, mime_type: str) -> str:
+def extract_text(image_bytes: bytes, token_manager: IAMTokenManager, mime_type: str) -> str:
     """Send image bytes to watsonx.ai and return extracted markdown text."""
     b64 = base64.b64encode(image_bytes).decode("utf-8")
     data_uri = f"data:{mime_type};base64,{b64}"
 
     headers = {
-        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
         "Accept": "application/json",
     }
@@ -190,7 +183,7 @@ def extract_text(image_bytes: bytes, token: str, mime_type: str) -> str:
         ],
     }
 
-    resp = requests.post(WATSONX_API_URL, headers=headers, json=body)
+    resp = watsonx_post(WATSONX_API_URL, headers=headers, json=body, token_manager=token_manager)
     if resp.status_code != 200:
         raise Exception(f"Watsonx.ai error {resp.status_code}: {resp.text}")
     return resp.json()["choices"][0]["message"]["content"]
@@ -237,8 +230,7 @@ if uploaded_file:
 
     with st.spinner("Running OCR…"):
         try:
-            token = get_iam_token(API_KEY)
-            extracted = extract_text(img_bytes, token, mime_type)
+            extracted = extract_text(img_bytes, get_token_manager(), mime_type)
             st.success("✅ Done!")
             st.markdown("### Extracted Text")
             st.markdown(extracted)
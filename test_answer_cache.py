@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for the answer cache: exact and near hits, scopes and invalidation
+"""
+import numpy as np
+import pytest
+
+from answer_cache import lookup_answer, store_answer, invalidate_documents, is_standalone_question, answer_cache_stats
+from document_store import insert_document, delete_documents
+from storage import transaction
+
+PARAMS = {"model_id": "test-model", "temperature": 0.7, "max_tokens": 1000}
+REFERENCE = [{'chunk_id': "ref_apr_chunk_0", 'document_id': "ref_apr", 'is_user_upload': False, 'session_id': None}]
+
+
+def embedding(*values) -> np.ndarray:
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def upload(session_id: str, document_id: str):
+    return [{'chunk_id': f"{document_id}_chunk_0", 'document_id': document_id, 'is_user_upload': True,
+             'session_id': session_id}]
+
+
+def test_exact_and_near_hits(document_db):
+    with transaction(document_db) as cursor:
+        store_answer(cursor, "What is APR?", REFERENCE, PARAMS, "APR answer", embedding(1, 0, 0))
+        assert lookup_answer(cursor, "what is apr", REFERENCE, PARAMS) == "APR answer"
+        # Different wording, retrieval and a close embedding: a near hit
+        assert lookup_answer(cursor, "Explain APR to me", [], PARAMS, embedding(0.99, 0.1, 0)) == "APR answer"
+        assert lookup_answer(cursor, "Explain escrow", [], PARAMS, embedding(0, 1, 0)) is None
+        assert lookup_answer(cursor, "What is APR?", REFERENCE, dict(PARAMS, temperature=0.1)) is None
+        stats = answer_cache_stats(cursor)
+    assert (stats['hits'], stats['near_hits'], stats['misses']) == (1, 1, 2)
+    assert not is_standalone_question("What about that?", [{"role": "user", "content": "What is APR?"}])
+    print("✅ Exact hits on normalized questions, near hits by embedding, misses on other settings")
+
+
+def test_upload_answers_stay_in_their_session(document_db):
+    with transaction(document_db) as cursor:
+        store_answer(cursor, "What is my rate?", upload("S1", "doc1"), PARAMS, "Your rate is 6.9%", embedding(1, 0, 0))
+        assert lookup_answer(cursor, "What's my rate", upload("S1", "doc1x"), PARAMS, embedding(1, 0, 0)) == "Your rate is 6.9%"
+        assert lookup_answer(cursor, "What's my rate", upload("S2", "doc2"), PARAMS, embedding(1, 0, 0)) is None
+        assert lookup_answer(cursor, "What's my rate", REFERENCE, PARAMS, embedding(1, 0, 0)) is None
+    print("✅ Answers citing an upload are only reused in the session that uploaded it")
+
+
+def test_new_and_removed_documents_invalidate(document_db):
+    with transaction(document_db) as cursor:
+        insert_document(cursor, "doc1", "statement.txt", "Statement: principal $18,250 at 6.9% APR.", "text", session_id="S1")
+        store_answer(cursor, "What is my rate?", upload("S1", "doc1"), PARAMS, "6.9%", embedding(1, 0, 0))
+        store_answer(cursor, "What is my balance?", upload("S2", "doc2"), PARAMS, "$5,000", embedding(0, 1, 0))
+        store_answer(cursor, "What is APR?", REFERENCE, PARAMS, "APR answer", embedding(0, 0, 1))
+
+        # A second upload in S1 could change the answer; S2 and shared answers still stand
+        insert_document(cursor, "doc3", "refinance.txt", "Refinance offer: 5.1% APR.", "text", session_id="S1")
+        assert lookup_answer(cursor, "What is my rate?", upload("S1", "doc1"), PARAMS, embedding(1, 0, 0)) is None
+        assert lookup_answer(cursor, "What is my balance?", upload("S2", "doc2"), PARAMS) == "$5,000"
+        assert lookup_answer(cursor, "What is APR?", REFERENCE, PARAMS) == "APR answer"
+
+        invalidate_documents(cursor, ["ref_apr"])
+        assert lookup_answer(cursor, "What is APR?", REFERENCE, PARAMS) is None
+        store_answer(cursor, "What is the refinance rate?", upload("S1", "doc3"), PARAMS, "5.1%")
+        delete_documents(cursor, ["doc3"])
+        assert lookup_answer(cursor, "What is the refinance rate?", upload("S1", "doc3"), PARAMS) is None
+        cursor.execute("SELECT COUNT(*) FROM answer_cache_documents WHERE document_id IN ('doc1', 'doc3', 'ref_apr')")
+        assert cursor.fetchone()[0] == 0
+    print("✅ Uploads drop their session's cached answers; changed or deleted documents drop the answers citing them")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent BM25 index and its pruned top-k search
+"""
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from bm25_index import init_bm25_index, index_chunks, remove_chunks, bm25_search, tokenize, term_score
+from storage import transaction
+
+WORDS = ("loan mortgage rate interest principal escrow payment term refinance balance credit score "
+         "lender borrower default forbearance deferment amortization fee penalty collateral").split()
+
+
+def add_chunks(cursor, chunks):
+    """chunks: (chunk id, text, session id)"""
+    cursor.executemany("INSERT INTO chunks (id, document_id, chunk_text, chunk_index, session_id) VALUES (?, 'doc', ?, 0, ?)",
+                       chunks)
+    index_chunks(cursor, [(chunk_id, text) for chunk_id, text, _ in chunks])
+
+
+def exhaustive_scores(cursor, query, session_id):
+    """Every visible chunk's BM25 score, computed straight from the chunk texts"""
+    cursor.execute("SELECT id, rowid, chunk_text FROM chunks WHERE session_id IS NULL OR session_id = ?", (session_id,))
+    visible = cursor.fetchall()
+    cursor.execute("SELECT id, chunk_text FROM chunks")
+    corpus = {chunk_id: Counter(tokenize(text)) for chunk_id, text in cursor.fetchall()}
+    avg_length = sum(sum(counts.values()) for counts in corpus.values()) / len(corpus)
+    scores = {}
+    for term in set(tokenize(query)):
+        doc_freq = sum(1 for counts in corpus.values() if term in counts)
+        if not doc_freq:
+            continue
+        idf = math.log(1 + (len(corpus) - doc_freq + 0.5) / (doc_freq + 0.5))
+        for chunk_id, rowid, _ in visible:
+            counts = corpus[chunk_id]
+            if term in counts:
+                scores[rowid] = scores.get(rowid, 0.0) + term_score(idf, counts[term], sum(counts.values()), avg_length)
+    return sorted(scores.values(), reverse=True)
+
+
+def test_pruned_search_matches_exhaustive_scoring(document_db):
+    rng = random.Random(7)
+    with transaction(document_db) as cursor:
+        chunks = []
+        for i in range(2000):
+            # Skewed word frequencies, so common terms have long postings lists worth skipping
+            text = " ".join(rng.choices(WORDS, weights=range(len(WORDS), 0, -1), k=rng.randint(5, 60)))
+            chunks.append((f"c{i}", text, rng.choice([None, None, "S1", "S2"])))
+        add_chunks(cursor, chunks)
+        remove_chunks(cursor, [f"c{i}" for i in range(0, 2000, 7)])
+        cursor.execute("DELETE FROM chunks WHERE CAST(substr(id, 2) AS INTEGER) % 7 = 0")
+
+        for query in ["loan rate penalty", "collateral amortization fee", "mortgage", "escrow loan loan refinance"]:
+            for session_id in [None, "S1"]:
+                expected = exhaustive_scores(cursor, query, session_id)[:10]
+                ranked = bm25_search(cursor, query, session_id, limit=10)
+                assert [round(score, 9) for _, score in ranked] == [round(score, 9) for score in expected], query
+                cursor.execute(f"SELECT COUNT(*) FROM chunks WHERE rowid IN ({','.join('?' * len(ranked))}) "
+                               "AND session_id IS NOT NULL AND session_id IS NOT ?",
+                               [rowid for rowid, _ in ranked] + [session_id])
+                assert cursor.fetchone()[0] == 0
+    print("✅ Pruned top-k search returns the exhaustive top 10, limited to visible chunks")
+
+
+def test_limit_must_be_positive(document_db):
+    with transaction(document_db) as cursor:
+        add_chunks(cursor, [("a", "mortgage rate", None)])
+        with pytest.raises(ValueError):
+            bm25_search(cursor, "mortgage", None, limit=0)
+    print("✅ A search without a finite limit is refused")
+
+
+def test_bounds_backfilled_for_existing_index(document_db):
+    with transaction(document_db) as cursor:
+        add_chunks(cursor, [("a", "rate rate rate mortgage", None), ("b", "rate", None)])
+        # An index built before the score bounds were kept
+        cursor.execute("CREATE TABLE old_terms AS SELECT term, doc_freq FROM bm25_terms")
+        cursor.execute("DROP TABLE bm25_terms")
+        cursor.execute("CREATE TABLE bm25_terms (term TEXT PRIMARY KEY, doc_freq INTEGER NOT NULL) WITHOUT ROWID")
+        cursor.execute("INSERT INTO bm25_terms SELECT * FROM old_terms")
+        init_bm25_index(cursor)
+        cursor.execute("SELECT max_term_freq, min_length FROM bm25_terms WHERE term = 'rate'")
+        assert cursor.fetchone() == (3, 1)
+        assert [rowid for rowid, _ in bm25_search(cursor, "rate", None, limit=1)] == [1]
+    print("✅ Score bounds filled in for an index built before they were kept")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for token-budgeted chat history with rolling summaries
+"""
+from chat_history import HistoryState, compact_history, compact_message, history_tokens, truncate_to_tokens
+from chunking import estimate_tokens
+
+
+def conversation(turns: int):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i} about a $2{i},000 loan. " + "detail " * 30})
+        history.append({"role": "assistant", "content": f"Answer {i}. " + "explanation " * 60})
+    return history
+
+
+def test_document_dumps_become_references():
+    dump = {"role": "assistant", "content": "✅ Successfully processed PDF: statement.pdf (3 pages, 1 read by OCR)\n\n"
+                                            "Extracted Content:\n" + "Account 1234 balance $5,000. " * 500}
+    compacted = compact_message(dump)
+    assert "statement.pdf" in compacted["content"] and estimate_tokens(compacted["content"]) < 40
+    text = {"role": "user", "content": "What is my balance?"}
+    assert compact_message(text) is text
+    print("✅ Upload dumps reduced to a reference")
+
+
+def test_history_fits_budget_and_summarizes_incrementally():
+    calls = []
+
+    def summarize(previous, messages, max_tokens):
+        calls.append(len(messages))
+        return (previous + " " if previous else "") + f"[{len(messages)} turns]"
+
+    state = HistoryState()
+    history = []
+    for turn in conversation(40):
+        compacted = compact_history(history, 1500, state, summarize)
+        assert history_tokens(compacted) <= 1500
+        history.append(turn)
+    compacted = compact_history(history, 1500, state, summarize)
+    assert compacted[0]["role"] == "system" and compacted[-1] == history[-1]
+    # Each folded turn was summarized once, in a handful of batches
+    assert sum(calls) == state.summarized and len(calls) < len(history) // 4
+    print(f"✅ 80 turns within 1500 tokens; {sum(calls)} turns folded in {len(calls)} summary calls")
+
+
+def test_summarizer_failure_and_reset():
+    def failing(previous, messages, max_tokens):
+        raise RuntimeError("model unavailable")
+
+    state = HistoryState()
+    history = conversation(20)
+    compacted = compact_history(history, 1000, state, failing)
+    assert "Question" in compacted[0]["content"] and history_tokens(compacted) <= 1000
+    assert compact_history(history[:2], 1000, state) == history[:2] and state.summarized == 0
+    assert truncate_to_tokens("word " * 100, 10, estimate_tokens).endswith("…")
+    print("✅ Extractive summary when the model fails; cleared chat resets the summary")
+
+
+if __name__ == "__main__":
+    test_document_dumps_become_references()
+    test_history_fits_budget_and_summarizes_incrementally()
+    test_summarizer_failure_and_reset()
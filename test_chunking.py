@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script for token-aware, markdown-section-aware chunking
+"""
+import os
+
+from chunking import chunk_document, chunk_id, word_tokens
+
+
+def tokens_of(text: str) -> int:
+    return sum(cost for _, _, cost in word_tokens(text))
+
+
+def test_windows_cover_every_word_with_unique_ids():
+    text = " ".join(f"word{i}" for i in range(3000))
+    chunks = chunk_document(text, max_tokens=200, overlap_tokens=30)
+    ids = [chunk_id("doc", chunk.index) for chunk in chunks]
+    assert len(set(ids)) == len(ids) == len(chunks)
+    covered = set(" ".join(chunk.text for chunk in chunks).split())
+    assert covered == set(text.split())
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    assert all(tokens_of(chunk.text) <= 200 for chunk in chunks)
+    # Consecutive windows overlap
+    assert all(later.start < earlier.end for earlier, later in zip(chunks, chunks[1:]))
+    assert chunk_document(text, max_tokens=200, overlap_tokens=30) == chunks
+    print(f"✅ {len(chunks)} overlapping windows, unique IDs, no lost words")
+
+
+def test_markdown_sections_kept_whole():
+    text = ("# Guide\n\nIntro line.\n\n## Rates\n\n" + "APR details. " * 40 +
+            "\n\n## Fees\n\n" + "Origination fee details. " * 40)
+    chunks = chunk_document(text, max_tokens=150, overlap_tokens=20)
+    assert chunks[0].text.startswith("# Guide") and "## Rates" in chunks[0].text
+    assert any(chunk.text.startswith("## Fees") for chunk in chunks)
+    assert not any("APR" in chunk.text and "Origination" in chunk.text for chunk in chunks)
+    print("✅ Chunks start at ## headings and short headings stay with their section")
+
+
+def test_reference_guides():
+    for filename in sorted(os.listdir("documents")):
+        if not filename.endswith(".txt"):
+            continue
+        with open(os.path.join("documents", filename), encoding="utf-8") as f:
+            text = f.read()
+        chunks = chunk_document(text)
+        assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+        assert set(" ".join(chunk.text for chunk in chunks).split()) == set(text.split())
+    print("✅ Every reference guide chunked into exact spans without losing words")
+
+
+if __name__ == "__main__":
+    test_windows_cover_every_word_with_unique_ids()
+    test_markdown_sections_kept_whole()
+    test_reference_guides()
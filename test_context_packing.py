@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Test script for merging, deduplicating and budgeting retrieved context
+"""
+from chunking import chunk_document, chunk_id
+from context_packing import merge_chunks, pack_context, context_tokens, split_sentences
+
+
+def as_results(document_id, text, chunks, page_number=None):
+    return [{'chunk_id': chunk_id(document_id, chunk.index, page_number), 'document_id': document_id,
+             'filename': f"{document_id}.txt", 'text': chunk.text, 'char_start': chunk.start, 'char_end': chunk.end}
+            for chunk in chunks]
+
+
+def test_overlapping_chunks_merged():
+    text = " ".join(f"Sentence number {i} about loans." for i in range(200))
+    chunks = chunk_document(text, max_tokens=100, overlap_tokens=20)
+    results = as_results("guide", text, chunks[2:5])
+    passages = merge_chunks(list(reversed(results)))
+    assert len(passages) == 1
+    assert passages[0]['text'] == text[chunks[2].start:chunks[4].end]
+    assert passages[0]['chunk_ids'] == [r['chunk_id'] for r in results]
+    # Same spans on different pages of one document stay apart
+    assert len(merge_chunks(as_results("scan", text, chunks[2:3], 1) + as_results("scan", text, chunks[2:3], 2))) == 2
+    print("✅ Overlapping chunks merged into one exact span")
+
+
+def test_duplicates_dropped_and_budget_kept():
+    repeated = "Fixed rates stay the same for the whole term of the loan."
+    results = [
+        {'chunk_id': 'a_chunk_0', 'document_id': 'a', 'filename': 'a.txt', 'char_start': None, 'char_end': None,
+         'text': f"{repeated} Variable rates follow the market index. " + " ".join(f"Unrelated filler sentence {i} here." for i in range(80))},
+        {'chunk_id': 'b_chunk_0', 'document_id': 'b', 'filename': 'b.txt', 'char_start': None, 'char_end': None,
+         'text': f"{repeated.replace('the loan', 'a loan')} Prepayment penalties apply to some fixed loans."},
+    ]
+    packed = pack_context("Do fixed rates change?", results, budget=60)
+    text = " ".join(passage['text'] for passage in packed)
+    assert text.count("Fixed rates stay the same") == 1
+    assert "filler" not in text and context_tokens(packed) <= 60
+    everything = pack_context("Do fixed rates change?", results, budget=10000)
+    assert "filler" in everything[0]['text']
+    print("✅ Near-duplicate sentences dropped; unrelated sentences cut only when over budget")
+
+
+def test_markdown_lines_kept_apart():
+    pieces = split_sentences("## Rates\n- **APR**: 6-8%. Lower for good credit.\n- **Fees**: 1-5%")
+    assert pieces == [("## Rates", ""), ("- **APR**: 6-8%.", "\n"), ("Lower for good credit.", " "),
+                      ("- **Fees**: 1-5%", "\n")]
+    print("✅ Headings and bullets split as their own sentences")
+
+
+if __name__ == "__main__":
+    test_overlapping_chunks_merged()
+    test_duplicates_dropped_and_budget_kept()
+    test_markdown_lines_kept_apart()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script for the hierarchical map-reduce merge of page texts
+"""
+import threading
+import time
+
+from chunking import estimate_tokens
+from document_merge import group_by_token_budget, hierarchical_merge
+
+
+def test_groups_respect_budget():
+    sections = [(f"Page {i + 1}", "x" * 4000) for i in range(10)]  # ~1000 tokens each
+    groups = group_by_token_budget(sections, 3500)
+    assert [len(g) for g in groups] == [3, 3, 3, 1]
+    assert all(sum(estimate_tokens(text) for _, text in g) <= 3500 for g in groups)
+    assert [label for label, _ in sum(groups, [])] == [label for label, _ in sections]
+    print("✅ Pages grouped in order under the token budget")
+
+
+def test_rounds_grow_with_log_pages():
+    calls = []
+    lock = threading.Lock()
+
+    def summarize(group, final):
+        with lock:
+            calls.append((group[0][0], group[-1][0], final))
+        time.sleep(0.01)
+        return "summary " * 200  # ~400 tokens
+
+    for pages in (10, 200):
+        calls.clear()
+        start = time.time()
+        result = hierarchical_merge([(f"Page {i + 1}", "word " * 2000) for i in range(pages)], summarize,
+                                    group_tokens=12000, max_workers=8)
+        assert result.startswith("summary")
+        assert calls[-1][2] and sum(final for _, _, final in calls) == 1
+        print(f"✅ {pages} pages merged with {len(calls)} calls in {time.time() - start:.2f}s")
+    # Second level merges summaries labelled by the page spans they cover
+    assert ("Pages 1-4", "Pages 113-116", False) in calls
+    assert calls[-1] == ("Pages 1-116", "Pages 117-200", True)
+
+
+def test_short_document_single_call():
+    calls = []
+    result = hierarchical_merge([("Page 1", "APR 6.5%")], lambda group, final: calls.append(final) or "done")
+    assert result == "done" and calls == [True]
+    print("✅ Short document merged in one call")
+
+
+if __name__ == "__main__":
+    test_groups_respect_budget()
+    test_rounds_grow_with_log_pages()
+    test_short_document_single_call()
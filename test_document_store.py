@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Test script for storing uploads with their chunks and indexes
+"""
+import pytest
+
+from document_store import insert_document, delete_documents
+from retrieval_pipeline import retrieve, bm25_candidates, fts_candidates
+from storage import transaction
+
+STATEMENT = "Loan statement: the outstanding principal on account 4471 is $18,250 at 6.9% APR."
+
+
+def visible_documents(cursor, session_id):
+    results = retrieve(cursor, "outstanding principal account 4471", session_id, 5, [bm25_candidates, fts_candidates])
+    return sorted({result['document_id'] for result in results})
+
+
+def test_same_file_in_two_sessions(document_db):
+    with transaction(document_db) as cursor:
+        insert_document(cursor, "docA", "statement.txt", STATEMENT, "text", session_id="S1")
+        insert_document(cursor, "docB", "statement.txt", STATEMENT, "text", session_id="S2")
+        documents = cursor.execute("SELECT id, session_id FROM documents ORDER BY id").fetchall()
+        assert documents == [("docA", "S1"), ("docB", "S2")]
+        assert visible_documents(cursor, "S1") == ["docA"]
+        assert visible_documents(cursor, "S2") == ["docB"]
+    print("✅ The same file uploaded in two sessions is stored and retrievable in both")
+
+
+def test_reupload_in_same_session_replaces(document_db):
+    with transaction(document_db) as cursor:
+        _, first = insert_document(cursor, "doc1", "statement.txt", STATEMENT, "text", session_id="S1")
+        # Different files that happen to extract to the same text are kept apart
+        insert_document(cursor, "other", "renamed.txt", STATEMENT, "text", session_id="S1")
+        delete_documents(cursor, ["other"])
+        removed, _ = insert_document(cursor, "doc2", "statement.txt", STATEMENT, "text", session_id="S1")
+        assert removed == [rowid for rowid, _ in first]
+        assert cursor.execute("SELECT id FROM documents").fetchall() == [("doc2",)]
+        assert cursor.execute("SELECT COUNT(*) FROM chunks WHERE document_id = 'doc1'").fetchone()[0] == 0
+        assert cursor.execute("SELECT COUNT(*) FROM bm25_postings WHERE chunk_id LIKE 'doc1_%'").fetchone()[0] == 0
+        assert visible_documents(cursor, "S1") == ["doc2"]
+
+        delete_documents(cursor, ["doc2"])
+        assert visible_documents(cursor, "S1") == []
+        assert cursor.execute("SELECT chunk_count FROM bm25_stats").fetchone()[0] == 0
+    print("✅ Re-uploading in the same session replaces the earlier copy and its index entries")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script for the FTS5 chunk index and the triggers keeping it in sync
+"""
+import pytest
+
+from fts_index import init_fts_index, rebuild_fts_index, build_match_query
+from storage import transaction, init_document_tables
+
+
+def add_chunk(cursor, key, text):
+    cursor.execute("INSERT INTO chunks (id, document_id, chunk_text, chunk_index) VALUES (?, 'doc', ?, 0)", (key, text))
+    return cursor.lastrowid
+
+
+def matches(cursor, query):
+    cursor.execute("SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY rowid", (build_match_query(query),))
+    return [rowid for (rowid,) in cursor.fetchall()]
+
+
+def test_triggers_follow_chunk_writes(document_db):
+    with transaction(document_db) as cursor:
+        escrow = add_chunk(cursor, "a", "Escrow accounts hold property taxes")
+        forgiveness = add_chunk(cursor, "b", "Student loan forgiveness after 120 payments")
+        assert matches(cursor, "escrow") == [escrow]
+        # Porter stemming: "payment" finds "payments"
+        assert matches(cursor, "payment") == [forgiveness]
+
+        cursor.execute("UPDATE chunks SET chunk_text = 'Refinancing an auto loan' WHERE rowid = ?", (escrow,))
+        assert matches(cursor, "escrow") == []
+        assert matches(cursor, "refinancing") == [escrow]
+
+        # Replacing a chunk by id drops the old entry even though no delete trigger fires
+        cursor.execute('''
+            INSERT OR REPLACE INTO chunks (id, document_id, chunk_text, chunk_index) VALUES ('b', 'doc', 'Credit card balance', 0)
+        ''')
+        assert matches(cursor, "forgiveness") == []
+        assert len(matches(cursor, "credit")) == 1
+
+        cursor.execute("DELETE FROM chunks")
+        assert matches(cursor, "refinancing credit") == []
+        cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('integrity-check')")
+    print("✅ Inserts, updates, replacements and deletes on chunks kept in the FTS index")
+
+
+def test_rebuild_backfills_existing_chunks(db_path):
+    with transaction(db_path) as cursor:
+        init_document_tables(cursor)
+        rowid = add_chunk(cursor, "a", "Fixed-rate mortgage terms")
+        assert init_fts_index(cursor)
+        assert not init_fts_index(cursor)
+        rebuild_fts_index(cursor)
+        assert matches(cursor, "mortgage") == [rowid]
+    print("✅ Chunks written before the index existed found after a rebuild")
+
+
+def test_match_query_quotes_terms(document_db):
+    assert build_match_query('What is "APR" OR NEAR(rate)?') == '"apr" OR "near" OR "rate"'
+    assert build_match_query("?!") == ""
+    with transaction(document_db) as cursor:
+        rowid = add_chunk(cursor, "a", "The APR includes fees")
+        # FTS5 operators in user text are searched as plain words, not parsed
+        assert matches(cursor, 'apr AND NOT "fees') == [rowid]
+    print("✅ Free text turned into a safe OR query of quoted terms")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
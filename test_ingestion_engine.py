@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script for the asyncio OCR ingestion engine against the local stub Watsonx server
+"""
+import asyncio
+import time
+
+from stub_watsonx_server import start_stub_server, StubWatsonxHandler, STUB_ANSWER
+from ingestion_engine import AdaptiveLimit, IngestionEngine
+from watsonx_client import IAMTokenManager
+
+server = start_stub_server()
+BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+CHAT_URL = f"{BASE_URL}/ml/v1/text/chat?version=2023-03-29"
+IAM_URL = f"{BASE_URL}/identity/token"
+
+engine = IngestionEngine(CHAT_URL, IAMTokenManager(IAM_URL, "stub-key"), max_concurrency=6, tenant_concurrency=3)
+
+
+def page_body(text):
+    return {"model_id": "stub", "project_id": "stub",
+            "messages": [{"role": "user", "content": [{"type": "text", "text": text}]}]}
+
+
+def test_results_in_page_order():
+    pages = [f"ECHO page {i}" for i in range(200)]
+    StubWatsonxHandler.max_in_flight = 0
+    start = time.time()
+    results = engine.ocr_pages("tenant-a", (page_body(text) for text in pages))
+    assert results == [text[len("ECHO "):] for text in pages]
+    assert StubWatsonxHandler.max_in_flight <= 3
+    print(f"✅ 200 pages returned in page order in {time.time() - start:.1f}s")
+
+
+def test_tenants_share_global_limit():
+    StubWatsonxHandler.max_in_flight = 0
+    jobs = [engine.submit(f"tenant-{t}", [page_body(f"ECHO {t}-{i}") for i in range(20)], total=20) for t in "bcd"]
+    for t, job in zip("bcd", jobs):
+        assert job.result() == [f"{t}-{i}" for i in range(20)]
+        assert job.completed == job.total
+    assert 3 < StubWatsonxHandler.max_in_flight <= 6
+    print(f"✅ Three tenants ran {StubWatsonxHandler.max_in_flight} requests at once under the global limit")
+
+
+def test_429_retried_and_limit_backs_off():
+    results = engine.ocr_pages("tenant-e", [page_body("RATE_LIMIT ingest")])
+    assert results == [STUB_ANSWER]
+    assert engine.limit.limit < engine.limit.maximum
+    print(f"✅ 429 retried; global limit backed off to {engine.limit.limit}")
+
+
+def test_aimd():
+    async def run():
+        limit = AdaptiveLimit(8)
+        limit.on_throttled()
+        limit.on_throttled()  # same burst, ignored
+        assert limit.limit == 4
+        for _ in range(4):
+            limit.on_success()
+        assert limit.limit == 5
+    asyncio.run(run())
+    print("✅ Limit halves on 429 and recovers additively")
+
+
+if __name__ == "__main__":
+    test_results_in_page_order()
+    test_tenants_share_global_limit()
+    test_429_retried_and_limit_backs_off()
+    test_aimd()
+    engine.close()
+    server.shutdown()
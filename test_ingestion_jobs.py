@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent ingestion job queue and worker pool
+"""
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from ingestion_jobs import (
+    JobWorkerPool, init_jobs, enqueue_job, claim_next_job, cancel_job, list_jobs, RUNNING, DONE, FAILED
+)
+
+
+def wait_for(db_path, session_id, statuses, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        conn = sqlite3.connect(db_path)
+        jobs = list_jobs(conn.cursor(), session_id)
+        conn.close()
+        if jobs and all(job['status'] in statuses for job in jobs):
+            return jobs
+        time.sleep(0.05)
+    raise AssertionError(f"jobs did not reach {statuses}: {jobs}")
+
+
+def test_claim_in_order_and_cancel(db_path):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    init_jobs(cursor)
+    first = enqueue_job(cursor, "s1", "a.pdf", b"a")
+    second = enqueue_job(cursor, "s1", "b.pdf", b"b")
+    assert claim_next_job(cursor)['id'] == first
+    assert not cancel_job(cursor, first)  # already running
+    assert cancel_job(cursor, second)
+    assert claim_next_job(cursor) is None
+    print("✅ Oldest job claimed first; only queued jobs can be removed")
+
+
+def test_workers_report_progress_and_failures(db_path):
+    def handler(job, report_progress):
+        if job['payload'] == b"boom":
+            raise ValueError("unreadable file")
+        for page in range(1, 4):
+            report_progress(page, 3)
+        return f"processed {job['filename']}", f"doc-{job['filename']}"
+
+    pool = JobWorkerPool(db_path, handler, workers=2, poll_interval=0.1)
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        pool.submit("s1", name, b"data")
+    pool.submit("s1", "bad.pdf", b"boom")
+    jobs = {job['filename']: job for job in wait_for(db_path, "s1", (DONE, FAILED))}
+    pool.stop()
+    assert jobs['a.pdf']['status'] == DONE and jobs['a.pdf']['pages_done'] == 3
+    assert jobs['a.pdf']['document_id'] == "doc-a.pdf"
+    assert jobs['bad.pdf']['status'] == FAILED and "unreadable" in jobs['bad.pdf']['error']
+    print("✅ Workers ran jobs, recorded progress and failures")
+
+
+def test_interrupted_jobs_resume(db_path):
+    conn = sqlite3.connect(db_path)
+    init_jobs(conn.cursor())
+    job_id = enqueue_job(conn.cursor(), "s2", "statement.pdf", b"data")
+    # Its last heartbeat was an hour ago
+    conn.execute("UPDATE ingestion_jobs SET status = ?, attempts = 1, heartbeat_at = ? WHERE id = ?",
+                 (RUNNING, time.time() - 3600, job_id))
+    conn.commit()
+    conn.close()
+
+    ran = threading.Event()
+    pool = JobWorkerPool(db_path, lambda job, report: (ran.set(), ("resumed", None))[1], workers=1, poll_interval=0.1)
+    jobs = wait_for(db_path, "s2", (DONE,))
+    pool.stop()
+    assert ran.is_set() and jobs[0]['result'] == "resumed"
+    print("✅ Job left running by a previous process resumed")
+
+
+def test_live_jobs_not_requeued(db_path):
+    conn = sqlite3.connect(db_path)
+    init_jobs(conn.cursor())
+    job_id = enqueue_job(conn.cursor(), "s3", "elsewhere.pdf", b"data")
+    # Running in another process that has just beaten
+    conn.execute("UPDATE ingestion_jobs SET status = ?, attempts = 1, heartbeat_at = ? WHERE id = ?",
+                 (RUNNING, time.time(), job_id))
+    conn.commit()
+    conn.close()
+
+    runs = Counter()
+
+    def handler(job, report_progress):
+        runs[job['filename']] += 1
+        time.sleep(0.6)
+        return "processed", None
+
+    pool = JobWorkerPool(db_path, handler, workers=2, poll_interval=0.05, heartbeat_interval=0.05, stale_after=0.3)
+    time.sleep(0.1)
+    assert not runs and wait_for(db_path, "s3", (RUNNING,))[0]['id'] == job_id
+    pool.submit("s4", "slow.pdf", b"data")
+    wait_for(db_path, "s4", (DONE,))
+    # Once the other process stops beating, its job is taken over
+    wait_for(db_path, "s3", (DONE,))
+    pool.stop()
+    # The pool's own heartbeat kept its slow job from being taken over while it ran
+    assert runs == {"slow.pdf": 1, "elsewhere.pdf": 1}
+    print("✅ Running jobs requeued only after their heartbeat stops")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
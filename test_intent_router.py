@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for local intent routing: glossary lookups, calculator questions and route statistics
+"""
+import sqlite3
+
+from intent_router import GlossaryIndex, route_question, init_route_stats, record_route, route_stats, GLOSSARY, CALCULATOR, MODEL
+
+GLOSSARY_INDEX = GlossaryIndex.from_file()
+
+
+def test_glossary_lookups():
+    route = route_question("What is a balloon payment?", GLOSSARY_INDEX)
+    assert route.kind == GLOSSARY and route.detail == "Balloon Payment"
+    assert "large payment due at the end" in route.answer
+    assert route_question("what's APR", GLOSSARY_INDEX).detail == "Annual Percentage Rate (APR)"
+    assert route_question("What are origination fees?", GLOSSARY_INDEX).detail == "Origination Fee"
+    # More than the bare term is a question for the model
+    assert route_question("What is a good credit score for a mortgage?", GLOSSARY_INDEX).kind == MODEL
+    assert route_question("What is the APR on a typical car loan?", GLOSSARY_INDEX).kind == MODEL
+    print(f"✅ Glossary answers for bare definition questions ({len(GLOSSARY_INDEX)} keys)")
+
+
+def test_calculator_questions():
+    route = route_question("What is the monthly payment on a $25,000 loan at 8.5% for 5 years?", GLOSSARY_INDEX)
+    assert route.kind == CALCULATOR and "$512.91" in route.answer and "$5,774.80" in route.answer
+    route = route_question("Pay an extra $200 a month on a $200k mortgage at 6% for 30 years?", GLOSSARY_INDEX)
+    assert route.detail == "payoff_with_extra_payments" and "252 months" in route.answer
+    route = route_question("interest-only payment on $200,000 at 6%", GLOSSARY_INDEX)
+    assert route.detail == "interest_only_payment" and "$1,000.00" in route.answer
+    for question in ("Should I take a $25,000 loan at 8.5% for 5 years?",
+                     "Compare 5% and 6% on $300k for 30 years",
+                     "What is the payment on a $20,000 loan?"):
+        assert route_question(question, GLOSSARY_INDEX).kind == MODEL, question
+    print("✅ Fully specified loan math answered locally; advice and incomplete questions go to the model")
+
+
+def test_partial_term_questions_go_to_model():
+    # Full-term totals would be a confident wrong answer to each of these
+    for question in ("How much interest do I pay in the first year on $200,000 at 6% for 30 years?",
+                     "I have a $15,000 loan at 7% for 36 months and I already paid 12 payments, how much interest remains?",
+                     "What is my balance after 60 payments on a $300k mortgage at 6.5% for 30 years?",
+                     "How much principal is left on $250,000 at 5% after 5 years?",
+                     "Interest paid in year 3 of a $40,000 loan at 9% for 5 years?",
+                     "How much do I still owe on a $20,000 loan at 6% for 48 months?",
+                     "What is the interest on the 12th payment of a $100k loan at 4% for 15 years?",
+                     "How much interest do I pay over the first 5 years of a $400,000 mortgage at 7%?"):
+        assert route_question(question, GLOSSARY_INDEX).kind == MODEL, question
+    route = route_question("How much total interest on a $200,000 loan at 6% for 30 years?", GLOSSARY_INDEX)
+    assert route.kind == CALCULATOR and "$231,676.38" in route.answer
+    print("✅ Questions about part of the term or payments already made go to the model")
+
+
+def test_route_stats():
+    cursor = sqlite3.connect(":memory:").cursor()
+    init_route_stats(cursor)
+    init_route_stats(cursor)
+    record_route(cursor, MODEL, 2000.0)
+    record_route(cursor, MODEL, 4000.0)
+    record_route(cursor, GLOSSARY, 1.0)
+    record_route(cursor, GLOSSARY, 3.0)
+    stats = route_stats(cursor)
+    assert stats[MODEL] == {'requests': 2, 'mean_ms': 3000.0}
+    assert stats[GLOSSARY]['saved_ms'] == 2 * (3000.0 - 2.0)
+    assert stats[CALCULATOR]['requests'] == 0 and stats[CALCULATOR]['saved_ms'] == 0.0
+    print("✅ Route counts and latency saved against the mean model answer")
+
+
+if __name__ == "__main__":
+    test_glossary_lookups()
+    test_calculator_questions()
+    test_partial_term_questions_go_to_model()
+    test_route_stats()
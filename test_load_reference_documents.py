@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for the bulk reference loader and the cleanup script
+"""
+import os
+
+import pytest
+
+from cleanup_database import cleanup_test_data
+from load_reference_documents import load_documents
+from storage import transaction
+from test_vector_store import bag_of_words
+from vector_store import VectorStore
+
+GUIDES = {
+    "mortgage.txt": "## Fixed rates\nA fixed-rate mortgage keeps the same interest rate for the whole term.\n",
+    "student.txt": "## Forgiveness\nPublic service loan forgiveness cancels the balance after 120 payments.\n",
+    "auto.txt": "## Auto loans\nA shorter auto loan term lowers the total interest paid.\n",
+}
+
+
+def temp_library(directory):
+    documents_dir = os.path.join(directory, "documents")
+    os.mkdir(documents_dir)
+    for filename, text in GUIDES.items():
+        with open(os.path.join(documents_dir, filename), "w") as f:
+            f.write(text)
+    return documents_dir, os.path.join(directory, "documents.db")
+
+
+def index_counts(db_path):
+    with transaction(db_path) as cursor:
+        cursor.execute("SELECT COUNT(*) FROM documents")
+        documents = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM chunks")
+        chunks = cursor.fetchone()[0]
+        cursor.execute("SELECT chunk_count FROM bm25_stats")
+        indexed = cursor.fetchone()[0]
+    return documents, chunks, indexed
+
+
+def test_incremental_reload(tmp_path):
+    documents_dir, db_path = temp_library(tmp_path)
+    assert sorted(load_documents(documents_dir, db_path, workers=1)) == sorted(GUIDES)
+    assert index_counts(db_path) == (3, 3, 3)
+    # Nothing changed on disk
+    assert load_documents(documents_dir, db_path, workers=1) == []
+
+    with open(os.path.join(documents_dir, "auto.txt"), "a") as f:
+        f.write("\n## Refinancing\nRefinancing an auto loan can lower the rate.\n")
+    os.remove(os.path.join(documents_dir, "student.txt"))
+    assert load_documents(documents_dir, db_path, workers=1) == ["auto.txt"]
+    with transaction(db_path) as cursor:
+        cursor.execute("SELECT filename FROM documents ORDER BY filename")
+        assert cursor.fetchall() == [("auto.txt",), ("mortgage.txt",)]
+        cursor.execute("SELECT COUNT(*) FROM bm25_postings WHERE chunk_id LIKE 'ref_student%'")
+        assert cursor.fetchone()[0] == 0
+        cursor.execute("SELECT COUNT(*) FROM chunks c JOIN bm25_chunk_lengths l ON l.chunk_id = c.id")
+        assert cursor.fetchone()[0] == index_counts(db_path)[1]
+    print("✅ Unchanged guides skipped; changed guides reloaded and deleted ones removed with their index entries")
+
+
+def test_vectors_follow_loader_and_cleanup(tmp_path):
+    documents_dir, db_path = temp_library(tmp_path)
+    load_documents(documents_dir, db_path, workers=1)
+    store = VectorStore(os.path.dirname(db_path), "test-model", encode=bag_of_words)
+    with transaction(db_path) as cursor:
+        cursor.execute("SELECT rowid, chunk_text FROM chunks WHERE document_id = 'ref_student'")
+        student = cursor.fetchall()
+        cursor.execute("SELECT rowid, chunk_text FROM chunks")
+        rows = cursor.fetchall()
+    store.add([rowid for rowid, _ in rows], [text for _, text in rows])
+
+    os.remove(os.path.join(documents_dir, "student.txt"))
+    load_documents(documents_dir, db_path, workers=1)
+    assert not set(rowid for rowid, _ in student) & set(store.indexed())
+
+    cleanup_test_data(db_path)
+    assert index_counts(db_path) == (0, 0, 0)
+    assert store.indexed() == {}
+    print("✅ Vectors of removed guides dropped by the loader; cleanup empties the tables and the vector store")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the vectorized loan calculator and its tool-calling round trip against the stub Watsonx server
+"""
+import json
+import time
+
+import numpy as np
+
+from loan_calculator import (
+    monthly_payment, remaining_balance, amortization_schedule, apr_with_fees, payoff_with_extra,
+    refinance_break_even, run_tool, run_tool_call, CALCULATOR_TOOLS
+)
+from stub_watsonx_server import start_stub_server
+from watsonx_client import complete_chat, stream_chat_with_fallback
+
+server = start_stub_server()
+BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+CHAT_URL = f"{BASE_URL}/ml/v1/text/chat?version=2023-03-29"
+STREAM_URL = f"{BASE_URL}/ml/v1/text/chat_stream?version=2023-03-29"
+HEADERS = {"Authorization": "Bearer stub-token", "Content-Type": "application/json"}
+
+
+def simulate(principal, annual_rate, payment):
+    """Month-by-month loop the closed forms must agree with: (months, total interest)"""
+    balance, interest_paid, months = principal, 0.0, 0
+    while balance > 1e-9:
+        interest = balance * annual_rate / 1200
+        balance -= min(payment, balance + interest) - interest
+        interest_paid += interest
+        months += 1
+    return months, interest_paid
+
+
+def test_closed_forms_match_simulation():
+    payment = float(monthly_payment(25000, 8.5, 60))
+    assert round(payment, 2) == 512.91
+    assert simulate(25000, 8.5, payment)[0] == 60
+    assert float(monthly_payment(12000, 0, 24)) == 500.0
+
+    schedule = amortization_schedule(25000, 8.5, 60)
+    assert abs(schedule['balance'][23] - float(remaining_balance(25000, 8.5, 60, 24))) < 1e-6
+    assert abs(schedule['balance'][-1]) < 1e-6
+
+    payoff = payoff_with_extra(200000, 6.0, 360, 200)
+    months, interest = simulate(200000, 6.0, float(payoff['payment']))
+    assert payoff['payoff_months'] == months
+    assert abs(float(payoff['total_interest']) - interest) < 0.01
+    assert abs(amortization_schedule(200000, 6.0, 360, 200)['interest'].sum() - interest) < 0.01
+    print(f"✅ Payment ${payment:.2f}; extra $200/month pays off in {months} months, matching a month-by-month loop")
+
+
+def test_apr_and_refinance():
+    # Financing $20,000 with $700 of fees: the payments on 20,000 must repay only 19,300
+    apr = float(apr_with_fees(20000, 7.5, 60, 700))
+    r = apr / 1200
+    payment = float(monthly_payment(20000, 7.5, 60))
+    assert abs(payment * (1 - (1 + r) ** -60) / r - 19300) < 0.01
+    assert abs(float(apr_with_fees(20000, 7.5, 60, 0)) - 7.5) < 1e-6
+
+    refinance = refinance_break_even(250000, 7.0, 300, 5.5, 360, 4000)
+    assert refinance['break_even_months'] == np.ceil(4000 / refinance['monthly_savings'])
+    assert np.isinf(refinance_break_even(250000, 5.0, 300, 6.0, 300, 4000)['break_even_months'])
+    print(f"✅ APR with fees {apr:.2f}%, refinance breaks even after {int(refinance['break_even_months'])} months")
+
+
+def test_scenario_grid():
+    principal = np.linspace(50000, 500000, 100)[:, None, None]
+    rates = np.linspace(3, 9, 25)[None, :, None]
+    terms = np.array([180, 240, 360])[None, None, :]
+    start = time.perf_counter()
+    payments = monthly_payment(principal, rates, terms)
+    aprs = apr_with_fees(principal, rates, terms, 3000)
+    elapsed = (time.perf_counter() - start) * 1000
+    assert payments.shape == aprs.shape == (100, 25, 3)
+    assert np.all(aprs > rates)
+    spot = float(monthly_payment(float(principal[10, 0, 0]), float(rates[0, 4, 0]), 240))
+    assert abs(payments[10, 4, 1] - spot) < 1e-9
+
+    result = run_tool("loan_payment", {"principal": [200000, 300000], "annual_rate": [6, 6.5, 7], "months": 360})
+    assert result['scenarios'] == 6 and result['results'][0]['monthly_payment'] == 1199.1
+    assert 'error' in run_tool("loan_payment", {"principal": 1000})
+    # A huge term would build a schedule row for every month
+    assert 'error' in run_tool("amortization_schedule", {"principal": 1000, "annual_rate": 5, "months": 10 ** 12})
+    assert 'error' in run_tool("refinance_break_even", {"balance": 1000, "current_rate": 5, "remaining_months": 0,
+                                                        "new_rate": 4, "new_months": 360, "closing_costs": 100})
+    print(f"✅ {payments.size} payment and APR scenarios in {elapsed:.1f} ms")
+
+
+def test_tool_round_trip():
+    arguments = {"principal": 25000, "annual_rate": 8.5, "months": 60}
+    prompt = f"TOOL loan_payment {json.dumps(arguments)}"
+    expected = json.loads(run_tool_call({"function": {"name": "loan_payment", "arguments": json.dumps(arguments)}}))
+    assert {tool["function"]["name"] for tool in CALCULATOR_TOOLS} >= {"loan_payment", "amortization_schedule"}
+
+    for streaming in (False, True):
+        messages = [{"role": "user", "content": prompt}]
+        body = {"model_id": "stub", "project_id": "stub", "messages": messages,
+                "tools": CALCULATOR_TOOLS, "tool_choice_option": "auto"}
+        tool_calls = []
+        if streaming:
+            answer = "".join(stream_chat_with_fallback(STREAM_URL, CHAT_URL, HEADERS, body, tool_calls=tool_calls))
+        else:
+            answer = complete_chat(CHAT_URL, HEADERS, body, tool_calls=tool_calls)
+        assert answer == "" and len(tool_calls) == 1
+        assert json.loads(tool_calls[0]["function"]["arguments"]) == arguments
+
+        messages.append({"role": "assistant", "tool_calls": tool_calls})
+        messages.append({"role": "tool", "tool_call_id": tool_calls[0]["id"], "content": run_tool_call(tool_calls[0])})
+        answer = complete_chat(CHAT_URL, HEADERS, body)
+        assert json.loads(answer[len("Tool result: "):]) == expected
+    print("✅ Tool call requested, merged from streamed fragments, run locally and answered")
+
+
+if __name__ == "__main__":
+    test_closed_forms_match_simulation()
+    test_apr_and_refinance()
+    test_scenario_grid()
+    test_tool_round_trip()
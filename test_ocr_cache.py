@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed OCR cache
+"""
+import time
+
+import pytest
+
+from ocr_cache import make_ocr_key, lookup_ocr, store_ocr, clear_ocr_cache, ocr_cache_stats, FILE, PAGE
+from storage import transaction
+
+
+def test_keys_follow_content_and_settings():
+    key = make_ocr_key(b"%PDF page bytes", "prompt-v2", "vision-model")
+    assert key == make_ocr_key(b"%PDF page bytes", "prompt-v2", "vision-model")
+    assert key != make_ocr_key(b"%PDF other bytes", "prompt-v2", "vision-model")
+    assert key != make_ocr_key(b"%PDF page bytes", "prompt-v3", "vision-model")
+    # Context is hashed as a list, so values cannot run together
+    assert make_ocr_key(b"x", "ab", "c") != make_ocr_key(b"x", "a", "bc")
+    print("✅ Keys change with the bytes and with every setting that shapes the output")
+
+
+def test_hits_misses_and_kinds(document_db):
+    page_key = make_ocr_key(b"page image", "v1")
+    with transaction(document_db) as cursor:
+        assert lookup_ocr(cursor, page_key, PAGE) is None
+        store_ocr(cursor, page_key, PAGE, "Monthly payment: $1,245.60", {"page": 3})
+        assert lookup_ocr(cursor, page_key, PAGE) == ("Monthly payment: $1,245.60", {"page": 3})
+        assert lookup_ocr(cursor, page_key, PAGE)[1] == {"page": 3}
+        # The same key under the other kind is not a hit
+        assert lookup_ocr(cursor, page_key, FILE) is None
+
+        stats = ocr_cache_stats(cursor)
+        assert (stats['page_hits'], stats['page_misses'], stats['file_hits'], stats['file_misses']) == (2, 1, 0, 1)
+        assert abs(stats['page_hit_rate'] - 2 / 3) < 1e-9 and stats['entries'] == 1
+        cursor.execute("SELECT hit_count FROM ocr_cache WHERE cache_key = ?", (page_key,))
+        assert cursor.fetchone()[0] == 2
+
+        clear_ocr_cache(cursor)
+        assert lookup_ocr(cursor, page_key, PAGE) is None
+        assert ocr_cache_stats(cursor)['bytes'] == 0
+    print("✅ Page and file results cached apart, with hit and miss counters that survive a clear")
+
+
+def test_evicts_least_recently_used(document_db):
+    text = "x" * 1000
+    with transaction(document_db) as cursor:
+        for name in ["a", "b", "c"]:
+            store_ocr(cursor, name, PAGE, text)
+            time.sleep(0.01)
+        # Touch "a" so that "b" is now the least recently used
+        lookup_ocr(cursor, "a", PAGE)
+        time.sleep(0.01)
+        store_ocr(cursor, "d", PAGE, text, max_bytes=3 * 1100)
+        cursor.execute("SELECT cache_key FROM ocr_cache ORDER BY cache_key")
+        assert [key for (key,) in cursor.fetchall()] == ["a", "c", "d"]
+        assert ocr_cache_stats(cursor)['bytes'] <= 3 * 1100
+    print("✅ Least recently used entries evicted beyond the size cap")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for native Word, Excel and CSV extraction
+"""
+import datetime
+import io
+
+import docx
+import openpyxl
+
+from chunking import chunk_blocks
+from office_extraction import extract_office_document
+
+
+def make_docx() -> bytes:
+    document = docx.Document()
+    document.add_heading("Loan Agreement", level=1)
+    document.add_paragraph("The borrower agrees to repay the principal in monthly installments.")
+    table = document.add_table(rows=3, cols=3)
+    for row, values in zip(table.rows, [("Payment", "Due date", "Amount"),
+                                        ("1", "2024-02-01", "$512.91"), ("2", "2024-03-01", "$512.91")]):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+    document.add_heading("Late Fees", level=2)
+    document.add_paragraph("A fee of 5% applies to payments more than 15 days late.")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_xlsx(rows: int) -> bytes:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Transactions"
+    sheet.append(["Date", "Description", "Amount"])
+    for i in range(rows):
+        sheet.append([datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i), f"Payment {i}", -250.0])
+    summary = workbook.create_sheet("Summary")
+    summary.append([2024, 12000.5])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_docx_keeps_order_and_flattens_tables():
+    content, chunks, stats = extract_office_document("agreement.docx", make_docx())
+    lines = content.split("\n")
+    assert lines[0] == "# Loan Agreement" and lines[-2] == "## Late Fees"
+    assert "Table 1, Row 2: Payment: 1; Due date: 2024-02-01; Amount: $512.91" in lines
+    assert stats == {'paragraphs': 2, 'tables': 1, 'rows': 2}
+    assert all(content[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    print("✅ Word paragraphs, headings and table rows extracted in document order")
+
+
+def test_xlsx_rows_chunked_without_splitting():
+    content, chunks, stats = extract_office_document("export.xlsx", make_xlsx(500))
+    assert stats == {'sheets': 2, 'rows': 501}
+    assert "Transactions, Row 2: Date: 2024-01-01; Description: Payment 0; Amount: -250" in content
+    # A sheet without a header row names values by column
+    assert "Summary, Row 1: Column A: 2024; Column B: 12000.5" in content
+    assert len(chunks) > 10
+    for chunk in chunks:
+        assert content[chunk.start:chunk.end] == chunk.text
+        assert all(line.startswith(("Transactions, Row", "Summary, Row")) for line in chunk.text.split("\n"))
+    print(f"✅ 501 spreadsheet rows in {len(chunks)} chunks, none cut mid-row")
+
+
+def test_csv_dialect_and_encoding():
+    data = "\ufeffDate;Amount\n2024-01-01;1.200,50\n\n2024-02-01;900\n".encode("utf-8")
+    content, chunks, stats = extract_office_document("bank.csv", data)
+    assert content == "Row 2: Date: 2024-01-01; Amount: 1.200,50\nRow 4: Date: 2024-02-01; Amount: 900"
+    assert stats == {'rows': 2} and len(chunks) == 1
+    latin = "Name,City\nJosé,Montréal\n".encode("cp1252")
+    assert "Name: José; City: Montréal" in extract_office_document("clients.csv", latin)[0]
+    print("✅ CSV delimiter, BOM and Windows encoding handled")
+
+
+def test_title_rows_and_formatted_numbers():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Payments"
+    sheet.append(["Loan Report 2024"])
+    sheet.append([])
+    sheet.append(["Month", "Paid", "Balance"])
+    sheet.append(["January", 512.91, 24487.09])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    content, _, stats = extract_office_document("report.xlsx", buffer.getvalue())
+    # The title is kept as a line and the labels below it name the values
+    assert content == "Payments, Row 1: Loan Report 2024\nPayments, Row 4: Month: January; Paid: 512.91; Balance: 24487.09"
+    assert stats['rows'] == 1
+
+    # A first row of text-formatted amounts is data, not a header
+    data = "January,\"$1,200.50\",(500)\nFebruary,\"$1,180.00\",(480)\n".encode()
+    content, _, stats = extract_office_document("ledger.csv", data)
+    assert content.split("\n")[0] == "Row 1: Column 1: January; Column 2: $1,200.50; Column 3: (500)"
+    assert stats == {'rows': 2}
+
+    # A one-column list keeps its label as the header
+    content, _, _ = extract_office_document("amounts.csv", b"Amount\n100\n200\n300\n400\n")
+    assert content.split("\n")[-1] == "Row 5: Amount: 400"
+    print("✅ Title rows skipped when finding the header; currency and separators read as numbers")
+
+
+def test_long_blocks_and_headings():
+    text, chunks = chunk_blocks(["# Title", "word " * 600, "## Next", "short"], max_tokens=100, overlap_tokens=10)
+    assert chunks[-1].text == "## Next\nshort"
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    print("✅ Headings start chunks; only an over-budget block is cut into windows")
+
+
+if __name__ == "__main__":
+    test_docx_keeps_order_and_flattens_tables()
+    test_xlsx_rows_chunked_without_splitting()
+    test_csv_dialect_and_encoding()
+    test_title_rows_and_formatted_numbers()
+    test_long_blocks_and_headings()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test script for the text-layer-first PDF page classifier
+"""
+import fitz
+
+from pdf_extraction import classify_pages, pdf_to_images
+
+LOAN_TEXT = ("This Loan Agreement is made between the Borrower and the Lender. The principal amount "
+             "shall be repaid in monthly installments at an annual percentage rate of 6.5%.")
+
+
+def make_pdf() -> bytes:
+    doc = fitz.open()
+    # Page 0: born-digital text
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 540, 400), LOAN_TEXT)
+    # Page 1: a "scan" - one full-page image, no text layer
+    page = doc.new_page()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 260), False)
+    pix.clear_with(200)
+    page.insert_image(page.rect, pixmap=pix)
+    # Page 2: too little text to trust (a cover sheet)
+    page = doc.new_page()
+    page.insert_text((72, 72), "Statement")
+    return doc.tobytes()
+
+
+def test_classify_pages():
+    text_pages, vision_pages = classify_pages(make_pdf())
+    assert list(text_pages) == [0]
+    assert "annual percentage rate" in text_pages[0]
+    assert vision_pages == [1, 2]
+    print("✅ Digital page read from its text layer; scan and sparse page sent to OCR")
+
+
+def test_render_selected_pages():
+    images = list(pdf_to_images(make_pdf(), [1, 2]))
+    assert len(images) == 2 and all(image.startswith(b"\x89PNG") for image in images)
+    print("✅ Only the OCR pages were rasterized")
+
+
+def test_render_within_pixel_budget():
+    pages = pdf_to_images(make_pdf(), max_pixels=100_000)
+    # Pages are rendered lazily as they are consumed
+    first = fitz.Pixmap(next(pages))
+    # Within a pixel of rounding per edge
+    assert (first.width - 1) * (first.height - 1) <= 100_000 < (first.width + 1) * (first.height + 1)
+    # A large budget never scales past 2x
+    sizes = [(pix.width, pix.height) for pix in map(fitz.Pixmap, pdf_to_images(make_pdf(), max_pixels=10 ** 8))]
+    assert sizes == [(1190, 1684)] * 3
+    print("✅ Pages rendered straight at the pixel budget, capped at 2x")
+
+
+if __name__ == "__main__":
+    test_classify_pages()
+    test_render_selected_pages()
+    test_render_within_pixel_budget()
@@ -6,6 +6,11 @@ import sqlite3
 import os
 import json
 from watsonx_chat import *
+from document_store import delete_documents
+from storage import transaction
+
+# Uploads belong to a session; the test document is stored in its own and removed afterwards
+TEST_SESSION = "test-rag-system"
 
 def test_database():
     """Test if the database and functions work correctly"""
@@ -22,10 +27,12 @@ def test_database():
     test_content_type = "text"
     test_metadata = {"test": True}
     
-    store_document(test_doc_id, test_filename, test_content, test_content_type, test_metadata)
+    store_document(test_doc_id, test_filename, test_content, test_content_type, test_metadata,
+                   session_id=TEST_SESSION)
     print("✅ Document stored")
     
     # Test content retrieval
+    st.session_state.session_id = TEST_SESSION
     relevant_content = retrieve_relevant_content("What is the interest rate?")
     print(f"✅ Retrieved {len(relevant_content)} relevant content items")
     
@@ -46,6 +53,10 @@ def test_database():
     print(f"✅ Found {len(chunks)} chunks in database")
     
     conn.close()
+    
+    with transaction(DB_PATH) as cursor:
+        delete_documents(cursor, [test_doc_id])
+    print("✅ Test document removed")
 
 if __name__ == "__main__":
     test_database()
\ No newline at end of file
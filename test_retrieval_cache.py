@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-memory retrieval cache and its corpus version invalidation
+"""
+import pytest
+
+from document_store import insert_document, delete_documents
+from retrieval_cache import RetrievalCache, bump_corpus_version, bump_all_corpus_versions, make_cached_candidates
+from storage import transaction
+
+
+@pytest.fixture
+def library_db(document_db):
+    """Indexed database holding one shared reference chunk"""
+    with transaction(document_db) as cursor:
+        cursor.execute('''
+            INSERT INTO chunks (id, document_id, chunk_text, chunk_index)
+            VALUES ('ref_escrow_chunk_0', 'ref_escrow', 'Escrow accounts pay property taxes with the mortgage.', 0)
+        ''')
+    return document_db
+
+
+def test_candidates_limited_to_visible_chunks(library_db):
+    cache = RetrievalCache()
+    candidates = make_cached_candidates(cache)
+    with transaction(library_db) as cursor:
+        insert_document(cursor, "mine", "statement.txt", "Escrow shortage of $120 on my mortgage escrow account.",
+                        "text", session_id="S1")
+        insert_document(cursor, "theirs", "notice.txt", "Escrow refund notice.", "text", session_id="S2")
+        cursor.execute("SELECT rowid, document_id FROM chunks")
+        documents = dict(cursor.fetchall())
+
+        ranked = candidates(cursor, "escrow mortgage", "S1", 10)
+        assert [documents[rowid] for rowid, _ in ranked] == ["mine", "ref_escrow"]
+        assert [documents[rowid] for rowid, _ in candidates(cursor, "escrow", None, 10)] == ["ref_escrow"]
+        assert len(candidates(cursor, "escrow mortgage", "S1", 1)) == 1
+        assert candidates(cursor, "forbearance", "S1", 10) == []
+    print("✅ Cached BM25 candidates cover the shared library and the session's own uploads only")
+
+
+def test_reloads_only_changed_scopes(library_db):
+    cache = RetrievalCache()
+    with transaction(library_db) as cursor:
+        insert_document(cursor, "doc1", "statement.txt", "Principal balance $18,250.", "text", session_id="S1")
+        cache.segments(cursor, "S1")
+        cache.segments(cursor, "S2")
+        assert (cache.hits, cache.misses) == (1, 3)
+        shared, session = cache.segments(cursor, "S1")
+        assert (cache.hits, cache.misses) == (3, 3)
+
+        # A new upload in S1 reloads S1 alone
+        insert_document(cursor, "doc2", "escrow.txt", "Escrow shortage $120.", "text", session_id="S1")
+        reloaded = cache.segments(cursor, "S1")
+        assert reloaded[0] is shared and reloaded[1] is not session and len(reloaded[1].rowids) == 2
+        assert (cache.hits, cache.misses) == (4, 4)
+
+        delete_documents(cursor, ["doc2"])
+        bump_corpus_version(cursor, "S1")
+        assert len(cache.segments(cursor, "S1")[1].rowids) == 1
+
+        bump_all_corpus_versions(cursor)
+        misses = cache.misses
+        cache.segments(cursor, "S1")
+        assert cache.misses == misses + 2
+    print("✅ Segments reused until their scope's corpus version changes")
+
+
+def test_evicts_idle_and_oversized_sessions(library_db):
+    with transaction(library_db) as cursor:
+        for session_id in ["S1", "S2", "S3"]:
+            insert_document(cursor, f"doc_{session_id}", "statement.txt", f"Statement for {session_id}: rate 6.9%.",
+                            "text", session_id=session_id)
+
+        cache = RetrievalCache()
+        for session_id in ["S1", "S2", "S3"]:
+            cache.segments(cursor, session_id)
+        shared_bytes = cache._shared[1].nbytes
+        cache.max_bytes = shared_bytes + 1
+        # Over the cap: least recently used sessions go, the one in use stays
+        cache.segments(cursor, "S1")
+        assert list(cache._sessions) == ["S1"]
+
+        cache = RetrievalCache(idle_seconds=0)
+        cache.segments(cursor, "S1")
+        cache.segments(cursor, "S2")
+        assert list(cache._sessions) == ["S2"]
+    print("✅ Idle sessions and sessions beyond the memory cap evicted, never the one being served")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script for candidate fusion, the user upload boost and budgeted reranking
+"""
+import time
+
+import pytest
+
+from bm25_index import index_chunks
+from document_store import insert_document
+from retrieval_pipeline import (
+    reciprocal_rank_fusion, rerank_within_budget, retrieve, bm25_candidates, fts_candidates, RERANK_BATCH_SIZE
+)
+from storage import transaction, SOURCE_REFERENCE
+
+GUIDE = "Escrow accounts collect property taxes and insurance with each mortgage payment."
+STATEMENT = "Mortgage statement: the escrow payment on account 4471 rose to $410."
+
+
+def add_reference(cursor, document_id, text) -> int:
+    cursor.execute('''
+        INSERT INTO documents (id, filename, content, content_type, file_hash, metadata, source)
+        VALUES (?, ?, ?, 'text', ?, '{"topic": "escrow"}', ?)
+    ''', (document_id, f"{document_id}.txt", text, document_id, SOURCE_REFERENCE))
+    cursor.execute("INSERT INTO chunks (id, document_id, chunk_text, chunk_index) VALUES (?, ?, ?, 0)",
+                   (f"{document_id}_chunk_0", document_id, text))
+    index_chunks(cursor, [(f"{document_id}_chunk_0", text)])
+    return cursor.lastrowid
+
+
+def fixed(ranking):
+    """Candidate generator returning a canned ranking"""
+    return lambda cursor, query, session_id, limit: ranking[:limit]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[(1, 9.0), (2, 5.0)], [(2, 0.8), (3, 0.7)]], k=60)
+    assert fused == {1: 1 / 61, 2: 1 / 62 + 1 / 61, 3: 1 / 62}
+    # Agreement between generators beats a single first place; raw scores play no part
+    assert max(fused, key=fused.get) == 2
+    print("✅ Ranks fused by reciprocal rank, ignoring each generator's score scale")
+
+
+def test_retrieve_fuses_boosts_and_filters_sessions(document_db):
+    with transaction(document_db) as cursor:
+        guide = add_reference(cursor, "ref_escrow", GUIDE)
+        insert_document(cursor, "mine", "statement.txt", STATEMENT, "text", session_id="S1")
+        insert_document(cursor, "theirs", "statement.txt", STATEMENT, "text", session_id="S2")
+        (upload,) = cursor.execute("SELECT rowid FROM chunks WHERE document_id = 'mine'").fetchone()
+
+        # The guide ranks first in both lists, the upload second: the boost is worth one first place
+        results = retrieve(cursor, "escrow payment", "S1", 5, [fixed([(guide, 2.0), (upload, 1.0)])] * 2)
+        assert [r['document_id'] for r in results] == ["mine", "ref_escrow"]
+        assert results[0]['is_user_upload'] and not results[1]['is_user_upload']
+        assert results[1]['metadata'] == {"topic": "escrow"}
+        results = retrieve(cursor, "escrow payment", "S1", 5, [fixed([(guide, 2.0), (upload, 1.0)])] * 2,
+                           user_upload_boost=0.0)
+        assert [r['document_id'] for r in results] == ["ref_escrow", "mine"]
+
+        # The real generators never return another session's upload
+        for session_id, expected in [("S1", ["mine", "ref_escrow"]), ("S2", ["ref_escrow", "theirs"]), (None, ["ref_escrow"])]:
+            results = retrieve(cursor, "escrow payment", session_id, 5, [bm25_candidates, fts_candidates])
+            assert sorted(r['document_id'] for r in results) == expected, session_id
+        assert retrieve(cursor, "escrow", "S1", 1, [bm25_candidates, fts_candidates])[0]['document_id'] == "mine"
+    print("✅ Generators fused, user uploads boosted and other sessions' uploads kept out")
+
+
+def test_rerank_within_budget():
+    def reranker(query, texts):
+        # Slow enough that a zero budget stops after the first batch
+        time.sleep(0.01)
+        return [float(text.count(query)) for text in texts]
+
+    count = RERANK_BATCH_SIZE + 4
+    candidates = [{'text': "loan " * (i % 3), 'is_user_upload': i == 5, 'position': i} for i in range(count)]
+    reranked = rerank_within_budget(reranker, "loan", [dict(c) for c in candidates], budget_ms=0)
+    head, tail = reranked[:RERANK_BATCH_SIZE], reranked[RERANK_BATCH_SIZE:]
+    scores = [c['rerank_score'] for c in head]
+    assert scores == sorted(scores, reverse=True)
+    # The upload boost counts in the reranked order too
+    assert head[0]['position'] == 5 and head[0]['rerank_score'] == 3.0
+    # Candidates beyond the budget keep their fused order after the reranked ones
+    assert [c['position'] for c in tail] == list(range(RERANK_BATCH_SIZE, count))
+    assert all('rerank_score' not in c for c in tail)
+
+    reranked = rerank_within_budget(reranker, "loan", [dict(c) for c in candidates], budget_ms=10000)
+    assert all('rerank_score' in c for c in reranked)
+    print("✅ Reranking stops at the latency budget and keeps the fused order for the rest")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
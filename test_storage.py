@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test script for shared SQLite connections, transactions and one-time schema setup
+"""
+import sqlite3
+import threading
+
+import pytest
+
+import storage
+from storage import (
+    ensure_schema, get_connection, transaction, init_document_tables, LEGACY_SESSION, SOURCE_REFERENCE, SOURCE_UPLOAD
+)
+
+
+def test_schema_runs_once(db_path):
+    runs = []
+
+    def create_schema(cursor):
+        runs.append(1)
+        cursor.execute("CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY, body TEXT)")
+
+    assert ensure_schema(db_path, create_schema)
+    for _ in range(5):
+        assert not ensure_schema(db_path, create_schema)
+    assert len(runs) == 1
+    with get_connection(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    print("✅ Schema applied once per process in WAL mode")
+
+
+def test_nested_transactions_commit_or_roll_back_together(db_path):
+    with transaction(db_path) as cursor:
+        cursor.execute("CREATE TABLE notes (body TEXT)")
+    try:
+        with transaction(db_path) as outer:
+            outer.execute("INSERT INTO notes VALUES ('outer')")
+            with transaction(db_path) as inner:
+                inner.execute("INSERT INTO notes VALUES ('inner')")
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    with transaction(db_path) as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 0
+        cursor.execute("INSERT INTO notes VALUES ('kept')")
+    print("✅ Inner blocks join the outer transaction and roll back with it")
+
+
+def test_readers_not_blocked_by_writer(db_path):
+    with transaction(db_path) as cursor:
+        cursor.execute("CREATE TABLE notes (body TEXT)")
+        cursor.execute("INSERT INTO notes VALUES ('committed')")
+
+    writing = threading.Event()
+    release = threading.Event()
+
+    def writer():
+        with transaction(db_path) as cursor:
+            cursor.execute("INSERT INTO notes VALUES ('pending')")
+            writing.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    writing.wait(5)
+    with transaction(db_path) as cursor:
+        rows = cursor.execute("SELECT body FROM notes").fetchall()
+    release.set()
+    thread.join()
+    assert rows == [("committed",)]
+    print("✅ Reader saw the last commit while another thread held a write transaction")
+
+
+def test_connections_pooled_across_threads(db_path):
+    used = []
+
+    def rerun():
+        with transaction(db_path) as cursor:
+            used.append(cursor.connection)
+            cursor.execute("SELECT 1")
+
+    # Streamlit runs every rerun on a fresh thread; they take turns with one connection
+    for _ in range(20):
+        thread = threading.Thread(target=rerun)
+        thread.start()
+        thread.join()
+    assert len({id(conn) for conn in used}) == 1
+
+    # A burst of concurrent threads opens extra connections, which are closed once the pool is full again
+    barrier = threading.Barrier(storage.POOL_SIZE * 2)
+
+    def busy():
+        with transaction(db_path) as cursor:
+            used.append(cursor.connection)
+            barrier.wait(5)
+
+    threads = [threading.Thread(target=busy) for _ in range(storage.POOL_SIZE * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storage._pool(db_path).qsize() == storage.POOL_SIZE
+    with get_connection(db_path) as conn, get_connection(db_path) as nested:
+        assert conn is nested
+    print(f"✅ 20 sequential threads shared one connection; a burst of {storage.POOL_SIZE * 2} left {storage.POOL_SIZE} idle")
+
+
+def test_legacy_scoping_migrated(db_path):
+    with transaction(db_path) as cursor:
+        # Layout of databases created before the source column, with 'default' session defaults
+        cursor.execute('''
+            CREATE TABLE documents (id TEXT PRIMARY KEY, filename TEXT NOT NULL, content TEXT NOT NULL,
+                                    content_type TEXT NOT NULL, upload_time TIMESTAMP, file_hash TEXT UNIQUE,
+                                    metadata TEXT, session_id TEXT DEFAULT 'default')
+        ''')
+        cursor.execute('''
+            CREATE TABLE chunks (id TEXT PRIMARY KEY, document_id TEXT, chunk_text TEXT, chunk_index INTEGER,
+                                 session_id TEXT DEFAULT 'default')
+        ''')
+        cursor.execute("CREATE INDEX idx_chunks_session ON chunks(session_id)")
+        cursor.executemany("INSERT INTO documents (id, filename, content, content_type, metadata, session_id) "
+                           "VALUES (?, ?, '', 'text', ?, ?)", [
+                               ("ref_apr", "apr.txt", '{"source": "reference_library", "file_type": "loan_guide"}', "default"),
+                               ("upload", "statement.pdf", '{"pages": 1}', "s1"),
+                               ("old_upload", "contract.pdf", '{"pages": 2}', "default"),
+                               # A guide from a loader that wrote no metadata
+                               ("ref_escrow", "escrow.txt", None, "default"),
+                               # An upload from before the session column existed
+                               ("older_upload", "notes.txt", '{}', None),
+                           ])
+        cursor.executemany("INSERT INTO chunks (id, document_id, chunk_text, chunk_index) VALUES (?, ?, 'text', 0)",
+                           [("ref_apr_chunk_0", "ref_apr"), ("upload_chunk_0", "upload"),
+                            ("old_upload_chunk_0", "old_upload"), ("ref_escrow_chunk_0", "ref_escrow")])
+        init_document_tables(cursor)
+        init_document_tables(cursor)
+        documents = cursor.execute("SELECT id, source, session_id FROM documents ORDER BY id").fetchall()
+        chunks = cursor.execute("SELECT id, session_id FROM chunks ORDER BY id").fetchall()
+        plan = cursor.execute("EXPLAIN QUERY PLAN SELECT rowid FROM chunks WHERE session_id = ?", ("s1",)).fetchall()
+        # file_hash is no longer unique, so one file can be stored by two sessions
+        cursor.executemany("INSERT INTO documents (id, filename, content, content_type, file_hash, session_id) "
+                           "VALUES (?, 'a.pdf', '', 'pdf', 'same', ?)", [("copy1", "s1"), ("copy2", "s2")])
+        # An upload stored without its session fails instead of landing in a scope nobody sees
+        try:
+            cursor.execute("INSERT INTO documents (id, filename, content, content_type) VALUES ('lost', 'b.pdf', '', 'pdf')")
+            raise AssertionError("upload without a session accepted")
+        except sqlite3.IntegrityError:
+            pass
+    # Customer files stored under 'default' or no session stay private uploads; only guides are shared
+    assert documents == [("old_upload", SOURCE_UPLOAD, LEGACY_SESSION), ("older_upload", SOURCE_UPLOAD, LEGACY_SESSION),
+                         ("ref_apr", SOURCE_REFERENCE, None), ("ref_escrow", SOURCE_REFERENCE, None),
+                         ("upload", SOURCE_UPLOAD, "s1")]
+    assert chunks == [("old_upload_chunk_0", LEGACY_SESSION), ("ref_apr_chunk_0", None), ("ref_escrow_chunk_0", None),
+                      ("upload_chunk_0", "s1")]
+    assert "idx_chunks_scope" in plan[0][-1]
+    print("✅ Legacy guides moved to the shared scope and legacy uploads kept private; chunk sessions indexed; "
+          "file_hash not unique; uploads need a session")
+
+
+
+def test_failed_migration_rolls_back(db_path, monkeypatch):
+    with transaction(db_path) as cursor:
+        cursor.execute("CREATE TABLE documents (id TEXT PRIMARY KEY, filename TEXT NOT NULL, content TEXT NOT NULL, "
+                       "content_type TEXT NOT NULL, file_hash TEXT UNIQUE, metadata TEXT, session_id TEXT)")
+        cursor.execute("CREATE TABLE chunks (id TEXT PRIMARY KEY, document_id TEXT, chunk_text TEXT, chunk_index INTEGER)")
+        cursor.execute("INSERT INTO documents (id, filename, content, content_type, session_id) "
+                       "VALUES ('doc', 'a.pdf', '', 'pdf', 's1')")
+        cursor.execute("INSERT INTO chunks VALUES ('doc_chunk_0', 'doc', 'text', 0)")
+
+    rebuild_table = storage.rebuild_table
+
+    def crash_after_chunks(cursor, table, create_sql):
+        rebuild_table(cursor, table, create_sql)
+        if table == "chunks":
+            raise RuntimeError("crashed mid-migration")
+
+    monkeypatch.setattr(storage, "rebuild_table", crash_after_chunks)
+    with pytest.raises(RuntimeError):
+        with transaction(db_path, immediate=True) as cursor:
+            init_document_tables(cursor)
+    monkeypatch.undo()
+
+    with transaction(db_path) as cursor:
+        assert cursor.execute("PRAGMA user_version").fetchone()[0] == 0
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(chunks)").fetchall()]
+        assert columns == ["id", "document_id", "chunk_text", "chunk_index"]
+        assert cursor.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 1
+    with transaction(db_path, immediate=True) as cursor:
+        init_document_tables(cursor)
+        assert cursor.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+        assert cursor.execute("SELECT session_id FROM chunks").fetchall() == [("s1",)]
+    print("✅ A migration that fails midway leaves the old tables and schema version untouched")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
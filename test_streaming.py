@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming chat against the local stub Watsonx server
+"""
+import threading
+
+from stub_watsonx_server import start_stub_server, STUB_ANSWER
+from watsonx_client import iter_sse_events, stream_chat, stream_chat_with_fallback, StreamInterrupted
+
+server = start_stub_server()
+BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+CHAT_URL = f"{BASE_URL}/ml/v1/text/chat?version=2023-03-29"
+STREAM_URL = f"{BASE_URL}/ml/v1/text/chat_stream?version=2023-03-29"
+HEADERS = {"Authorization": "Bearer stub-token", "Content-Type": "application/json"}
+
+
+def make_body(prompt):
+    return {"model_id": "stub", "project_id": "stub", "messages": [{"role": "user", "content": prompt}]}
+
+
+def test_sse_parsing():
+    lines = ["id: 1", "event: message", 'data: {"a": 1}', "", ": keep-alive", "data: x", "data: y", ""]
+    events = list(iter_sse_events(lines))
+    assert events == [{"id": "1", "event": "message", "data": '{"a": 1}'}, {"data": "x\ny"}]
+    print("✅ SSE events parsed")
+
+
+def test_stream_tokens():
+    tokens = list(stream_chat(STREAM_URL, HEADERS, make_body("What is APR?")))
+    assert len(tokens) > 1
+    assert "".join(tokens) == STUB_ANSWER
+    print(f"✅ Streamed {len(tokens)} tokens")
+
+
+def test_cancel_stream():
+    cancel = threading.Event()
+    received = []
+    for token in stream_chat(STREAM_URL, HEADERS, make_body("What is APR?"), cancel):
+        received.append(token)
+        cancel.set()
+    assert len(received) == 1
+    print("✅ Stream cancelled after first token")
+
+
+def test_fallback_before_first_token():
+    answer = "".join(stream_chat_with_fallback(STREAM_URL, CHAT_URL, HEADERS, make_body("STREAM_FAIL")))
+    assert answer == STUB_ANSWER
+    print("✅ Fell back to blocking completion")
+
+
+def test_interrupted_stream():
+    received = []
+    try:
+        for token in stream_chat_with_fallback(STREAM_URL, CHAT_URL, HEADERS, make_body("STREAM_BREAK")):
+            received.append(token)
+    except StreamInterrupted:
+        pass
+    else:
+        raise AssertionError("expected StreamInterrupted")
+    assert received and "".join(received) != STUB_ANSWER
+    print(f"✅ Interrupted stream kept {len(received)} partial tokens")
+
+
+if __name__ == "__main__":
+    test_sse_parsing()
+    test_stream_tokens()
+    test_cancel_stream()
+    test_fallback_before_first_token()
+    test_interrupted_stream()
+    server.shutdown()
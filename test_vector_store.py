@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script for the memory-mapped vector store and its sync with the chunks table
+"""
+import os
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+from storage import transaction, init_document_tables
+from vector_store import VectorStore, backfill_vectors, open_vector_store
+
+DIMENSIONS = 64
+
+
+def bag_of_words(texts):
+    """Deterministic stand-in for the embedding model: hashed word counts, L2-normalised"""
+    vectors = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, zlib.crc32(word.encode()) % DIMENSIONS] += 1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def temp_store(directory):
+    db_path = os.path.join(directory, "documents.db")
+    with transaction(db_path) as cursor:
+        init_document_tables(cursor)
+    return db_path, VectorStore(str(directory), "test-model", encode=bag_of_words)
+
+
+def add_chunk(cursor, key, text):
+    cursor.execute("INSERT INTO chunks (id, document_id, chunk_text, chunk_index) VALUES (?, 'doc', ?, 0)", (key, text))
+    return cursor.lastrowid
+
+
+def test_search_remove_and_compact(tmp_path):
+    _, store = temp_store(tmp_path)
+    texts = ["mortgage escrow payment", "student loan forgiveness", "auto loan refinance", "credit card balance"]
+    store.add([1, 2, 3, 4], texts)
+    assert store.search("student loan forgiveness", top_k=1)[0][0] == 2
+    store.remove([2, 3, 4])
+    # Tombstones outnumbered the live rows, so the files were rewritten
+    assert store.indexed() == {1: store.indexed()[1]} and store._row_count() == 1
+    assert [rowid for rowid, _ in store.search("student loan forgiveness")] == [1]
+    print("✅ Search, tombstones and compaction")
+
+
+def test_reused_rowid_and_changed_text_reembedded(tmp_path):
+    db_path, store = temp_store(tmp_path)
+    with transaction(db_path) as cursor:
+        first = add_chunk(cursor, "a", "fixed rate mortgage escrow")
+        second = add_chunk(cursor, "b", "student loan forgiveness")
+        assert backfill_vectors(cursor, store) == 2
+        assert backfill_vectors(cursor, store) == 0
+
+        # Deleted rowids are never handed out again
+        cursor.execute("DELETE FROM chunks WHERE rowid = ?", (second,))
+        third = add_chunk(cursor, "c", "payday lender warning signs")
+        assert third > second
+
+        # A vector left behind for a rowid whose text changed underneath it is replaced
+        cursor.execute("UPDATE chunks SET chunk_text = 'credit union auto loan' WHERE rowid = ?", (first,))
+        assert backfill_vectors(cursor, store) == 2
+        assert set(store.indexed()) == {first, third}
+        assert store.search("fixed rate mortgage escrow", top_k=1)[0][1] < 0.5
+        assert store.search("credit union auto loan", top_k=1)[0][0] == first
+    print("✅ Changed chunk text is re-embedded and deleted rowids are never reused")
+
+
+def test_reopened_from_disk(tmp_path):
+    db_path, store = temp_store(tmp_path)
+    with transaction(db_path) as cursor:
+        add_chunk(cursor, "a", "home equity line of credit")
+        backfill_vectors(cursor, store)
+    reopened = open_vector_store(os.path.dirname(db_path))
+    assert reopened.model_name == "test-model" and reopened.indexed() == store.indexed()
+    assert open_vector_store(str(tmp_path / "empty")) is None
+    print("✅ Store reopened with the model it was built with")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
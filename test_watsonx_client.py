@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the pooled, retrying Watsonx HTTP client and IAM token manager
+"""
+import threading
+
+from requests import Response
+
+from stub_watsonx_server import start_stub_server, StubWatsonxHandler, STUB_ANSWER
+import watsonx_client
+from watsonx_client import complete_chat, get_session, retry_after_seconds, backoff_delay, IAMTokenManager
+
+server = start_stub_server()
+BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+CHAT_URL = f"{BASE_URL}/ml/v1/text/chat?version=2023-03-29"
+IAM_URL = f"{BASE_URL}/identity/token"
+HEADERS = {"Authorization": "Bearer stub-token", "Content-Type": "application/json"}
+
+
+def make_body(prompt):
+    return {"model_id": "stub", "project_id": "stub", "messages": [{"role": "user", "content": prompt}]}
+
+
+def test_retry_after_parsing():
+    resp = Response()
+    resp.headers["Retry-After"] = "3"
+    assert retry_after_seconds(resp) == 3.0
+    resp.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert retry_after_seconds(resp) == 0.0
+    del resp.headers["Retry-After"]
+    assert retry_after_seconds(resp) is None
+    print("✅ Retry-After parsed")
+
+
+def test_backoff_is_bounded():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt) <= watsonx_client.BACKOFF_CAP
+    print("✅ Backoff bounded by cap")
+
+
+def test_retries_rate_limited_calls():
+    assert complete_chat(CHAT_URL, HEADERS, make_body("RATE_LIMIT please")) == STUB_ANSWER
+    print("✅ 429 responses retried until success")
+
+
+def test_gives_up_after_max_retries():
+    resp = watsonx_client.post(CHAT_URL, headers=HEADERS, json=make_body("RATE_LIMIT again"), max_retries=1)
+    assert resp.status_code == 429
+    print("✅ Last response returned once retries are exhausted")
+
+
+def test_session_is_shared():
+    assert get_session() is get_session()
+    print("✅ One keep-alive session per process")
+
+
+def test_concurrent_token_requests_share_one_fetch():
+    manager = IAMTokenManager(IAM_URL, "stub-key")
+    before = StubWatsonxHandler.issued_tokens
+    StubWatsonxHandler.iam_delay = 0.2
+    tokens = []
+    try:
+        threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        StubWatsonxHandler.iam_delay = 0.0
+    assert len(set(tokens)) == 1 and len(tokens) == 10
+    assert StubWatsonxHandler.issued_tokens == before + 1
+    print("✅ Ten concurrent callers, one IAM request")
+
+
+def test_401_forces_refresh_and_retry():
+    manager = IAMTokenManager(IAM_URL, "stub-key")
+    stale = manager.get_token()
+    StubWatsonxHandler.revoked_tokens.add(stale)
+    headers = {"Content-Type": "application/json"}
+    assert complete_chat(CHAT_URL, headers, make_body("What is APR?"), token_manager=manager) == STUB_ANSWER
+    assert manager.get_token() != stale
+    print("✅ 401 refreshed the token and retried")
+
+
+def test_401_refresh_does_not_use_up_retries():
+    manager = IAMTokenManager(IAM_URL, "stub-key")
+    StubWatsonxHandler.revoked_tokens.add(manager.get_token())
+    resp = watsonx_client.post(CHAT_URL, json=make_body("What is APR?"), token_manager=manager, max_retries=0)
+    assert resp.status_code == 200 and resp.json()["choices"][0]["message"]["content"] == STUB_ANSWER
+    # A token rejected again after the refresh comes back as an unread, open 401 response
+    StubWatsonxHandler.revoked_tokens.add(manager.get_token())
+    manager.force_refresh = lambda token: token
+    resp = watsonx_client.post(CHAT_URL, json=make_body("What is APR?"), token_manager=manager, max_retries=0,
+                               stream=True)
+    assert resp.status_code == 401 and resp.json()["errors"][0]["message"] == "token expired"
+    print("✅ Token refresh retried outside the retry budget; a repeated 401 returned readable")
+
+
+def test_refreshes_before_expiry():
+    manager = IAMTokenManager(IAM_URL, "stub-key")
+    manager.REFRESH_MARGIN = StubWatsonxHandler.token_lifetime - 0.2
+    first = manager.get_token()
+    manager._timer.join(2)
+    assert manager.get_token() != first
+    manager._timer.cancel()
+    print("✅ Token renewed in the background ahead of expiry")
+
+
+if __name__ == "__main__":
+    test_retry_after_parsing()
+    test_backoff_is_bounded()
+    test_retries_rate_limited_calls()
+    test_gives_up_after_max_retries()
+    test_session_is_shared()
+    test_concurrent_token_requests_share_one_fetch()
+    test_401_forces_refresh_and_retry()
+    test_401_refresh_does_not_use_up_retries()
+    test_refreshes_before_expiry()
+    server.shutdown()
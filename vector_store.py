@@ -0,0 +1,228 @@
+"""
+Dense embedding retrieval backed by a memory-mapped float32 matrix
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
+# Bumped when the files change layout; stores in an older layout are rebuilt
+STORE_FORMAT = 2
+
+_model_lock = threading.Lock()
+_models = {}
+
+
+def load_embedding_model(model_name: str, cache_dir: Optional[str] = None):
+    """Load a sentence-transformers model from the local cache only"""
+    with _model_lock:
+        if model_name not in _models:
+            # Never reach out to the Hugging Face hub at runtime
+            os.environ.setdefault("HF_HUB_OFFLINE", "1")
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(
+                model_name,
+                cache_folder=cache_dir or None,
+                device="cpu",
+                local_files_only=True,
+            )
+        return _models[model_name]
+
+
+def encode_texts(texts: Sequence[str], model_name: str, cache_dir: Optional[str] = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """Encode texts in batches into L2-normalised float32 rows"""
+    model = load_embedding_model(model_name, cache_dir)
+    vectors = model.encode(
+        list(texts),
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def text_hash(text: str) -> int:
+    """64-bit fingerprint of a chunk's text, stored next to its vector"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+class VectorStore:
+    """Append-only float32 matrix on disk with parallel arrays of chunk rowids and text hashes.
+
+    The matrix is memory-mapped read-only for queries; removed chunks are
+    tombstoned with rowid -1 and dropped by compact() once they dominate.
+    The text hash lets backfill_vectors re-embed a chunk whose text changed.
+    """
+
+    def __init__(self, directory: str, model_name: str = DEFAULT_EMBEDDING_MODEL, cache_dir: Optional[str] = None,
+                 encode: Optional[Callable[[Sequence[str]], np.ndarray]] = None):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.encode = encode or (lambda texts: encode_texts(texts, self.model_name, self.cache_dir))
+        self.matrix_path = os.path.join(directory, "chunk_vectors.f32")
+        self.ids_path = os.path.join(directory, "chunk_vectors.ids")
+        self.hashes_path = os.path.join(directory, "chunk_vectors.hash")
+        self.meta_path = os.path.join(directory, "chunk_vectors.json")
+        self._lock = threading.RLock()
+        self._dim = None
+        self._matrix = None
+        self._ids = None
+        self._hashes = None
+        self._mapped_version = None
+        self._load_meta()
+
+    def _load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model_name or meta.get("format") != STORE_FORMAT:
+            # Vectors from another model are not comparable, and older stores lack text hashes; start over
+            self.clear()
+            return
+        self._dim = meta["dim"]
+
+    def _write_meta(self):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self._dim, "format": STORE_FORMAT}, f)
+
+    def _row_count(self) -> int:
+        if not self._dim or not os.path.exists(self.ids_path):
+            return 0
+        return os.path.getsize(self.ids_path) // np.dtype(np.int64).itemsize
+
+    def _mapped(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Memory-map the matrix, remapping only after the files changed (here or in another process)"""
+        rows = self._row_count()
+        version = (rows, os.stat(self.ids_path).st_mtime_ns) if rows else (0, 0)
+        if version != self._mapped_version:
+            if rows == 0:
+                self._matrix, self._ids, self._hashes = None, None, None
+            else:
+                self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+                self._ids = np.fromfile(self.ids_path, dtype=np.int64, count=rows)
+                self._hashes = np.fromfile(self.hashes_path, dtype=np.int64, count=rows)
+            self._mapped_version = version
+        return self._matrix, self._ids
+
+    def indexed(self) -> Dict[int, int]:
+        """Text hash of every live vector, by chunk rowid"""
+        with self._lock:
+            _, ids = self._mapped()
+            if ids is None:
+                return {}
+            live = ids >= 0
+            return dict(zip(ids[live].tolist(), self._hashes[live].tolist()))
+
+    def add(self, rowids: Sequence[int], texts: Sequence[str]):
+        """Embed chunk texts in batches and append them to the matrix"""
+        if not rowids:
+            return
+        vectors = self.encode(texts)
+        with self._lock:
+            if self._dim is None or not os.path.exists(self.meta_path):
+                self._dim = int(vectors.shape[1])
+                self._write_meta()
+            with open(self.matrix_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.hashes_path, "ab") as f:
+                f.write(np.asarray([text_hash(text) for text in texts], dtype=np.int64).tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(np.asarray(rowids, dtype=np.int64).tobytes())
+
+    def remove(self, rowids: Sequence[int]):
+        """Tombstone the vectors of deleted chunks"""
+        if not rowids:
+            return
+        with self._lock:
+            rows = self._row_count()
+            if rows == 0:
+                return
+            ids = np.memmap(self.ids_path, dtype=np.int64, mode="r+", shape=(rows,))
+            ids[np.isin(ids, np.asarray(rowids, dtype=np.int64))] = -1
+            ids.flush()
+            dead = int(np.count_nonzero(ids < 0))
+            del ids
+            self._mapped_version = None
+            if dead > rows // 2:
+                self.compact()
+
+    def compact(self):
+        """Rewrite the matrix without tombstoned rows"""
+        with self._lock:
+            matrix, ids = self._mapped()
+            if ids is None:
+                return
+            live = ids >= 0
+            live_matrix = np.ascontiguousarray(matrix[live])
+            live_ids = ids[live]
+            live_hashes = self._hashes[live]
+            self._matrix, self._ids, self._hashes, self._mapped_version = None, None, None, None
+            del matrix
+            live_matrix.tofile(self.matrix_path + ".tmp")
+            live_hashes.tofile(self.hashes_path + ".tmp")
+            live_ids.tofile(self.ids_path + ".tmp")
+            os.replace(self.matrix_path + ".tmp", self.matrix_path)
+            os.replace(self.hashes_path + ".tmp", self.hashes_path)
+            os.replace(self.ids_path + ".tmp", self.ids_path)
+
+    def clear(self):
+        with self._lock:
+            self._matrix, self._ids, self._hashes, self._mapped_version = None, None, None, None
+            self._dim = None
+            for path in (self.matrix_path, self.ids_path, self.hashes_path, self.meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def search(self, query: str, top_k: int = 100) -> List[Tuple[int, float]]:
+        """Cosine top-k as (chunk rowid, score) via one matrix-vector product"""
+        if self._row_count() == 0:
+            return []
+        query_vector = self.encode([query])[0]
+        with self._lock:
+            matrix, ids = self._mapped()
+            if matrix is None:
+                return []
+            scores = matrix @ query_vector
+            scores[ids < 0] = -np.inf
+
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(ids[i]), float(scores[i])) for i in top if ids[i] >= 0]
+
+
+def backfill_vectors(cursor: sqlite3.Cursor, store: VectorStore, batch_size: int = 256) -> int:
+    """Embed chunks without an up-to-date vector and drop vectors of deleted or changed chunks"""
+    indexed = store.indexed()
+    cursor.execute("SELECT rowid, chunk_text FROM chunks")
+    current = {rowid: text_hash(text or "") for rowid, text in cursor}
+
+    store.remove(sorted(rowid for rowid, digest in indexed.items() if current.get(rowid) != digest))
+
+    missing = sorted(rowid for rowid, digest in current.items() if indexed.get(rowid) != digest)
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        placeholders = ",".join("?" * len(batch))
+        cursor.execute(f"SELECT rowid, chunk_text FROM chunks WHERE rowid IN ({placeholders})", batch)
+        rows = cursor.fetchall()
+        store.add([rowid for rowid, _ in rows], [text or "" for _, text in rows])
+    return len(missing)
+
+
+def open_vector_store(directory: str, cache_dir: Optional[str] = None) -> Optional[VectorStore]:
+    """The vector store in directory, opened with the model it was built with; None if there is none"""
+    meta_path = os.path.join(directory, "chunk_vectors.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        model_name = json.load(f).get("model") or DEFAULT_EMBEDDING_MODEL
+    return VectorStore(directory, model_name, cache_dir)
@@ -1,18 +1,43 @@
 import streamlit as st
-import requests
 import os
 import json
-import hashlib
-import tempfile
 import base64
-from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime
-import concurrent.futures
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, Iterator
+import time
 from PIL import Image
-import fitz  # PyMuPDF for PDF handling
 import sqlite3
 import uuid
 from dotenv import load_dotenv, find_dotenv
+from storage import ensure_schema, transaction, init_document_tables, SOURCE_REFERENCE
+from chunking import Chunk
+from bm25_index import init_bm25_index, needs_backfill, rebuild_bm25_index
+from fts_index import init_fts_index, rebuild_fts_index
+from vector_store import VectorStore, DEFAULT_EMBEDDING_MODEL, backfill_vectors, encode_texts
+from retrieval_pipeline import retrieve, fts_candidates, bm25_candidates, make_dense_candidates, CrossEncoderReranker
+from retrieval_cache import RetrievalCache, init_corpus_versions, make_cached_candidates
+from document_store import insert_document
+from answer_cache import (
+    init_answer_cache, lookup_answer, store_answer, is_standalone_question, answer_cache_stats,
+    DEFAULT_TTL_SECONDS, DEFAULT_MAX_ENTRIES, DEFAULT_SIMILARITY
+)
+from ingestion_jobs import JobWorkerPool, list_jobs, cancel_job, QUEUED, RUNNING, DONE, FAILED, DEFAULT_WORKERS
+from document_merge import hierarchical_merge, DEFAULT_GROUP_TOKENS
+from ocr_cache import init_ocr_cache, make_ocr_key, lookup_ocr, store_ocr, ocr_cache_stats, FILE, PAGE
+from image_preprocessing import PreparedImage, prepare_image, DEFAULT_MAX_PIXELS, DEFAULT_IMAGE_FORMAT
+from pdf_extraction import classify_pages, pdf_to_images, DEFAULT_MIN_TEXT_CHARS, DEFAULT_MAX_IMAGE_COVERAGE
+from office_extraction import extract_office_document, document_kind, office_content_type, OFFICE_EXTENSIONS
+from ingestion_engine import IngestionEngine, DEFAULT_MAX_CONCURRENCY, DEFAULT_TENANT_CONCURRENCY
+from watsonx_client import stream_chat_with_fallback, stream_url_for, StreamInterrupted, IAMTokenManager, post as watsonx_post
+from loan_calculator import CALCULATOR_TOOLS, run_tool_call
+from chat_history import (
+    HistoryState, compact_history, history_tokens, load_token_counter, message_tokens,
+    DEFAULT_PROMPT_BUDGET, DEFAULT_SUMMARY_TOKENS, MESSAGE_OVERHEAD_TOKENS
+)
+from context_packing import pack_context, DEFAULT_CONTEXT_TOKENS, DEFAULT_CONTEXT_CANDIDATES
+from intent_router import GlossaryIndex, route_question, init_route_stats, record_route, route_stats, MODEL, GLOSSARY, CALCULATOR
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env when available
 dotenv_loaded = False
@@ -31,6 +56,36 @@ DEFAULT_CONFIG = {
     "WATSONX_IAM_URL": "https://iam.cloud.ibm.com/identity/token",
     "WATSONX_API_URL": "https://us-south.ml.cloud.ibm.com/ml/v1/text/chat?version=2023-03-29",
     "WATSONX_VISION_API_URL": "https://us-south.ml.cloud.ibm.com/ml/v1/text/chat?version=2023-03-29",
+    "WATSONX_STREAMING": "true",
+    "RETRIEVAL_BACKEND": "fts5",
+    "EMBEDDING_MODEL": DEFAULT_EMBEDDING_MODEL,
+    "RERANK_BUDGET_MS": "250",
+    "RETRIEVAL_CACHE_MAX_MB": "256",
+    "RETRIEVAL_CACHE_IDLE_SECONDS": "1800",
+    "ANSWER_CACHE_TTL_SECONDS": str(DEFAULT_TTL_SECONDS),
+    "ANSWER_CACHE_MAX_ENTRIES": str(DEFAULT_MAX_ENTRIES),
+    "ANSWER_CACHE_SIMILARITY": str(DEFAULT_SIMILARITY),
+    "INGEST_MAX_CONCURRENCY": str(DEFAULT_MAX_CONCURRENCY),
+    "INGEST_TENANT_CONCURRENCY": str(DEFAULT_TENANT_CONCURRENCY),
+    "INGEST_HTTP2": "true",
+    "PDF_TEXT_MIN_CHARS": str(DEFAULT_MIN_TEXT_CHARS),
+    "PDF_MAX_IMAGE_COVERAGE": str(DEFAULT_MAX_IMAGE_COVERAGE),
+    "OCR_MAX_PIXELS": str(DEFAULT_MAX_PIXELS),
+    "OCR_IMAGE_FORMAT": DEFAULT_IMAGE_FORMAT,
+    "OCR_CACHE_MAX_MB": "200",
+    "MERGE_GROUP_TOKENS": str(DEFAULT_GROUP_TOKENS),
+    "MERGE_SUMMARY_TOKENS": "2000",
+    "INGEST_JOB_WORKERS": str(DEFAULT_WORKERS),
+    "JOB_POLL_SECONDS": "2",
+    "LOAN_CALCULATOR_TOOLS": "true",
+    "MAX_TOOL_ROUNDS": "3",
+    "TOOL_RESULT_TOKEN_BUDGET": "800",
+    "INTENT_ROUTER": "true",
+    "PROMPT_TOKEN_BUDGET": str(DEFAULT_PROMPT_BUDGET),
+    "HISTORY_TOKEN_BUDGET": "2000",
+    "HISTORY_SUMMARY_TOKENS": str(DEFAULT_SUMMARY_TOKENS),
+    "CONTEXT_TOKEN_BUDGET": str(DEFAULT_CONTEXT_TOKENS),
+    "CONTEXT_CANDIDATES": str(DEFAULT_CONTEXT_CANDIDATES),
 }
 
 
@@ -68,6 +123,65 @@ VISION_MODEL_ID = resolve_config_value("WATSONX_VISION_MODEL_ID", default=DEFAUL
 IAM_URL = resolve_config_value("WATSONX_IAM_URL", default=DEFAULT_CONFIG["WATSONX_IAM_URL"])
 WATSONX_API_URL = resolve_config_value("WATSONX_API_URL", default=DEFAULT_CONFIG["WATSONX_API_URL"])
 VISION_API_URL = resolve_config_value("WATSONX_VISION_API_URL", default=DEFAULT_CONFIG["WATSONX_VISION_API_URL"])
+WATSONX_STREAM_API_URL = resolve_config_value("WATSONX_STREAM_API_URL", default=stream_url_for(WATSONX_API_URL))
+WATSONX_STREAMING = resolve_config_value("WATSONX_STREAMING", default=DEFAULT_CONFIG["WATSONX_STREAMING"]).lower() in ("1", "true", "yes")
+
+# Retrieval configuration: "fts5" (SQLite full-text search), "bm25" (inverted index tables),
+# "dense" (local sentence-transformers embeddings, loaded from the local model cache only),
+# "hybrid" (fts5 + dense fused with reciprocal-rank fusion) or "memory" (BM25 over an
+# in-process cache of the tokenized corpus)
+RETRIEVAL_BACKEND = resolve_config_value("RETRIEVAL_BACKEND", default=DEFAULT_CONFIG["RETRIEVAL_BACKEND"])
+EMBEDDING_MODEL = resolve_config_value("EMBEDDING_MODEL", default=DEFAULT_CONFIG["EMBEDDING_MODEL"])
+EMBEDDING_CACHE_DIR = resolve_config_value("EMBEDDING_CACHE_DIR")
+USE_DENSE_INDEX = RETRIEVAL_BACKEND in ("dense", "hybrid")
+# Optional cross-encoder reranking of the fused candidates; empty disables it
+RERANKER_MODEL = resolve_config_value("RERANKER_MODEL")
+RERANK_BUDGET_MS = float(resolve_config_value("RERANK_BUDGET_MS", default=DEFAULT_CONFIG["RERANK_BUDGET_MS"]))
+# Memory backend: cap for the cached corpus and idle time before a session's uploads are evicted
+RETRIEVAL_CACHE_MAX_MB = float(resolve_config_value("RETRIEVAL_CACHE_MAX_MB", default=DEFAULT_CONFIG["RETRIEVAL_CACHE_MAX_MB"]))
+RETRIEVAL_CACHE_IDLE_SECONDS = float(resolve_config_value("RETRIEVAL_CACHE_IDLE_SECONDS", default=DEFAULT_CONFIG["RETRIEVAL_CACHE_IDLE_SECONDS"]))
+
+# Answer cache: 0 entries disables it, 0 similarity disables embedding-based near hits
+ANSWER_CACHE_TTL_SECONDS = float(resolve_config_value("ANSWER_CACHE_TTL_SECONDS", default=DEFAULT_CONFIG["ANSWER_CACHE_TTL_SECONDS"]))
+ANSWER_CACHE_MAX_ENTRIES = int(resolve_config_value("ANSWER_CACHE_MAX_ENTRIES", default=DEFAULT_CONFIG["ANSWER_CACHE_MAX_ENTRIES"]))
+ANSWER_CACHE_SIMILARITY = float(resolve_config_value("ANSWER_CACHE_SIMILARITY", default=DEFAULT_CONFIG["ANSWER_CACHE_SIMILARITY"]))
+
+# Vision OCR of uploaded pages: requests in flight across all sessions, and per session
+INGEST_MAX_CONCURRENCY = int(resolve_config_value("INGEST_MAX_CONCURRENCY", default=DEFAULT_CONFIG["INGEST_MAX_CONCURRENCY"]))
+INGEST_TENANT_CONCURRENCY = int(resolve_config_value("INGEST_TENANT_CONCURRENCY", default=DEFAULT_CONFIG["INGEST_TENANT_CONCURRENCY"]))
+INGEST_HTTP2 = resolve_config_value("INGEST_HTTP2", default=DEFAULT_CONFIG["INGEST_HTTP2"]).lower() in ("1", "true", "yes")
+# PDF pages with this much text and no more than this image coverage skip the vision model
+PDF_TEXT_MIN_CHARS = int(resolve_config_value("PDF_TEXT_MIN_CHARS", default=DEFAULT_CONFIG["PDF_TEXT_MIN_CHARS"]))
+PDF_MAX_IMAGE_COVERAGE = float(resolve_config_value("PDF_MAX_IMAGE_COVERAGE", default=DEFAULT_CONFIG["PDF_MAX_IMAGE_COVERAGE"]))
+# Images sent to the vision model are downscaled to this many pixels and re-encoded as jpeg or webp
+OCR_MAX_PIXELS = int(resolve_config_value("OCR_MAX_PIXELS", default=DEFAULT_CONFIG["OCR_MAX_PIXELS"]))
+OCR_IMAGE_FORMAT = resolve_config_value("OCR_IMAGE_FORMAT", default=DEFAULT_CONFIG["OCR_IMAGE_FORMAT"])
+# OCR results cached by file and page content; 0 disables the cache
+OCR_CACHE_MAX_MB = float(resolve_config_value("OCR_CACHE_MAX_MB", default=DEFAULT_CONFIG["OCR_CACHE_MAX_MB"]))
+# Long documents are summarized in groups of about this many input tokens, then the summaries are merged
+MERGE_GROUP_TOKENS = int(resolve_config_value("MERGE_GROUP_TOKENS", default=DEFAULT_CONFIG["MERGE_GROUP_TOKENS"]))
+MERGE_SUMMARY_TOKENS = int(resolve_config_value("MERGE_SUMMARY_TOKENS", default=DEFAULT_CONFIG["MERGE_SUMMARY_TOKENS"]))
+# Uploads are processed by background workers; the sidebar polls their progress this often
+INGEST_JOB_WORKERS = int(resolve_config_value("INGEST_JOB_WORKERS", default=DEFAULT_CONFIG["INGEST_JOB_WORKERS"]))
+JOB_POLL_SECONDS = float(resolve_config_value("JOB_POLL_SECONDS", default=DEFAULT_CONFIG["JOB_POLL_SECONDS"]))
+# The chat model may call the local loan calculator (loan_calculator.py) for exact figures, up to this many times per answer
+LOAN_CALCULATOR_TOOLS = resolve_config_value("LOAN_CALCULATOR_TOOLS", default=DEFAULT_CONFIG["LOAN_CALCULATOR_TOOLS"]).lower() in ("1", "true", "yes")
+MAX_TOOL_ROUNDS = int(resolve_config_value("MAX_TOOL_ROUNDS", default=DEFAULT_CONFIG["MAX_TOOL_ROUNDS"]))
+# Prompt tokens held back for tool calls and their results; a result that does not fit is replaced by an error
+TOOL_RESULT_TOKEN_BUDGET = int(resolve_config_value("TOOL_RESULT_TOKEN_BUDGET", default=DEFAULT_CONFIG["TOOL_RESULT_TOKEN_BUDGET"]))
+# Glossary lookups and loan arithmetic fully stated in the question are answered locally, without retrieval or Watsonx
+INTENT_ROUTER = resolve_config_value("INTENT_ROUTER", default=DEFAULT_CONFIG["INTENT_ROUTER"]).lower() in ("1", "true", "yes")
+# Every chat request (history, retrieved context, question, tool definitions and tool results) fits PROMPT_TOKEN_BUDGET tokens.
+# Retrieved context leaves HISTORY_TOKEN_BUDGET for the conversation; turns that no longer fit are folded into a
+# rolling summary of at most HISTORY_SUMMARY_TOKENS. Tokens are counted with TOKENIZER_MODEL from the local
+# Hugging Face cache when set, else estimated from the character count.
+PROMPT_TOKEN_BUDGET = int(resolve_config_value("PROMPT_TOKEN_BUDGET", default=DEFAULT_CONFIG["PROMPT_TOKEN_BUDGET"]))
+HISTORY_TOKEN_BUDGET = int(resolve_config_value("HISTORY_TOKEN_BUDGET", default=DEFAULT_CONFIG["HISTORY_TOKEN_BUDGET"]))
+HISTORY_SUMMARY_TOKENS = int(resolve_config_value("HISTORY_SUMMARY_TOKENS", default=DEFAULT_CONFIG["HISTORY_SUMMARY_TOKENS"]))
+TOKENIZER_MODEL = resolve_config_value("TOKENIZER_MODEL")
+# Retrieved chunks are merged, deduplicated and cut down to their most relevant sentences within CONTEXT_TOKEN_BUDGET
+CONTEXT_TOKEN_BUDGET = int(resolve_config_value("CONTEXT_TOKEN_BUDGET", default=DEFAULT_CONFIG["CONTEXT_TOKEN_BUDGET"]))
+CONTEXT_CANDIDATES = int(resolve_config_value("CONTEXT_CANDIDATES", default=DEFAULT_CONFIG["CONTEXT_CANDIDATES"]))
 
 # Setup for Streamlit app
 st.set_page_config(page_title="Professional Loan Assistant", layout="centered")
@@ -77,6 +191,8 @@ st.markdown("*Your comprehensive loan guidance powered by AI and document analys
 # Create directories for file storage
 UPLOAD_DIR = "uploads"
 INDEX_DIR = "document_index"
+# Characters of a spreadsheet or Word upload echoed in the chat; the whole document is indexed
+UPLOAD_PREVIEW_CHARS = 3000
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(INDEX_DIR, exist_ok=True)
 
@@ -87,17 +203,22 @@ DB_PATH = os.path.join(INDEX_DIR, "documents.db")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "uploaded_files_queue" not in st.session_state:
-    st.session_state.uploaded_files_queue = []
-
 if "processed_files" not in st.session_state:
     st.session_state.processed_files = set()
 
+if "history_state" not in st.session_state:
+    st.session_state.history_state = HistoryState()
+
 if "document_index" not in st.session_state:
     st.session_state.document_index = {}
 
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    # Kept in the URL so a browser refresh reattaches to this session's uploads
+    st.session_state.session_id = st.query_params.get("session") or str(uuid.uuid4())
+    st.query_params["session"] = st.session_state.session_id
+
+if "delivered_jobs" not in st.session_state:
+    st.session_state.delivered_jobs = set()
 
 if "document_uploader_key" not in st.session_state:
     st.session_state.document_uploader_key = 0
@@ -105,40 +226,61 @@ if "document_uploader_key" not in st.session_state:
 if "document_uploader_reset" not in st.session_state:
     st.session_state.document_uploader_reset = False
 
-# Initialize database
-def init_database():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS documents (
-            id TEXT PRIMARY KEY,
-            filename TEXT NOT NULL,
-            content TEXT NOT NULL,
-            content_type TEXT NOT NULL,
-            upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            file_hash TEXT UNIQUE,
-            metadata TEXT,
-            session_id TEXT
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chunks (
-            id TEXT PRIMARY KEY,
-            document_id TEXT,
-            chunk_text TEXT,
-            chunk_index INTEGER,
-            FOREIGN KEY (document_id) REFERENCES documents (id)
-        )
-    ''')
+@st.cache_resource
+def get_vector_store() -> VectorStore:
+    """Process-wide memory-mapped vector store for dense retrieval"""
+    return VectorStore(INDEX_DIR, EMBEDDING_MODEL, EMBEDDING_CACHE_DIR or None)
+
+@st.cache_resource
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """Process-wide cross-encoder, or None when reranking is disabled"""
+    if not RERANKER_MODEL:
+        return None
+    return CrossEncoderReranker(RERANKER_MODEL, EMBEDDING_CACHE_DIR or None)
+
+@st.cache_resource
+def get_retrieval_cache() -> RetrievalCache:
+    """Process-wide tokenized corpus shared by every browser session"""
+    return RetrievalCache(int(RETRIEVAL_CACHE_MAX_MB * 1024 * 1024), RETRIEVAL_CACHE_IDLE_SECONDS)
+
+@st.cache_resource
+def get_glossary_index() -> GlossaryIndex:
+    """Process-wide index of documents/loan-glossary-terms.txt for the intent router"""
+    return GlossaryIndex.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents", "loan-glossary-terms.txt"))
+
+# Database schema and migrations, applied once per process
+def create_schema(cursor: sqlite3.Cursor):
+    init_document_tables(cursor)
 
-    cursor.execute("PRAGMA table_info(documents)")
-    columns = [row[1] for row in cursor.fetchall()]
-    if "session_id" not in columns:
-        cursor.execute("ALTER TABLE documents ADD COLUMN session_id TEXT")
+    # Build the BM25 inverted index for databases created before it existed
+    init_bm25_index(cursor)
+    if needs_backfill(cursor):
+        rebuild_bm25_index(cursor)
 
-    conn.commit()
-    conn.close()
+    # Full-text index over chunks, backfilled once when first created
+    if init_fts_index(cursor):
+        rebuild_fts_index(cursor)
+
+    # Version counters that invalidate the in-memory retrieval cache
+    init_corpus_versions(cursor)
+
+    init_answer_cache(cursor)
+
+    init_ocr_cache(cursor)
+
+    init_route_stats(cursor)
+
+def init_database():
+    if not ensure_schema(DB_PATH, create_schema):
+        return
+
+    # Embed any chunks stored while the dense backend was off
+    if USE_DENSE_INDEX:
+        try:
+            with transaction(DB_PATH) as cursor:
+                backfill_vectors(cursor, get_vector_store())
+        except Exception as e:
+            st.warning(f"Dense index unavailable: {str(e)}")
 
 init_database()
 
@@ -147,405 +289,714 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.write(message["content"])
 
-# Get IAM token function (from test.py)
-@st.cache_data(ttl=3000)
-def get_iam_token(apikey: str) -> str:
-    r = requests.post(
-        IAM_URL,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        data={"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": apikey},
+# IAM token shared by every session and worker thread, renewed before it expires
+@st.cache_resource
+def get_token_manager() -> IAMTokenManager:
+    return IAMTokenManager(IAM_URL, API_KEY)
+
+@st.cache_resource
+def get_ingestion_engine() -> IngestionEngine:
+    """Process-wide OCR engine, so the concurrency limits hold across sessions"""
+    return IngestionEngine(
+        VISION_API_URL, get_token_manager(),
+        max_concurrency=INGEST_MAX_CONCURRENCY,
+        tenant_concurrency=INGEST_TENANT_CONCURRENCY,
+        http2=INGEST_HTTP2,
     )
-    if r.status_code != 200:
-        raise Exception("IAM token error: " + r.text)
-    return r.json()["access_token"]
 
-def encode_image_to_base64(image_path: str) -> str:
-    """Convert image to base64 string for vision API"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def encode_image_to_base64(image_bytes: bytes) -> str:
+    """Convert image bytes to base64 string for vision API"""
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+def vision_request_body(image: PreparedImage) -> Dict:
+    """Chat request asking the vision model to transcribe one page"""
+    return {
+        "model_id": VISION_MODEL_ID,
+        "project_id": PROJECT_ID,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "Extract and summarize all text content from this image. If it's a document page, provide a structured summary."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{image.mime_type};base64,{encode_image_to_base64(image.data)}"
+                        }
+                    }
+                ]
+            }
+        ],
+        "temperature": 0.1,
+        "max_tokens": 1000
+    }
+
+# Bump when the vision or merge prompt changes, so older cached OCR is not reused
+OCR_PROMPT_VERSION = "2"
+
+def ocr_cache_context(*settings) -> Tuple[str, ...]:
+    """Everything besides the content bytes that shapes a vision OCR result"""
+    return (VISION_MODEL_ID, OCR_PROMPT_VERSION, str(OCR_MAX_PIXELS), OCR_IMAGE_FORMAT, *map(str, settings))
+
+def cached_ocr(cache_key: str, kind: str) -> Optional[Tuple[str, Dict]]:
+    if OCR_CACHE_MAX_MB <= 0:
+        return None
+    with transaction(DB_PATH) as cursor:
+        return lookup_ocr(cursor, cache_key, kind)
+
+def remember_ocr(entries: List[Tuple[str, str, str, Optional[Dict]]]):
+    """Cache (cache_key, kind, text, metadata) entries, skipping failed OCR"""
+    entries = [entry for entry in entries if not entry[2].startswith(("Error processing image", "Error merging results"))]
+    if OCR_CACHE_MAX_MB <= 0 or not entries:
+        return
+    with transaction(DB_PATH) as cursor:
+        for cache_key, kind, text, metadata in entries:
+            store_ocr(cursor, cache_key, kind, text, metadata, max_bytes=int(OCR_CACHE_MAX_MB * 1024 * 1024))
 
-def pdf_to_images(pdf_path: str) -> List[str]:
-    """Convert PDF pages to images"""
-    image_paths = []
-    pdf_document = fitz.open(pdf_path)
+def ocr_pdf_pages(pdf_bytes: bytes, vision_pages: List[int], session_id: str,
+                  on_progress: Optional[Callable[[int], None]] = None) -> Tuple[Dict[int, str], Dict]:
+    """OCR the given PDF pages, reusing cached results for pages rendered identically before.
+
+    One pass: each page is rendered, hashed and looked up as the engine asks
+    for it, and only misses are sent, so OCR starts with the first new page.
+    """
+    page_texts = {}
+    # (page number, cache key) of each page sent, in the order the engine returns their texts
+    sent = []
     
-    for page_num in range(len(pdf_document)):
-        page = pdf_document.load_page(page_num)
-        pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))  # 2x zoom for better quality
-        
-        image_path = os.path.join(tempfile.gettempdir(), f"page_{page_num + 1}.png")
-        pix.save(image_path)
-        image_paths.append(image_path)
+    def uncached_images() -> Iterator[bytes]:
+        for page_number, image in zip(vision_pages, pdf_to_images(pdf_bytes, vision_pages, OCR_MAX_PIXELS)):
+            cache_key = make_ocr_key(image, *ocr_cache_context())
+            hit = cached_ocr(cache_key, PAGE)
+            if hit:
+                page_texts[page_number] = hit[0]
+                continue
+            sent.append((page_number, cache_key))
+            yield image
     
-    pdf_document.close()
-    return image_paths
+    results, page_stats = process_images_parallel(
+        uncached_images(), session_id,
+        on_progress=(lambda done: on_progress(len(page_texts) + done)) if on_progress else None
+    )
+    ocr_stats = {'ocr_cached_pages': len(page_texts)}
+    page_texts.update((page_number, text) for (page_number, _), text in zip(sent, results))
+    remember_ocr([(cache_key, PAGE, text, None) for (_, cache_key), text in zip(sent, results)])
+    if results:
+        ocr_stats.update(summarize_ocr_stats(page_stats))
+    return page_texts, ocr_stats
 
-def process_single_image(image_path: str, session_id: str) -> str:
-    """Process a single image with vision model"""
+def prepare_for_vision(image_bytes: bytes) -> PreparedImage:
+    return prepare_image(image_bytes, OCR_MAX_PIXELS, OCR_IMAGE_FORMAT)
+
+def summarize_ocr_stats(page_stats: List[Dict]) -> Dict:
+    """Average request size and vision latency per page, for metadata and the upload report"""
+    pages = max(len(page_stats), 1)
+    return {
+        'ocr_request_kb_per_page': round(sum(s['request_bytes'] for s in page_stats) / pages / 1024, 1),
+        'ocr_latency_ms_per_page': round(sum(s['latency_ms'] for s in page_stats) / pages),
+    }
+
+def process_single_image(image_bytes: bytes, session_id: str) -> Tuple[str, Dict]:
+    """Process a single image with vision model; returns the text and its request stats"""
+    stats = {'request_bytes': 0, 'latency_ms': 0.0}
     try:
-        token = get_iam_token(API_KEY)
-        
         headers = {
-            "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
             "Accept": "application/json",
         }
         
-        # Encode image
-        image_b64 = encode_image_to_base64(image_path)
-        
-        # Prepare vision message
-        body = {
-            "model_id": VISION_MODEL_ID,
-            "project_id": PROJECT_ID,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Extract and summarize all text content from this image. If it's a document page, provide a structured summary."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_b64}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 1000
-        }
+        body = vision_request_body(prepare_for_vision(image_bytes))
+        stats['request_bytes'] = len(json.dumps(body))
         
-        resp = requests.post(VISION_API_URL, headers=headers, json=body)
+        started = time.perf_counter()
+        resp = watsonx_post(VISION_API_URL, headers=headers, json=body, token_manager=get_token_manager())
+        stats['latency_ms'] = (time.perf_counter() - started) * 1000
         
         if resp.status_code == 200:
-            return resp.json()["choices"][0]["message"]["content"]
+            return resp.json()["choices"][0]["message"]["content"], stats
         else:
-            return f"Error processing image: {resp.status_code} - {resp.text}"
+            return f"Error processing image: {resp.status_code} - {resp.text}", stats
             
     except Exception as e:
-        return f"Error processing image: {str(e)}"
+        return f"Error processing image: {str(e)}", stats
 
-def process_images_parallel(image_paths: List[str], session_id: str) -> List[str]:
-    """Process multiple images in parallel"""
-    results = []
+def process_images_parallel(images: Iterable[bytes], session_id: str,
+                            on_progress: Optional[Callable[[int], None]] = None) -> Tuple[List[str], List[Dict]]:
+    """OCR pages concurrently through the ingestion engine; texts and request stats come back in page order"""
+    # Pages are rendered, downscaled and encoded only as the engine has room to send them
+    bodies = (vision_request_body(prepare_for_vision(image)) for image in images)
+    job = get_ingestion_engine().submit(session_id, bodies)
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_path = {
-            executor.submit(process_single_image, path, session_id): path 
-            for path in image_paths
-        }
-        
-        for future in concurrent.futures.as_completed(future_to_path):
-            result = future.result()
-            results.append(result)
+    reported = 0
+    while not job.done():
+        time.sleep(0.5)
+        if on_progress and job.completed != reported:
+            reported = job.completed
+            on_progress(reported)
     
-    return results
+    results = job.result()
+    return results, [job.page_stats[i] for i in range(len(results))]
 
-def merge_vision_results(results: List[str], document_name: str) -> str:
-    """Use Watsonx to merge and summarize vision results"""
-    try:
-        token = get_iam_token(API_KEY)
-        
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
-        
-        combined_text = "\n\n".join([f"Page {i+1}: {result}" for i, result in enumerate(results)])
-        
-        body = {
-            "model_id": MODEL_ID,
-            "project_id": PROJECT_ID,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""Please analyze and organize the following extracted text from a document called '{document_name}'. 
+def summarize_sections(sections: List[Tuple[str, str]], document_name: str, final: bool) -> str:
+    """One merge call: the document summary when final, else a condensed summary of a run of pages"""
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+    
+    combined_text = "\n\n".join([f"{label}: {text}" for label, text in sections])
+    
+    if final:
+        instructions = """Provide a coherent, well-structured summary that combines all the content in logical sections. 
+Remove any duplicate information and organize it in a clear, readable format."""
+    else:
+        instructions = """This is one part of a longer document. Condense it into a faithful summary of this part only. 
+Keep every figure, date, name, account and loan term, and note which pages they came from."""
+    
+    body = {
+        "model_id": MODEL_ID,
+        "project_id": PROJECT_ID,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""Please analyze and organize the following extracted text from a document called '{document_name}'. 
                     
-Provide a coherent, well-structured summary that combines all the content in logical sections. 
-Remove any duplicate information and organize it in a clear, readable format.
+{instructions}
 
 Extracted content:
 {combined_text}"""
-                }
-            ],
-            "temperature": 0.3,
-            "max_tokens": 2000
-        }
-        
-        resp = requests.post(WATSONX_API_URL, headers=headers, json=body)
-        
-        if resp.status_code == 200:
-            return resp.json()["choices"][0]["message"]["content"]
-        else:
-            return combined_text  # Fallback to combined raw results
-            
-    except Exception as e:
-        return f"Error merging results: {str(e)}"
-
-def compute_content_hash(content: str) -> str:
-    """Compute hash of content for duplicate detection"""
-    return hashlib.md5(content.encode()).hexdigest()
-
-def chunk_text_content(text: str, chunk_size: int = 500, overlap: int = 50) -> List[Tuple[str, int]]:
-    """Simple text chunking with overlap"""
-    chunks = []
-    words = text.split()
+            }
+        ],
+        "temperature": 0.3,
+        "max_tokens": MERGE_SUMMARY_TOKENS
+    }
     
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk_words = words[i:i + chunk_size]
-        chunk_text = " ".join(chunk_words)
-        chunks.append((chunk_text, i // chunk_size))
+    resp = watsonx_post(WATSONX_API_URL, headers=headers, json=body, token_manager=get_token_manager())
     
-    return chunks
+    if resp.status_code != 200:
+        raise Exception(f"Error {resp.status_code}: {resp.text}")
+    return resp.json()["choices"][0]["message"]["content"]
 
-def simple_rerank(query: str, chunks: List[Tuple[str, int]], top_k: int = 3) -> List[Tuple[str, int]]:
-    """Simple keyword-based reranking"""
-    query_words = set(query.lower().split())
-    chunk_scores = []
-    
-    for chunk_text, index in chunks:
-        chunk_words = set(chunk_text.lower().split())
-        # Simple overlap scoring
-        score = len(query_words.intersection(chunk_words))
-        chunk_scores.append((chunk_text, index, score))
-    
-    # Sort by score and return top_k
-    chunk_scores.sort(key=lambda x: x[2], reverse=True)
-    return [(text, idx) for text, idx, score in chunk_scores[:top_k]]
+def summarize_history(previous: str, messages: List[Dict], max_tokens: int) -> str:
+    """Fold older chat turns into the rolling conversation summary"""
+    transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    body = {
+        "model_id": MODEL_ID,
+        "project_id": PROJECT_ID,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""Update the summary of a conversation between a user and a loan assistant with the new turns below.
+Keep every figure, loan term, document name, decision and open question the user may refer back to. Answer with the summary only.
+
+Current summary:
+{previous or "(none)"}
 
-def store_document(document_id: str, filename: str, content: str, content_type: str, metadata: Dict = None, session_id: Optional[str] = None):
-    """Store document in database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+New turns:
+{transcript}"""
+            }
+        ],
+        "temperature": 0.1,
+        "max_tokens": max_tokens
+    }
     
-    file_hash = compute_content_hash(content)
-    metadata_json = json.dumps(metadata or {})
-    session_id = session_id or st.session_state.get("session_id")
+    resp = watsonx_post(WATSONX_API_URL, headers=chat_request_headers(), json=body, token_manager=get_token_manager())
     
+    if resp.status_code != 200:
+        raise Exception(f"Error {resp.status_code}: {resp.text}")
+    return resp.json()["choices"][0]["message"]["content"]
+
+def merge_vision_results(results: List[str], document_name: str) -> str:
+    """Use Watsonx to merge and summarize page texts, map-reducing over groups of pages for long documents"""
+    sections = [(f"Page {i+1}", result) for i, result in enumerate(results)]
     try:
-        # Store document
-        cursor.execute('''
-            INSERT OR REPLACE INTO documents 
-            (id, filename, content, content_type, file_hash, metadata, session_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (document_id, filename, content, content_type, file_hash, metadata_json, session_id))
-        
-        # Chunk and store text content
-        if content_type in ['text', 'pdf', 'image']:
-            chunks = chunk_text_content(content)
-            for chunk_text, chunk_index in chunks:
-                chunk_id = f"{document_id}_chunk_{chunk_index}"
-                cursor.execute('''
-                    INSERT OR REPLACE INTO chunks
-                    (id, document_id, chunk_text, chunk_index)
-                    VALUES (?, ?, ?, ?)
-                ''', (chunk_id, document_id, chunk_text, chunk_index))
-        
-        conn.commit()
-        
-        # Update session state
-        if session_id == st.session_state.get("session_id") or not metadata or metadata.get("source") == "reference_library":
-            st.session_state.document_index[document_id] = {
-                'filename': filename,
-                'content_type': content_type,
-                'content': content,
-                'metadata': metadata,
-                'upload_time': datetime.now().isoformat(),
-                'session_id': session_id
-            }
+        return hierarchical_merge(
+            sections,
+            lambda group, final: summarize_sections(group, document_name, final),
+            group_tokens=MERGE_GROUP_TOKENS,
+            max_workers=INGEST_TENANT_CONCURRENCY,
+        )
+    except Exception:
+        # Fallback to combined raw results; the pages themselves are indexed either way
+        return "\n\n".join([f"{label}: {text}" for label, text in sections])
+
+def store_document(document_id: str, filename: str, content: str, content_type: str, metadata: Dict = None,
+                   session_id: Optional[str] = None, pages: Optional[List[str]] = None,
+                   chunks: Optional[List[Chunk]] = None):
+    """Store document in database, with the raw text of each page when given.
+
+    Extractors that already split content (table rows, say) pass their own chunks.
+    """
+    try:
+        with transaction(DB_PATH) as cursor:
+            old_rowids, new_chunks = insert_document(cursor, document_id, filename, content, content_type, metadata,
+                                                     session_id=session_id, pages=pages, chunks=chunks)
+        
+        # Embed the new chunks in one batch once they are committed
+        if USE_DENSE_INDEX:
+            try:
+                vector_store = get_vector_store()
+                vector_store.remove(old_rowids)
+                vector_store.add([rowid for rowid, _ in new_chunks], [text for _, text in new_chunks])
+            except Exception:
+                # The document stays searchable through the lexical backends
+                logger.exception("Could not embed %s", filename)
         
     except Exception as e:
-        st.error(f"Error storing document: {str(e)}")
-    finally:
-        conn.close()
+        raise Exception(f"Error storing document: {str(e)}") from e
 
 def retrieve_relevant_content(query: str, top_k: int = 3) -> List[Dict]:
-    """Retrieve and rerank relevant content from stored documents with priority for user uploads"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    """Retrieve relevant content through the staged pipeline, boosting user uploads"""
     try:
-        # Get all chunks with source priority
         current_session = st.session_state.get('session_id')
-        cursor.execute('''
-            SELECT c.chunk_text, d.filename, d.content_type, d.metadata, d.session_id,
-                   CASE
-                       WHEN d.metadata LIKE '%"source": "reference_library"%' THEN 1
-                       ELSE 0
-                   END as is_user_upload
-            FROM chunks c
-            JOIN documents d ON c.document_id = d.id
-            WHERE d.session_id IS NULL OR d.session_id = ?
-        ''', (current_session,))
-        
-        chunks = []
-        for row in cursor.fetchall():
-            chunks.append({
-                'text': row[0],
-                'filename': row[1],
-                'content_type': row[2],
-                'metadata': json.loads(row[3]) if row[3] else {},
-                'session_id': row[4],
-                'is_user_upload': row[5] == 0  # True for user uploads, False for reference documents
-            })
-        
-        conn.close()
-        
-        # Prioritize user uploads first, then reference documents
-        user_uploads = [chunk for chunk in chunks if chunk['is_user_upload']]
-        reference_docs = [chunk for chunk in chunks if not chunk['is_user_upload']]
-        
-        # Get top results from each category
-        top_user_uploads = simple_rerank(query, [(chunk['text'], 0) for chunk in user_uploads], min(top_k, len(user_uploads)))
-        remaining_slots = top_k - len(top_user_uploads)
-        top_reference = simple_rerank(query, [(chunk['text'], 0) for chunk in reference_docs], remaining_slots) if remaining_slots > 0 else []
         
-        # Combine results with user uploads first
-        all_top_chunks = top_user_uploads + top_reference
+        # Cheap candidate generators for the configured backend
+        generators = []
+        if RETRIEVAL_BACKEND == "bm25":
+            generators.append(bm25_candidates)
+        elif RETRIEVAL_BACKEND == "memory":
+            generators.append(make_cached_candidates(get_retrieval_cache()))
+        elif RETRIEVAL_BACKEND != "dense":
+            generators.append(fts_candidates)
+        if USE_DENSE_INDEX:
+            generators.append(make_dense_candidates(get_vector_store()))
         
-        # Get metadata for top chunks
-        relevant_content = []
-        for chunk_text, _ in all_top_chunks:
-            for chunk in chunks:
-                if chunk['text'] == chunk_text:
-                    relevant_content.append(chunk)
-                    break
-        
-        return relevant_content
+        with transaction(DB_PATH) as cursor:
+            return retrieve(
+                cursor, query, current_session, top_k, generators,
+                reranker=get_reranker(), rerank_budget_ms=RERANK_BUDGET_MS
+            )
         
     except Exception as e:
         st.error(f"Error retrieving content: {str(e)}")
         return []
-    finally:
-        conn.close()
 
-def process_uploaded_file(uploaded_file) -> str:
-    """Process uploaded file based on its type"""
-    file_id = str(uuid.uuid4())
-    filename = uploaded_file.name
-    
-    try:
-        if filename.lower().endswith('.pdf'):
-            # Process PDF
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                tmp_path = tmp_file.name
-            
-            # Convert PDF to images
-            image_paths = pdf_to_images(tmp_path)
-            
-            # Process images in parallel
-            st.info("Processing PDF pages with vision model...")
-            vision_results = process_images_parallel(image_paths, st.session_state.get('session_id', 'default'))
-            
-            # Merge results
-            merged_content = merge_vision_results(vision_results, filename)
-            
-            # Store document
-            store_document(file_id, filename, merged_content, 'pdf', {
-                'pages': len(image_paths),
-                'original_filename': filename
-            })
-            
-            # Clean up temporary files
-            for path in image_paths:
-                try:
-                    os.remove(path)
-                except:
-                    pass
-            os.remove(tmp_path)
-            
-            return f"✅ Successfully processed PDF: {filename}\n\nExtracted Content:\n{merged_content}"
-            
-        elif filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-            # Process single image
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                tmp_path = tmp_file.name
-            
-            st.info("Processing image with vision model...")
-            vision_result = process_single_image(tmp_path, st.session_state.get('session_id', 'default'))
-            
-            # Store document
-            store_document(file_id, filename, vision_result, 'image', {
-                'original_filename': filename,
-                'file_size': len(uploaded_file.getbuffer())
-            })
-            
-            # Clean up
-            os.remove(tmp_path)
-            
-            return f"✅ Successfully processed image: {filename}\n\nExtracted Content:\n{vision_result}"
-            
-        else:
-            # Process as text file
-            content = uploaded_file.read().decode('utf-8', errors='ignore')
-            
-            # Store document
-            store_document(file_id, filename, content, 'text', {
-                'original_filename': filename,
-                'file_size': len(content)
-            })
-            
-            return f"✅ Successfully processed text file: {filename}\n\nContent Preview:\n{content}"
-            
-    except Exception as e:
-        return f"❌ Error processing file {filename}: {str(e)}"
+def ingest_upload(filename: str, data: bytes, session_id: Optional[str],
+                  report_progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Tuple[str, str]:
+    """Extract, merge and store one upload; returns the chat message and the document id.
 
-# Function to send message to Watsonx.ai with RAG context
-def chat_with_watsonx_rag(message: str, history: list) -> str:
-    # Prepare messages for the API
-    messages = history + [{"role": "user", "content": message}]
+    Runs on a background worker, so it reports through report_progress(pages_done, pages_total)
+    instead of drawing Streamlit elements.
+    """
+    report_progress = report_progress or (lambda pages_done, pages_total: None)
+    file_id = str(uuid.uuid4())
     
-    try:
-        # Get relevant content from document index
-        relevant_content = retrieve_relevant_content(message)
-        
-        if relevant_content:
-            # Add context to the message
-            context_text = "Relevant information from uploaded documents:\n\n"
-            for i, content in enumerate(relevant_content):
-                context_text += f"Document {i+1} ({content['filename']}):\n{content['text']}\n\n"
-            
-            messages[-1]["content"] = f"{context_text}\n\nUser question: {message}\n\nPlease answer the user's question based on the provided context when relevant."
+    if filename.lower().endswith('.pdf'):
+        # The same file seen before, in any session or under any name, needs neither OCR nor merging
+        # The merged text also depends on the chat model that combines the pages
+        file_key = make_ocr_key(data, *ocr_cache_context(MODEL_ID, PDF_TEXT_MIN_CHARS, PDF_MAX_IMAGE_COVERAGE))
+        hit = cached_ocr(file_key, FILE)
+        if hit:
+            merged_content, metadata = hit
+            pages = metadata.pop('page_texts', None)
+            store_document(file_id, filename, merged_content, 'pdf', dict(metadata, original_filename=filename),
+                           session_id=session_id, pages=pages)
+            report_progress(len(pages or []), len(pages or []))
+            return (f"✅ Successfully processed PDF: {filename} (reused from an earlier upload)\n\n"
+                    f"Extracted Content:\n{merged_content}"), file_id
         
-        # Get IAM token
-        token = get_iam_token(API_KEY)
+        # Digital pages use their text layer; only scanned or image-heavy pages need the vision model
+        page_texts, vision_pages = classify_pages(data, PDF_TEXT_MIN_CHARS, PDF_MAX_IMAGE_COVERAGE)
+        page_count = len(page_texts) + len(vision_pages)
+        text_layer_pages = len(page_texts)
+        report_progress(text_layer_pages, page_count)
+        ocr_stats = {}
+        if vision_pages:
+            # Pages are rasterized lazily while earlier ones are being read
+            vision_texts, ocr_stats = ocr_pdf_pages(
+                data, vision_pages, session_id or 'default',
+                on_progress=lambda done: report_progress(text_layer_pages + done, page_count)
+            )
+            page_texts.update(vision_texts)
+        report_progress(page_count, page_count)
         
-        # Prepare request headers
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
+        # Merge results; the raw pages are stored and indexed alongside the summary
+        pages = [page_texts[i] for i in sorted(page_texts)]
+        merged_content = merge_vision_results(pages, filename)
+        
+        metadata = {
+            'pages': page_count,
+            'text_layer_pages': text_layer_pages,
+            'vision_pages': len(vision_pages),
+            'original_filename': filename,
+            **ocr_stats
         }
+        if not any(text.startswith("Error processing image") for text in page_texts.values()):
+            remember_ocr([(file_key, FILE, merged_content, dict(metadata, page_texts=pages))])
+        
+        # Store document
+        store_document(file_id, filename, merged_content, 'pdf', metadata, session_id=session_id, pages=pages)
+        
+        report = ""
+        if vision_pages:
+            report = (f"\n\nVision OCR: {len(vision_pages)} of {page_count} pages "
+                      f"({ocr_stats.get('ocr_cached_pages', 0)} from cache)")
+            if 'ocr_request_kb_per_page' in ocr_stats:
+                report += (f", {ocr_stats['ocr_request_kb_per_page']} KB and "
+                           f"{ocr_stats['ocr_latency_ms_per_page']} ms per page")
+        return f"✅ Successfully processed PDF: {filename}{report}\n\nExtracted Content:\n{merged_content}", file_id
+        
+    elif filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+        # Process single image
+        report_progress(0, 1)
+        file_key = make_ocr_key(data, *ocr_cache_context())
+        hit = cached_ocr(file_key, FILE)
+        if hit:
+            vision_result, ocr_stats = hit
+            report = " (reused from an earlier upload)"
+        else:
+            vision_result, stats = process_single_image(data, session_id or 'default')
+            ocr_stats = summarize_ocr_stats([stats])
+            report = f"\n\nVision OCR: {ocr_stats['ocr_request_kb_per_page']} KB in {ocr_stats['ocr_latency_ms_per_page']} ms"
+            remember_ocr([(file_key, FILE, vision_result, ocr_stats)])
+        report_progress(1, 1)
+        
+        # Store document
+        store_document(file_id, filename, vision_result, 'image', {
+            'original_filename': filename,
+            'file_size': len(data),
+            **ocr_stats
+        }, session_id=session_id)
+        
+        return f"✅ Successfully processed image: {filename}{report}\n\nExtracted Content:\n{vision_result}", file_id
+        
+    elif filename.lower().endswith(OFFICE_EXTENSIONS):
+        # Read natively and chunked row by row; these never go through the vision model
+        report_progress(0, 1)
+        content, chunks, stats = extract_office_document(filename, data)
+        store_document(file_id, filename, content, office_content_type(filename), {
+            'original_filename': filename,
+            'file_size': len(data),
+            **stats
+        }, session_id=session_id, chunks=chunks)
+        report_progress(1, 1)
+        
+        counts = ", ".join(f"{count} {name[:-1] if count == 1 else name}" for name, count in stats.items())
+        preview = content if len(content) <= UPLOAD_PREVIEW_CHARS else content[:UPLOAD_PREVIEW_CHARS] + "\n…"
+        return (f"✅ Successfully processed {document_kind(filename)}: {filename} ({counts or 'empty'})\n\n"
+                f"Content Preview:\n{preview}"), file_id
+        
+    else:
+        # Process as text file
+        content = data.decode('utf-8', errors='ignore')
+        
+        # Store document
+        store_document(file_id, filename, content, 'text', {
+            'original_filename': filename,
+            'file_size': len(content)
+        }, session_id=session_id)
         
-        # Prepare request body
-        body = {
-            "model_id": MODEL_ID,
-            "project_id": PROJECT_ID,
-            "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 1000
+        return f"✅ Successfully processed text file: {filename}\n\nContent Preview:\n{content}", file_id
+
+def run_ingestion_job(job: Dict, report_progress: Callable[[int, Optional[int]], None]) -> Tuple[str, str]:
+    return ingest_upload(job['filename'], job['payload'], job['session_id'], report_progress)
+
+@st.cache_resource
+def get_job_pool() -> JobWorkerPool:
+    """Process-wide upload workers; jobs interrupted by a restart are picked up again here"""
+    return JobWorkerPool(DB_PATH, run_ingestion_job, workers=INGEST_JOB_WORKERS)
+
+def process_uploaded_file(uploaded_file) -> str:
+    """Queue an upload for background processing; returns the job id"""
+    return get_job_pool().submit(st.session_state.get('session_id'), uploaded_file.name, uploaded_file.getvalue())
+
+def load_document_into_session(document_id: str):
+    """Show a stored document in the sidebar's analyzed documents"""
+    with transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            SELECT filename, content_type, content, metadata, upload_time, session_id, source FROM documents WHERE id = ?
+        ''', (document_id,))
+        row = cursor.fetchone()
+    if row:
+        st.session_state.document_index[document_id] = {
+            'filename': row[0],
+            'content_type': row[1],
+            'content': row[2],
+            'metadata': json.loads(row[3] or "{}"),
+            'upload_time': row[4],
+            'session_id': row[5],
+            'source': row[6]
         }
+
+def embed_question(question: str):
+    """Question embedding for near-hit answer lookups, or None if the model is unavailable"""
+    if ANSWER_CACHE_SIMILARITY <= 0:
+        return None
+    try:
+        return encode_texts([question], EMBEDDING_MODEL, EMBEDDING_CACHE_DIR or None)[0]
+    except Exception:
+        return None
+
+def prepare_rag_request(message: str, history: list, history_state: Optional[HistoryState] = None) -> Dict:
+    """Retrieve context, consult the answer cache and build the chat messages within PROMPT_TOKEN_BUDGET"""
+    count_tokens = load_token_counter(TOKENIZER_MODEL, EMBEDDING_CACHE_DIR or None)
+    # Tool definitions go with every request, and calls with their results are added after the question
+    tool_tokens = count_tokens(json.dumps(CALCULATOR_TOOLS)) + TOOL_RESULT_TOKEN_BUDGET if LOAN_CALCULATOR_TOOLS else 0
+    
+    # Get relevant content from document index
+    relevant_content = retrieve_relevant_content(message, top_k=CONTEXT_CANDIDATES)
+    
+    model_params = {
+        "model_id": MODEL_ID,
+        "temperature": 0.7,
+        "max_tokens": 1000
+    }
+    
+    # Serve repeated standalone questions from the answer cache, before the history is compacted for the model
+    use_cache = ANSWER_CACHE_MAX_ENTRIES > 0 and is_standalone_question(message, history)
+    question_embedding = None
+    cached_answer = None
+    if use_cache:
+        question_embedding = embed_question(message)
+        with transaction(DB_PATH) as cursor:
+            cached_answer = lookup_answer(
+                cursor, message, relevant_content, model_params, question_embedding,
+                similarity=ANSWER_CACHE_SIMILARITY, ttl_seconds=ANSWER_CACHE_TTL_SECONDS
+            )
+    
+    request = {
+        'message': message,
+        'messages': [],
+        'relevant_content': relevant_content,
+        'model_params': model_params,
+        'use_cache': use_cache,
+        'question_embedding': question_embedding,
+        'cached_answer': cached_answer,
+        'tool_budget': 0,
+        'count_tokens': count_tokens
+    }
+    if cached_answer is not None:
+        return request
+    
+    user_content = message
+    if relevant_content:
+        # Add context to the message, packed into what the history budget leaves
+        question = f"\n\nUser question: {message}\n\nPlease answer the user's question based on the provided context when relevant."
+        context_text = "Relevant information from uploaded documents:\n\n"
+        budget = min(CONTEXT_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - HISTORY_TOKEN_BUDGET - tool_tokens
+                     - count_tokens(question) - count_tokens(context_text) - MESSAGE_OVERHEAD_TOKENS)
+        # Leave about 10 tokens per "Document i (filename)" header
+        passages = pack_context(message, relevant_content, max(0, budget - 10 * len(relevant_content)), count_tokens)
+        for i, passage in enumerate(passages):
+            context_text += f"Document {i+1} ({passage['filename']}):\n{passage['text']}\n\n"
         
-        # Send request to Watsonx.ai
-        resp = requests.post(WATSONX_API_URL, headers=headers, json=body)
+        user_content = f"{context_text}{question}"
+    
+    # The conversation gets whatever the question and context leave
+    user_message = {"role": "user", "content": user_content}
+    history_budget = PROMPT_TOKEN_BUDGET - tool_tokens - message_tokens(user_message, count_tokens)
+    compacted_history = compact_history(
+        history, history_budget, history_state if history_state is not None else HistoryState(), summarize_history,
+        count_tokens, summary_tokens=HISTORY_SUMMARY_TOKENS
+    )
+    request['messages'] = compacted_history + [user_message]
+    if LOAN_CALCULATOR_TOOLS:
+        # Tool calls may use the reserve and whatever the history left unused
+        request['tool_budget'] = (PROMPT_TOKEN_BUDGET - count_tokens(json.dumps(CALCULATOR_TOOLS))
+                                  - history_tokens(request['messages'], count_tokens))
+    return request
+
+def chat_request_headers() -> Dict:
+    return {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+
+def remember_answer(request: Dict, response: str):
+    """Store a fresh model answer in the answer cache"""
+    if not request['use_cache'] or not response:
+        return
+    with transaction(DB_PATH) as cursor:
+        store_answer(
+            cursor, request['message'], request['relevant_content'], request['model_params'], response,
+            request['question_embedding'], max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS
+        )
+
+def chat_body(messages: List[Dict], model_params: Dict, allow_tool_calls: bool) -> Dict:
+    """Chat request body; the calculator tools are offered until MAX_TOOL_ROUNDS or the tool budget is used up"""
+    body = {
+        "project_id": PROJECT_ID,
+        "messages": messages,
+        **model_params
+    }
+    if LOAN_CALCULATOR_TOOLS:
+        body["tools"] = CALCULATOR_TOOLS
+        # The conversation may already hold tool results, so the last round keeps the tools but forbids calls
+        body["tool_choice_option"] = "auto" if allow_tool_calls else "none"
+    return body
+
+def append_tool_results(messages: List[Dict], tool_calls: List[Dict], budget: int, count_tokens) -> int:
+    """Run the requested calculator tools and add the call and its results to the conversation.
+
+    A result that would overrun the tool budget is replaced by an error, so the
+    model can ask for fewer scenarios. Returns the budget left.
+    """
+    messages.append({"role": "assistant", "tool_calls": tool_calls})
+    budget -= count_tokens(json.dumps(tool_calls)) + MESSAGE_OVERHEAD_TOKENS
+    for tool_call in tool_calls:
+        result = run_tool_call(tool_call)
+        if count_tokens(result) + MESSAGE_OVERHEAD_TOKENS > budget:
+            result = json.dumps({"error": "Result too large for the prompt budget; ask for fewer scenarios"})
+        budget -= count_tokens(result) + MESSAGE_OVERHEAD_TOKENS
+        messages.append({"role": "tool", "tool_call_id": tool_call.get("id"), "content": result})
+    return budget
+
+def record_route_latency(route: str, started: float):
+    with transaction(DB_PATH) as cursor:
+        record_route(cursor, route, (time.perf_counter() - started) * 1000)
+
+def local_answer(message: str, started: float) -> Optional[str]:
+    """Answer from the glossary or the calculator when the intent router can, else None"""
+    if not INTENT_ROUTER:
+        return None
+    route = route_question(message, get_glossary_index())
+    if route.kind == MODEL:
+        return None
+    record_route_latency(route.kind, started)
+    return route.answer
+
+# Function to send message to Watsonx.ai with RAG context
+def chat_with_watsonx_rag(message: str, history: list, history_state: Optional[HistoryState] = None) -> str:
+    try:
+        started = time.perf_counter()
+        answer = local_answer(message, started)
+        if answer is not None:
+            return answer
         
-        if resp.status_code != 200:
-            return f"Error {resp.status_code}: {resp.text}"
+        request = prepare_rag_request(message, history, history_state)
+        if request['cached_answer'] is not None:
+            return request['cached_answer']
+        
+        messages = list(request['messages'])
+        tool_budget = request['tool_budget']
+        for tool_round in range(MAX_TOOL_ROUNDS + 1):
+            body = chat_body(messages, request['model_params'], tool_round < MAX_TOOL_ROUNDS and tool_budget > 0)
+            
+            # Send request to Watsonx.ai
+            resp = watsonx_post(WATSONX_API_URL, headers=chat_request_headers(), json=body, token_manager=get_token_manager())
+            
+            if resp.status_code != 200:
+                return f"Error {resp.status_code}: {resp.text}"
+            
+            # Extract response, or run the calculator calls and ask again with their results
+            reply = resp.json()["choices"][0]["message"]
+            if not reply.get("tool_calls"):
+                break
+            tool_budget = append_tool_results(messages, reply["tool_calls"], tool_budget, request['count_tokens'])
         
-        # Extract response
-        response = resp.json()["choices"][0]["message"]["content"]
+        response = reply.get("content") or ""
+        record_route_latency(MODEL, started)
+        remember_answer(request, response)
         return response
         
     except Exception as e:
         return f"Error: {str(e)}"
 
+def stream_chat_with_watsonx_rag(message: str, history: list,
+                                 history_state: Optional[HistoryState] = None) -> Iterator[str]:
+    """Yield the answer token by token for st.write_stream.
+
+    Falls back to a blocking completion when the stream cannot start, and marks
+    the answer as cut short when the stream breaks midway. Abandoning the
+    generator (e.g. a Streamlit rerun) closes the HTTP stream. Calculator tool
+    calls are run between rounds, before the answer itself streams.
+    """
+    try:
+        started = time.perf_counter()
+        answer = local_answer(message, started)
+        if answer is not None:
+            yield answer
+            return
+        request = prepare_rag_request(message, history, history_state)
+    except Exception as e:
+        yield f"Error: {str(e)}"
+        return
+    
+    if request['cached_answer'] is not None:
+        yield request['cached_answer']
+        return
+    
+    messages = list(request['messages'])
+    tool_budget = request['tool_budget']
+    parts = []
+    try:
+        for tool_round in range(MAX_TOOL_ROUNDS + 1):
+            tool_calls = []
+            for delta in stream_chat_with_fallback(
+                WATSONX_STREAM_API_URL, WATSONX_API_URL, chat_request_headers(),
+                chat_body(messages, request['model_params'], tool_round < MAX_TOOL_ROUNDS and tool_budget > 0),
+                token_manager=get_token_manager(), tool_calls=tool_calls
+            ):
+                parts.append(delta)
+                yield delta
+            if not tool_calls:
+                break
+            tool_budget = append_tool_results(messages, tool_calls, tool_budget, request['count_tokens'])
+    except StreamInterrupted as e:
+        yield f"\n\n_(Response interrupted: {str(e)})_"
+        return
+    except Exception as e:
+        yield f"Error: {str(e)}"
+        return
+    
+    record_route_latency(MODEL, started)
+    remember_answer(request, "".join(parts))
+
+# Start the upload workers with the app, so jobs interrupted by a restart resume right away
+get_job_pool()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_ingestion_jobs():
+    """Progress of this session's uploads, polled without rerunning the whole app"""
+    with transaction(DB_PATH) as cursor:
+        jobs = list_jobs(cursor, st.session_state.get("session_id"))
+    
+    active = [job for job in jobs if job['status'] in (QUEUED, RUNNING)]
+    if active:
+        st.markdown("---")
+        st.subheader("📋 Documents in Queue")
+        
+        for job in reversed(active):
+            if job['status'] == RUNNING:
+                total = job['pages_total']
+                text = f"📄 **{job['filename']}**: " + (f"{job['pages_done']} of {total} pages" if total else "analyzing...")
+                st.progress(job['pages_done'] / total if total else 0.0, text=text)
+                continue
+            
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.write(f"📄 **{job['filename']}**")
+                st.caption("Waiting for a worker")
+            with col2:
+                if st.button("🗑️ Remove", key=f"remove_{job['id']}"):
+                    with transaction(DB_PATH) as cursor:
+                        cancel_job(cursor, job['id'])
+                    st.rerun(scope="fragment")
+    else:
+        st.info("No documents in queue. Upload files above to get started.")
+    
+    # Post results of finished jobs to the chat once per browser session
+    finished = [
+        job for job in reversed(jobs)
+        if job['status'] in (DONE, FAILED) and job['id'] not in st.session_state.delivered_jobs
+    ]
+    for job in finished:
+        st.session_state.delivered_jobs.add(job['id'])
+        if job['status'] == DONE:
+            st.session_state.messages.append({"role": "assistant", "content": job['result']})
+            if job['document_id']:
+                load_document_into_session(job['document_id'])
+        else:
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": f"❌ Error processing file {job['filename']}: {job['error']}"
+            })
+    if finished:
+        st.rerun()
+
 # Enhanced professional sidebar with loan expertise
 with st.sidebar:
     st.header("🏦 Professional Loan Services")
@@ -557,90 +1008,29 @@ with st.sidebar:
         st.session_state.document_uploader_key += 1
         st.session_state.document_uploader_reset = False
     new_uploaded_files = st.file_uploader(
-        "Upload loan documents (PDF, Images, Text files)",
-        type=['pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'txt', 'md'],
+        "Upload loan documents (PDF, Images, Word, Excel, CSV, Text files)",
+        type=['pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'txt', 'md', 'docx', 'xlsx', 'xlsm', 'csv'],
         accept_multiple_files=True,
         key=f"document_uploader_{st.session_state.document_uploader_key}"
     )
     
-    # Process new files and add to queue (no auto-analysis to prevent loops)
-    files_to_add = []
-    if new_uploaded_files:
-        for new_file in new_uploaded_files:
-            # Only add files that haven't been processed before
-            if (new_file.name not in st.session_state.processed_files and
-                not any(existing_file.name == new_file.name for existing_file in st.session_state.uploaded_files_queue)):
-                files_to_add.append(new_file)
-        
-        # Add new files to queue
-        if files_to_add:
-            st.session_state.uploaded_files_queue.extend(files_to_add)
-            
-            # Auto-start analysis for each new file
-            for new_file in files_to_add:
-                try:
-                    with st.spinner(f"Auto-analyzing {new_file.name}..."):
-                        result = process_uploaded_file(new_file)
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": result
-                        })
-                        
-                        # Mark file as processed and remove from queue
-                        st.session_state.processed_files.add(new_file.name)
-                        st.session_state.uploaded_files_queue = [
-                            f for f in st.session_state.uploaded_files_queue
-                            if f.name != new_file.name
-                        ]
-                        
-                        st.success(f"✅ {new_file.name} analyzed successfully!")
-                        st.session_state.document_uploader_reset = True
-                        
-                except Exception as e:
-                    st.error(f"❌ Error analyzing {new_file.name}: {str(e)}")
-                    # Mark file as processed to prevent re-analysis even if it failed
-                    st.session_state.processed_files.add(new_file.name)
-                    # Remove failed file from queue
-                    st.session_state.uploaded_files_queue = [
-                        f for f in st.session_state.uploaded_files_queue
-                        if f.name != new_file.name
-                    ]
-                    st.session_state.document_uploader_reset = True
-            if st.session_state.document_uploader_reset:
-                st.rerun()
-    
-    # Display files in queue with individual remove buttons
-    if st.session_state.uploaded_files_queue:
-        st.markdown("---")
-        st.subheader("📋 Documents in Queue")
-        
-        # Create a copy of the queue to iterate over
-        queue_copy = st.session_state.uploaded_files_queue.copy()
-        
-        for uploaded_file in queue_copy:
-            col1, col2 = st.columns([3, 1])
-            
-            with col1:
-                st.write(f"📄 **{uploaded_file.name}**")
-                st.caption(f"Size: {uploaded_file.size} bytes")
-            
-            with col2:
-                if st.button("🗑️ Remove", key=f"remove_{uploaded_file.name}"):
-                    # Remove this specific file from queue
-                    st.session_state.uploaded_files_queue = [
-                        f for f in st.session_state.uploaded_files_queue
-                        if f.name != uploaded_file.name
-                    ]
-                    st.rerun()
-            
-            st.markdown("---")
-        
-        # Clear all files button
-        if st.button("🗑️ Clear All Files", type="secondary"):
-            st.session_state.uploaded_files_queue = []
-            st.rerun()
-    else:
-        st.info("No documents in queue. Upload files above to get started.")
+    # Queue new files for the background workers; chat stays responsive while they run
+    files_to_add = [
+        new_file for new_file in (new_uploaded_files or [])
+        if new_file.name not in st.session_state.processed_files
+    ]
+    if files_to_add:
+        for new_file in files_to_add:
+            try:
+                process_uploaded_file(new_file)
+            except Exception as e:
+                st.error(f"❌ Error queueing {new_file.name}: {str(e)}")
+            # Mark file as processed to prevent queueing it again on the next rerun
+            st.session_state.processed_files.add(new_file.name)
+        st.session_state.document_uploader_reset = True
+        st.rerun()
+    
+    show_ingestion_jobs()
     
     # Display analyzed documents
     current_session = st.session_state.get("session_id")
@@ -648,7 +1038,7 @@ with st.sidebar:
         doc_id: doc_info
         for doc_id, doc_info in st.session_state.document_index.items()
         if doc_info.get('session_id') == current_session
-        or (doc_info.get('metadata') or {}).get('source') == 'reference_library'
+        or doc_info.get('source') == SOURCE_REFERENCE
     }
 
     if visible_docs:
@@ -671,6 +1061,7 @@ with st.sidebar:
     with col1:
         if st.button("Clear Chat History", use_container_width=True):
             st.session_state.messages = []
+            st.session_state.history_state = HistoryState()
             st.rerun()
     
     with col2:
@@ -684,9 +1075,26 @@ with st.sidebar:
     st.markdown(f"- **Vision:** {VISION_MODEL_ID.split('/')[-1]}")
     st.markdown(f"- **Project:** {PROJECT_ID[:8]}...")
     st.markdown(f"- **Reference Docs:** 14 loan guides loaded")
-    st.markdown(f"- **Queue Files:** {len(st.session_state.uploaded_files_queue)}")
     st.markdown(f"- **Processed Files:** {len(st.session_state.processed_files)}")
     
+    with transaction(DB_PATH) as cursor:
+        cache_stats = answer_cache_stats(cursor)
+        ocr_stats = ocr_cache_stats(cursor)
+        routing = route_stats(cursor)
+    st.markdown(
+        f"- **Answer Cache:** {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['hits']} exact, {cache_stats['near_hits']} similar, {cache_stats['misses']} misses)"
+    )
+    st.markdown(
+        f"- **OCR Cache:** {ocr_stats['page_hit_rate']:.0%} page hit rate, {ocr_stats['file_hits']} repeat uploads, "
+        f"{ocr_stats['bytes'] / (1024 * 1024):.1f} MB"
+    )
+    saved_ms = routing[GLOSSARY]['saved_ms'] + routing[CALCULATOR]['saved_ms']
+    st.markdown(
+        f"- **Routing:** {routing[GLOSSARY]['requests']} glossary, {routing[CALCULATOR]['requests']} calculator, "
+        f"{routing[MODEL]['requests']} model answers; {saved_ms / 1000:.1f}s saved"
+    )
+    
     if st.session_state.messages:
         st.markdown(f"- **Session Messages:** {len(st.session_state.messages)}")
         st.markdown(f"- **Analyzed Docs:** {len(st.session_state.document_index)}")
@@ -724,8 +1132,14 @@ Your responses should be:
 
 Always cite specific information from the documents when answering questions."""
             
-            response = chat_with_watsonx_rag(prompt, st.session_state.messages[:-1])
-            st.write(response)
+            if not WATSONX_STREAMING:
+                response = chat_with_watsonx_rag(prompt, st.session_state.messages[:-1], st.session_state.history_state)
+                st.write(response)
+        
+        # Render tokens in the bubble as they arrive
+        if WATSONX_STREAMING:
+            response = st.write_stream(stream_chat_with_watsonx_rag(prompt, st.session_state.messages[:-1],
+                                                                   st.session_state.history_state))
     
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
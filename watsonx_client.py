@@ -0,0 +1,317 @@
+"""
+Shared HTTP client for IAM and Watsonx calls: pooled keep-alive session,
+timeouts, retries with backoff, IAM token management, and server-sent-event streaming
+"""
+import email.utils
+import json
+import random
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) seconds; vision OCR of a dense page can take a while to come back
+DEFAULT_TIMEOUT = (5, 120)
+# Seconds to wait for the connection and between streamed chunks
+STREAM_TIMEOUT = (5, 60)
+
+POOL_SIZE = 16
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_session_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session, so calls reuse TLS connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def retry_after_seconds(resp: requests.Response) -> Optional[float]:
+    """Parse Retry-After as delta-seconds or an HTTP date"""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class IAMTokenManager:
+    """Thread-safe IAM bearer token cache that refreshes ahead of expiry.
+
+    The token's real lifetime comes from the IAM response. A background timer
+    renews it REFRESH_MARGIN before it lapses, concurrent callers that find it
+    missing or expired share one in-flight fetch, and force_refresh() lets a
+    401 replace a token the server no longer accepts.
+    """
+
+    REFRESH_MARGIN = 300
+    RETRY_INTERVAL = 30
+
+    def __init__(self, iam_url: str, api_key: str):
+        self.iam_url = iam_url
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._refreshing = False
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._error: Optional[Exception] = None
+        self._timer: Optional[threading.Timer] = None
+
+    def _fetch(self):
+        resp = post(
+            self.iam_url,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data={"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": self.api_key},
+        )
+        if resp.status_code != 200:
+            raise Exception("IAM token error: " + resp.text)
+        payload = resp.json()
+        now = time.time()
+        expires_at = payload.get("expiration") or now + payload.get("expires_in", 3600)
+        return payload["access_token"], float(expires_at)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0.0, delay), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self):
+        """Fetch a new token, or wait for the fetch another thread already started"""
+        with self._lock:
+            if self._refreshing:
+                while self._refreshing:
+                    self._refreshed.wait()
+                if self._token is None and self._error is not None:
+                    raise self._error
+                return
+            self._refreshing = True
+
+        token, expires_at, error = None, 0.0, None
+        try:
+            token, expires_at = self._fetch()
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            self._refreshing = False
+            self._error = error
+            if error is None:
+                self._token, self._expires_at = token, expires_at
+                self._schedule(expires_at - self.REFRESH_MARGIN - time.time())
+            elif self._expires_at > time.time():
+                self._schedule(self.RETRY_INTERVAL)
+            self._refreshed.notify_all()
+        if error is not None:
+            raise error
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception:
+            pass  # rescheduled while the current token is still valid; callers refresh on demand otherwise
+
+    def get_token(self) -> str:
+        with self._lock:
+            if self._token and time.time() < self._expires_at - 30:
+                return self._token
+        self._refresh()
+        with self._lock:
+            return self._token
+
+    def force_refresh(self, rejected_token: Optional[str] = None) -> str:
+        """Replace a token the server rejected; concurrent 401s trigger a single fetch"""
+        with self._lock:
+            if rejected_token is None or self._token == rejected_token:
+                self._token = None
+                self._expires_at = 0.0
+        return self.get_token()
+
+
+def post(url: str, *, timeout=DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES,
+         token_manager: Optional[IAMTokenManager] = None, **kwargs) -> requests.Response:
+    """POST through the shared session, retrying 429/5xx and connection failures.
+
+    Retry-After is honoured when the server sends it (capped at BACKOFF_CAP).
+    With a token_manager the bearer token is filled in, and a 401 forces one
+    token refresh and a retry that does not count against max_retries. The
+    last response is returned as-is once retries are exhausted, so callers
+    keep their own status-code handling.
+    """
+    session = get_session()
+    token = None
+    refreshed_after_401 = False
+    attempt = 0
+    while True:
+        if token_manager is not None:
+            token = token_manager.get_token()
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, Authorization=f"Bearer {token}")
+        try:
+            resp = session.post(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+
+        if resp.status_code == 401 and token_manager is not None and not refreshed_after_401:
+            refreshed_after_401 = True
+            resp.close()
+            token_manager.force_refresh(token)
+            continue
+
+        if resp.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return resp
+
+        delay = retry_after_seconds(resp)
+        delay = min(delay, BACKOFF_CAP) if delay is not None else backoff_delay(attempt)
+        resp.close()
+        time.sleep(delay)
+        attempt += 1
+
+
+class StreamInterrupted(Exception):
+    """The stream broke after some tokens were already delivered"""
+
+
+def stream_url_for(chat_url: str) -> str:
+    """Derive the chat_stream endpoint from the text/chat endpoint"""
+    return chat_url.replace("/text/chat?", "/text/chat_stream?", 1)
+
+
+def iter_sse_events(lines: Iterable[str]) -> Iterator[Dict]:
+    """Group raw SSE lines into {"event", "data"} dicts, one per blank-line-terminated event"""
+    event = {}
+    data_lines = []
+    for line in lines:
+        if line is None:
+            continue
+        if not line:
+            if data_lines:
+                event["data"] = "\n".join(data_lines)
+                yield event
+            event = {}
+            data_lines = []
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "data":
+            data_lines.append(value)
+        elif field in ("event", "id"):
+            event[field] = value
+    if data_lines:
+        event["data"] = "\n".join(data_lines)
+        yield event
+
+
+def complete_chat(url: str, headers: Dict, body: Dict, token_manager: Optional[IAMTokenManager] = None,
+                  tool_calls: Optional[List[Dict]] = None) -> str:
+    """Non-streaming chat completion; tool calls the model requested are appended to tool_calls"""
+    resp = post(url, headers=headers, json=body, token_manager=token_manager)
+    if resp.status_code != 200:
+        raise Exception(f"Error {resp.status_code}: {resp.text}")
+    message = resp.json()["choices"][0]["message"]
+    if tool_calls is not None:
+        tool_calls.extend(message.get("tool_calls") or [])
+    return message.get("content") or ""
+
+
+def merge_tool_call_deltas(pending: Dict[int, Dict], deltas: List[Dict]):
+    """Accumulate streamed tool-call fragments by index; arguments arrive as pieces of a JSON string"""
+    for delta in deltas:
+        call = pending.setdefault(delta.get("index", len(pending)),
+                                  {"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+        call["id"] = delta.get("id") or call["id"]
+        function = delta.get("function") or {}
+        call["function"]["name"] += function.get("name") or ""
+        call["function"]["arguments"] += function.get("arguments") or ""
+
+
+def stream_chat(url: str, headers: Dict, body: Dict, cancel_event: Optional[threading.Event] = None,
+                token_manager: Optional[IAMTokenManager] = None,
+                tool_calls: Optional[List[Dict]] = None) -> Iterator[str]:
+    """Yield content deltas from the chat_stream endpoint as they arrive.
+
+    Tool calls streamed by the model are appended to tool_calls once complete.
+    Closing the generator (or setting cancel_event) closes the HTTP response,
+    so an abandoned stream stops generation instead of draining in the background.
+    """
+    stream_headers = dict(headers, Accept="text/event-stream")
+    # One retry only: stream_chat_with_fallback has a blocking fallback of its own
+    resp = post(url, headers=stream_headers, json=body, stream=True, timeout=STREAM_TIMEOUT, max_retries=1,
+                token_manager=token_manager)
+    pending_calls: Dict[int, Dict] = {}
+    try:
+        if resp.status_code != 200:
+            raise Exception(f"Error {resp.status_code}: {resp.text}")
+        resp.encoding = "utf-8"
+        for event in iter_sse_events(resp.iter_lines(decode_unicode=True)):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if event.get("event") == "error":
+                raise Exception(f"Stream error: {event['data']}")
+            if event["data"].strip() == "[DONE]":
+                break
+            payload = json.loads(event["data"])
+            for choice in payload.get("choices", []):
+                delta = choice.get("delta") or {}
+                merge_tool_call_deltas(pending_calls, delta.get("tool_calls") or [])
+                if delta.get("content"):
+                    yield delta["content"]
+        if tool_calls is not None:
+            tool_calls.extend(pending_calls[index] for index in sorted(pending_calls))
+    finally:
+        resp.close()
+
+
+def stream_chat_with_fallback(stream_url: str, chat_url: str, headers: Dict, body: Dict,
+                              cancel_event: Optional[threading.Event] = None,
+                              token_manager: Optional[IAMTokenManager] = None,
+                              tool_calls: Optional[List[Dict]] = None) -> Iterator[str]:
+    """Stream a completion, falling back to a blocking call if streaming fails up front.
+
+    A failure after tokens were delivered cannot be resumed, so it is surfaced
+    as StreamInterrupted for the caller to annotate the partial answer.
+    """
+    delivered = False
+    try:
+        for delta in stream_chat(stream_url, headers, body, cancel_event, token_manager, tool_calls):
+            delivered = True
+            yield delta
+    except Exception as e:
+        if delivered:
+            raise StreamInterrupted(str(e)) from e
+        content = complete_chat(chat_url, headers, body, token_manager, tool_calls)
+        if content:
+            yield content